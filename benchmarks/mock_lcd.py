@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+A local stand-in for the LCD (and the Tendermint endpoints it wraps), for benchmarks and offline testing.
+
+Responses come from a fixtures file. Broadcasts, transaction searches, simulations and the latest block
+are handled here, so transactions can be created, broadcast and found without touching the real chain.
+Latency, errors and pagination can all be configured so the scripts can be measured under realistic conditions.
+
+Run it from the repository root, then point the scripts at it:
+
+    python3 -m benchmarks.mock_lcd --port 1317 --latency 0.05
+    LCD_URL_OVERRIDE=http://127.0.0.1:1317 python3 balances.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from datetime import datetime, timezone
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_FILE_NAME:str = os.path.dirname(os.path.abspath(__file__)) + '/fixtures/lcd.json'
+
+# Built-in defaults, these can be changed on the command line
+MOCK_BLOCK_TIME:float = 6.0       # How often (in seconds) a new block is made. Broadcasts are found in the next block.
+MOCK_GAS_USED:int     = 100000    # The gas used by every simulated and broadcast transaction
+MOCK_PAGE_SIZE:int    = 100       # The page size for paginated lists, if the request doesn't provide one
+MOCK_START_HEIGHT:int = 15000000  # The block height when the server starts
+
+# The module that findTransaction() looks for, based on the message type
+MESSAGE_MODULES:dict = {
+    '/cosmos.bank.v1beta1.MsgSend':                            'bank',
+    '/cosmos.distribution.v1beta1.MsgWithdrawDelegatorReward': 'distribution',
+    '/cosmos.gov.v1beta1.MsgVote':                             'governance',
+    '/cosmos.staking.v1beta1.MsgBeginRedelegate':              'staking',
+    '/cosmos.staking.v1beta1.MsgDelegate':                     'staking',
+    '/cosmos.staking.v1beta1.MsgUndelegate':                   'staking',
+    '/cosmwasm.wasm.v1.MsgExecuteContract':                    'wasm',
+    '/ibc.applications.transfer.v1.MsgTransfer':               'transfer',
+    '/osmosis.gamm.v1beta1.MsgSwapExactAmountIn':              'gamm',
+    '/terra.market.v1beta1.MsgSwap':                           'market'
+}
+
+def load_fixtures(file_name:str) -> list:
+    """
+    Load the recorded responses and turn each path into a regular expression.
+    Parts of the path in braces, like {address}, match anything up to the next slash.
+
+    @params:
+        - file_name: the JSON fixtures file
+
+    @return: a list of routes, in the order they should be checked
+    """
+
+    with open(file_name, 'r') as fixtures_file:
+        fixtures:dict = json.load(fixtures_file)
+
+    routes:list = []
+    for route in fixtures['routes']:
+        pattern:str = re.sub(r'\\\{[a-z_]+\\\}', '[^/]+', re.escape(route['path']))
+        routes.append({
+            'method':   route.get('method', 'GET'),
+            'path':     route['path'],
+            'pattern':  re.compile('^' + pattern + '$'),
+            'paginate': route.get('paginate', None),
+            'response': route['response']
+        })
+
+    return routes
+
+class MockLCD():
+    """
+    The state of the stand-in server: the fixtures, the behaviour settings, and every transaction that has been broadcast.
+    """
+
+    def __init__(self):
+        self.block_time:float = MOCK_BLOCK_TIME
+        self.broadcasts:dict  = {}
+        self.chain_id:str     = 'columbus-5'
+        self.error_rate:float = 0
+        self.gas_used:int     = MOCK_GAS_USED
+        self.jitter:float     = 0
+        self.latency:float    = 0
+        self.lock             = threading.Lock()
+        self.page_size:int    = MOCK_PAGE_SIZE
+        self.record_url:str   = None
+        self.recorded:list    = []
+        self.routes:list      = []
+        self.start_time:float = None
+        self.stats:dict       = {}
+
+    def create(self, fixtures_file:str = FIXTURES_FILE_NAME) -> MockLCD:
+        """
+        Load the fixtures and start the block clock.
+
+        @params:
+            - fixtures_file: the JSON file with the recorded responses
+
+        @return: self
+        """
+
+        if os.path.exists(fixtures_file):
+            self.routes = load_fixtures(fixtures_file)
+
+        self.start_time = time.time()
+
+        return self
+
+    def blockHeight(self) -> int:
+        """
+        Get the current block height. It goes up by one every block_time seconds.
+
+        @params:
+            - None
+
+        @return: the current block height
+        """
+
+        if self.block_time <= 0:
+            return MOCK_START_HEIGHT + len(self.broadcasts)
+
+        return MOCK_START_HEIGHT + int((time.time() - self.start_time) / self.block_time)
+
+    def blockInfo(self) -> dict:
+        """
+        The response for the latest block.
+
+        @params:
+            - None
+
+        @return: a block response with the current height
+        """
+
+        return {
+            'block_id': {'hash': '', 'part_set_header': {'total': 1, 'hash': ''}},
+            'block': {
+                'header': {
+                    'chain_id': self.chain_id,
+                    'height':   str(self.blockHeight()),
+                    'time':     datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                },
+                'data': {'txs': []},
+                'evidence': {'evidence': []},
+                'last_commit': None
+            }
+        }
+
+    def broadcast(self, body:dict) -> dict:
+        """
+        Accept a signed transaction. It will be found by a search once the next block has been made.
+
+        @params:
+            - body: the broadcast request, with the base64-encoded transaction bytes
+
+        @return: a broadcast response with the transaction hash
+        """
+
+        tx_bytes:bytes = base64.b64decode(body.get('tx_bytes', ''))
+        txhash:str     = sha256(tx_bytes).hexdigest().upper()
+
+        with self.lock:
+            self.broadcasts[txhash] = {'height': self.blockHeight() + 1, 'tx': self.decodeTx(tx_bytes), 'timestamp': time.time()}
+
+        return {'tx_response': {'height': '0', 'txhash': txhash, 'codespace': '', 'code': 0, 'data': '', 'raw_log': '[]', 'logs': [], 'info': '', 'gas_wanted': '0', 'gas_used': '0', 'tx': None, 'timestamp': '', 'events': []}}
+
+    def decodeTx(self, tx_bytes:bytes) -> dict:
+        """
+        Convert the transaction bytes back into JSON, so it can be returned by a search.
+        This needs the terra_classic_sdk library, which will be installed anywhere the scripts can run.
+
+        @params:
+            - tx_bytes: the raw transaction
+
+        @return: the transaction as a dictionary, or None if it couldn't be decoded
+        """
+
+        try:
+            from terra_classic_sdk.core.tx import Tx
+            return Tx.from_bytes(tx_bytes).to_data()
+        except Exception:
+            return None
+
+    def findTx(self, query:dict) -> dict:
+        """
+        Search for a broadcast transaction by its hash.
+        Only the hash is used - the other search events are ignored.
+
+        @params:
+            - query: the parsed query string from the search request
+
+        @return: a search response, with no transactions if it isn't in a block yet
+        """
+
+        txhash:str = None
+        for event in query.get('events', []):
+            if event.startswith('tx.hash='):
+                txhash = event[len('tx.hash='):].strip("'\"")
+
+        result:dict = {'txs': [], 'tx_responses': [], 'pagination': {'next_key': None, 'total': '0'}}
+
+        with self.lock:
+            broadcast:dict = self.broadcasts.get(txhash, None)
+
+        if broadcast is None or broadcast['tx'] is None or broadcast['height'] > self.blockHeight():
+            return result
+
+        messages:list = broadcast['tx']['body']['messages']
+        module:str    = MESSAGE_MODULES.get(messages[0]['@type'], 'bank') if len(messages) > 0 else 'bank'
+        events:list   = [
+            {'type': 'message', 'attributes': [{'key': 'action', 'value': messages[0]['@type'] if len(messages) > 0 else ''}, {'key': 'module', 'value': module}]},
+            {'type': 'coin_spent', 'attributes': [{'key': 'amount', 'value': '1uluna'}]},
+            {'type': 'coin_received', 'attributes': [{'key': 'amount', 'value': '1uluna'}]}
+        ]
+
+        result['txs'].append(broadcast['tx'])
+        result['tx_responses'].append({
+            'height':     str(broadcast['height']),
+            'txhash':     txhash,
+            'codespace':  '',
+            'code':       0,
+            'data':       '',
+            'raw_log':    json.dumps([{'msg_index': 0, 'log': '', 'events': events}]),
+            'logs':       [{'msg_index': 0, 'log': '', 'events': events}],
+            'info':       '',
+            'gas_wanted': str(broadcast['tx']['auth_info']['fee']['gas_limit']),
+            'gas_used':   str(self.gas_used),
+            'tx':         dict(broadcast['tx'], **{'@type': '/cosmos.tx.v1beta1.Tx'}),
+            'timestamp':  datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'events':     events
+        })
+        result['pagination']['total'] = '1'
+
+        return result
+
+    def paginate(self, response:dict, list_key:str, query:dict) -> dict:
+        """
+        Return one page of a list response, using the pagination.key and pagination.limit values from the request.
+        The next_key is the base64-encoded offset of the next page.
+
+        @params:
+            - response: the full response from the fixtures
+            - list_key: the name of the list in the response, ie: balances
+            - query: the parsed query string from the request
+
+        @return: a copy of the response with just this page in it
+        """
+
+        items:list = response.get(list_key, [])
+        offset:int = 0
+        limit:int  = self.page_size
+
+        if 'pagination.key' in query and query['pagination.key'][0] != '':
+            offset = int(base64.b64decode(query['pagination.key'][0]).decode('utf-8'))
+        if 'pagination.limit' in query:
+            limit = int(query['pagination.limit'][0])
+
+        next_key:str = None
+        if offset + limit < len(items):
+            next_key = base64.b64encode(str(offset + limit).encode('utf-8')).decode('utf-8')
+
+        page:dict          = dict(response)
+        page[list_key]     = items[offset:offset + limit]
+        page['pagination'] = {'next_key': next_key, 'total': str(len(items))}
+
+        return page
+
+    def record(self, method:str, path:str, query:str) -> dict:
+        """
+        Pass this request on to a real LCD, and keep the response so it can be saved as a fixture.
+
+        @params:
+            - method: GET or POST
+            - path: the request path
+            - query: the raw query string
+
+        @return: the response from the real LCD, or None if it failed
+        """
+
+        import requests
+
+        url:str = self.record_url.rstrip('/') + path
+        if query != '':
+            url += '?' + query
+
+        try:
+            response:dict = requests.get(url, timeout = 30).json()
+        except Exception:
+            return None
+
+        with self.lock:
+            self.recorded.append({'method': method, 'path': path, 'response': response})
+
+        return response
+
+    def respond(self, method:str, path:str, query:str, body:dict) -> list[int, dict]:
+        """
+        Work out the response for this request.
+
+        @params:
+            - method: GET or POST
+            - path: the request path, without the query string
+            - query: the raw query string
+            - body: the JSON body for POST requests
+
+        @return: the HTTP status code and the JSON response
+        """
+
+        # These are for the benchmark runner, and are never counted, delayed or failed
+        if path == '/mock/stats':
+            return 200, {'stats': dict(self.stats), 'broadcasts': len(self.broadcasts), 'height': self.blockHeight()}
+        if path == '/mock/reset':
+            with self.lock:
+                self.stats      = {}
+                self.broadcasts = {}
+            return 200, {}
+
+        with self.lock:
+            self.stats[f'{method} {path}'] = self.stats.get(f'{method} {path}', 0) + 1
+
+        if self.latency > 0 or self.jitter > 0:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            return 503, {'code': 14, 'message': 'mock LCD: service unavailable', 'details': []}
+
+        parsed_query:dict = parse_qs(query, keep_blank_values = True)
+
+        if method == 'POST' and path == '/cosmos/tx/v1beta1/txs':
+            return 200, self.broadcast(body)
+        if method == 'POST' and path == '/cosmos/tx/v1beta1/simulate':
+            return 200, {'gas_info': {'gas_wanted': '0', 'gas_used': str(self.gas_used)}, 'result': {'data': '', 'log': '', 'events': []}}
+        if method == 'GET' and path == '/cosmos/tx/v1beta1/txs':
+            return 200, self.findTx(parsed_query)
+        if method == 'GET' and path in ['/cosmos/base/tendermint/v1beta1/blocks/latest', '/blocks/latest']:
+            return 200, self.blockInfo()
+
+        for route in self.routes:
+            if route['method'] == method and route['pattern'].match(path):
+                if route['paginate'] is not None:
+                    return 200, self.paginate(route['response'], route['paginate'], parsed_query)
+                return 200, route['response']
+
+        if self.record_url is not None:
+            response:dict = self.record(method, path, query)
+            if response is not None:
+                return 200, response
+
+        return 501, {'code': 12, 'message': f'mock LCD: no fixture for {method} {path}', 'details': []}
+
+    def saveRecording(self, file_name:str) -> int:
+        """
+        Add the recorded responses to a fixtures file. Existing routes are kept.
+
+        @params:
+            - file_name: the JSON fixtures file
+
+        @return: the number of routes that were added
+        """
+
+        fixtures:dict = {'routes': []}
+        if os.path.exists(file_name):
+            with open(file_name, 'r') as fixtures_file:
+                fixtures = json.load(fixtures_file)
+
+        known_paths:list = [route['path'] for route in fixtures['routes']]
+        added:int        = 0
+        for route in self.recorded:
+            if route['path'] not in known_paths:
+                fixtures['routes'].append(route)
+                known_paths.append(route['path'])
+                added += 1
+
+        with open(file_name, 'w') as fixtures_file:
+            json.dump(fixtures, fixtures_file, indent = 2)
+
+        return added
+
+class MockLCDHandler(BaseHTTPRequestHandler):
+    """
+    Pass each HTTP request to the MockLCD object on the server.
+    """
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method:str):
+        url        = urlparse(self.path)
+        body:dict  = {}
+        length:int = int(self.headers.get('Content-Length', 0))
+
+        if length > 0:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                body = {}
+
+        status, response = self.server.mock.respond(method, url.path, url.query, body)
+        content:bytes    = json.dumps(response).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet, the stats are available at /mock/stats
+        pass
+
+def start_server(mock:MockLCD, host:str = '127.0.0.1', port:int = 1317) -> ThreadingHTTPServer:
+    """
+    Start the stand-in server in a background thread.
+    This is what the benchmarks use - run this file directly to start it in the foreground.
+
+    @params:
+        - mock: a created MockLCD object
+        - host: the address to listen on
+        - port: the port to listen on. Use 0 to pick a free one.
+
+    @return: the running server. server.server_address has the actual port, and server.shutdown() stops it.
+    """
+
+    server                = ThreadingHTTPServer((host, port), MockLCDHandler)
+    server.daemon_threads = True
+    server.mock           = mock
+
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    return server
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'A local stand-in for the Terra Classic LCD')
+    parser.add_argument('--host', default='127.0.0.1', help='The address to listen on')
+    parser.add_argument('--port', default=1317, type=int, help='The port to listen on')
+    parser.add_argument('--fixtures', default=FIXTURES_FILE_NAME, help='The JSON file with the recorded responses')
+    parser.add_argument('--latency', default=0, type=float, help='The delay (in seconds) added to every request')
+    parser.add_argument('--jitter', default=0, type=float, help='A random extra delay (in seconds) of up to this much')
+    parser.add_argument('--error-rate', default=0, type=float, help='The fraction of requests that fail with a 503 error')
+    parser.add_argument('--page-size', default=MOCK_PAGE_SIZE, type=int, help='The page size for paginated lists')
+    parser.add_argument('--block-time', default=MOCK_BLOCK_TIME, type=float, help='How often (in seconds) a new block is made')
+    parser.add_argument('--gas-used', default=MOCK_GAS_USED, type=int, help='The gas used by every transaction')
+    parser.add_argument('--record', default=None, help='Pass unknown requests to this LCD and save the responses to the fixtures file')
+    args = parser.parse_args()
+
+    mock:MockLCD    = MockLCD().create(args.fixtures)
+    mock.block_time = args.block_time
+    mock.error_rate = args.error_rate
+    mock.gas_used   = args.gas_used
+    mock.jitter     = args.jitter
+    mock.latency    = args.latency
+    mock.page_size  = args.page_size
+    mock.record_url = args.record
+
+    server                = ThreadingHTTPServer((args.host, args.port), MockLCDHandler)
+    server.daemon_threads = True
+    server.mock           = mock
+
+    print (f' ✅ Mock LCD listening on http://{args.host}:{args.port} with {len(mock.routes)} fixtures')
+    print (f' 🛎️  Run the scripts with LCD_URL_OVERRIDE=http://{args.host}:{args.port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    if args.record is not None:
+        print (f'\n 🗄  {mock.saveRecording(args.fixtures)} new fixtures saved to {args.fixtures}')
+
+    print (' 🛑 Exiting...\n')
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    main()
@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+End-to-end benchmarks for the wallet, balance, routing, transaction and workflow code.
+
+Everything runs against the local LCD stand-in in benchmarks/mock_lcd.py, with a copy of osmosis.db,
+so the results are repeatable and nothing touches the real chain or the real database.
+Results are saved as JSON for the current commit, and two sets of results can be compared:
+
+    python3 -m benchmarks.run_benchmarks --wallets 10 --iterations 3 --latency 0.05
+    python3 -m benchmarks.run_benchmarks --compare a0637e0 bc0bbe0
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+
+from benchmarks.mock_lcd import (
+    FIXTURES_FILE_NAME,
+    MockLCD,
+    start_server
+)
+
+REPOSITORY_ROOT:str   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIRECTORY:str = os.path.dirname(os.path.abspath(__file__)) + '/results'
+
+# Built-in defaults, these can be changed on the command line
+BENCHMARK_BLOCK_TIME:float = 0.5   # Blocks are much quicker than the real chain so confirmations don't dominate the results
+BENCHMARK_ITERATIONS:int   = 3     # How many times each benchmark is repeated
+BENCHMARK_PASSWORD:str     = 'benchmark password'
+BENCHMARK_THRESHOLD:float  = 0.1   # A median this much slower (as a fraction) is reported as a regression
+BENCHMARK_WALLETS:int      = 5     # How many wallets are created
+
+# The swap pairs that the route computation is measured with. Pairs without a direct pool go via OSMO.
+ROUTE_PAIRS:list = [
+    ('uluna', 'uosmo'),
+    ('uluna', 'uatom'),
+    ('uluna', 'ujuno'),
+    ('uosmo', 'uakt'),
+    ('uluna', 'udvpn')
+]
+
+# The workflow that is run on every wallet: withdraw all the rewards, then put them back
+BENCHMARK_WORKFLOW:dict = {
+    'name':        'Benchmark workflow',
+    'description': 'Withdraw and redelegate the rewards',
+    'steps': [
+        {'action': 'withdraw', 'when': ['LUNC > 0']},
+        {'action': 'redelegate', 'amount': '100% LUNC', 'when': ['always']}
+    ]
+}
+
+class BenchmarkRun():
+    """
+    Time each benchmark step and count the LCD requests it makes.
+    """
+
+    def __init__(self):
+        self.mock:MockLCD = None
+        self.results:dict = {}
+        self.verbose:bool = False
+
+    def create(self, mock:MockLCD, verbose:bool = False) -> BenchmarkRun:
+        """
+        Set up a run against this stand-in server.
+
+        @params:
+            - mock: the running MockLCD object, used to count requests
+            - verbose: if True, then show the output from the scripts
+
+        @return: self
+        """
+
+        self.mock    = mock
+        self.verbose = verbose
+
+        return self
+
+    def measure(self, name:str, function, *args):
+        """
+        Run a function, and record how long it took and how many LCD requests it made.
+        The output from the scripts is hidden unless verbose mode is on.
+
+        @params:
+            - name: the benchmark this is a sample of
+            - function: the function to call
+            - args: the arguments for the function
+
+        @return: whatever the function returned
+        """
+
+        if name not in self.results:
+            self.results[name] = {'durations': [], 'requests': []}
+
+        requests_before:int = sum(self.mock.stats.values())
+        start_time:float    = time.perf_counter()
+
+        if self.verbose == True:
+            result = function(*args)
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = function(*args)
+
+        self.results[name]['durations'].append(time.perf_counter() - start_time)
+        self.results[name]['requests'].append(sum(self.mock.stats.values()) - requests_before)
+
+        return result
+
+    def summary(self) -> dict:
+        """
+        Summarise the samples for every benchmark.
+
+        @params:
+            - None
+
+        @return: a dictionary of {benchmark name: {samples, min, median, mean, p95, max, requests}}. Times are in seconds.
+        """
+
+        summary:dict = {}
+        for name in self.results:
+            durations:list = sorted(self.results[name]['durations'])
+            summary[name]  = {
+                'samples':  len(durations),
+                'min':      round(durations[0], 6),
+                'median':   round(statistics.median(durations), 6),
+                'mean':     round(statistics.mean(durations), 6),
+                'p95':      round(durations[min(len(durations) - 1, int(math.ceil(0.95 * len(durations))) - 1)], 6),
+                'max':      round(durations[-1], 6),
+                'requests': round(statistics.mean(self.results[name]['requests']), 2)
+            }
+
+        return summary
+
+def benchmark_wallets(run:BenchmarkRun, wallet_count:int, iterations:int) -> dict:
+    """
+    Create some new wallets, then measure how long it takes to decrypt and validate them.
+
+    @params:
+        - run: the benchmark run that records the results
+        - wallet_count: how many wallets to create
+        - iterations: how many times to load them
+
+    @return: the loaded wallets, in the same format as UserWallets().create()
+    """
+
+    import cryptocode
+
+    from classes.wallets import UserWallets
+    from terra_classic_sdk.key.mnemonic import MnemonicKey
+
+    user_config:dict = {'wallets': []}
+    for wallet_number in range(wallet_count):
+        wallet_key = MnemonicKey(prefix = 'terra')
+        user_config['wallets'].append({
+            'wallet':  f'Benchmark wallet {wallet_number + 1}',
+            'address': wallet_key.acc_address,
+            'seed':    cryptocode.encrypt(wallet_key.mnemonic, BENCHMARK_PASSWORD)
+        })
+
+    user_wallets:dict = {}
+    for iteration in range(iterations):
+        user_wallets = run.measure('wallet_load', UserWallets().create, user_config, BENCHMARK_PASSWORD)
+
+    return user_wallets
+
+def benchmark_balances(run:BenchmarkRun, user_wallets:dict, iterations:int) -> bool:
+    """
+    Measure how long it takes to get the balances and delegations for each wallet.
+
+    @params:
+        - run: the benchmark run that records the results
+        - user_wallets: the loaded wallets
+        - iterations: how many times to check each wallet
+
+    @return: True
+    """
+
+    for iteration in range(iterations):
+        for wallet_name in user_wallets:
+            run.measure('balance_fetch', user_wallets[wallet_name].getBalances)
+            run.measure('delegation_fetch', user_wallets[wallet_name].getDelegations)
+
+    return True
+
+def benchmark_routes(run:BenchmarkRun, user_wallets:dict, iterations:int) -> bool:
+    """
+    Measure how long it takes to find the Osmosis route for each of the swap pairs.
+    The prices are fixed so Coingecko isn't involved.
+
+    @params:
+        - run: the benchmark run that records the results
+        - user_wallets: the loaded wallets, the first one is used to create the swap
+        - iterations: how many times to find each route
+
+    @return: True
+    """
+
+    from constants.constants import CHAIN_DATA, UOSMO
+    from classes.swap_transaction import SwapTransaction
+
+    def find_route(swap_tx:SwapTransaction, denom_in:str, denom_out:str, amount:int) -> list:
+        route:dict = swap_tx.getRoute(denom_in, denom_out, amount)
+        if route['pool_id'] is not None:
+            return [route]
+
+        first_route:dict = swap_tx.getRoute(denom_in, UOSMO, amount)
+        if first_route['pool_id'] is None:
+            return []
+
+        return [first_route, swap_tx.getRoute(UOSMO, denom_out, first_route['swap_amount'])]
+
+    wallet  = user_wallets[list(user_wallets.keys())[0]]
+    swap_tx = SwapTransaction().create(wallet.seed, wallet.denom)
+
+    swap_tx.prices = {}
+    for denom in CHAIN_DATA:
+        swap_tx.prices[CHAIN_DATA[denom]['coingecko_id']] = {'usd': 1.0}
+
+    for iteration in range(iterations):
+        for denom_in, denom_out in ROUTE_PAIRS:
+            run.measure('route_computation', find_route, swap_tx, denom_in, denom_out, 1000000)
+
+    return True
+
+def benchmark_transactions(run:BenchmarkRun, user_wallets:dict, iterations:int) -> bool:
+    """
+    Send a small amount from every wallet back to itself, and time each part of the transaction separately.
+
+    @params:
+        - run: the benchmark run that records the results
+        - user_wallets: the loaded wallets
+        - iterations: how many sends each wallet makes
+
+    @return: True
+    """
+
+    from classes.send_transaction import SendTransaction
+
+    for iteration in range(iterations):
+        for wallet_name in user_wallets:
+            wallet = user_wallets[wallet_name]
+            wallet.getBalances()
+
+            send_tx = SendTransaction().create(wallet.seed, wallet.denom)
+
+            send_tx.amount            = 1000000
+            send_tx.balances          = wallet.balances
+            send_tx.block_height      = send_tx.terra.tendermint.block_info()['block']['header']['height']
+            send_tx.denom             = wallet.denom
+            send_tx.is_on_chain       = True
+            send_tx.receiving_denom   = wallet.denom
+            send_tx.recipient_address = wallet.address
+            send_tx.recipient_prefix  = wallet.getPrefix(wallet.address)
+            send_tx.revision_number   = 1
+            send_tx.sender_address    = wallet.address
+            send_tx.sender_prefix     = wallet.getPrefix(wallet.address)
+            send_tx.silent_mode       = True
+            send_tx.wallet_denom      = wallet.denom
+
+            if run.measure('tx_simulate', send_tx.simulate) == True:
+                run.measure('tx_sign', send_tx.send)
+                send_tx.broadcast_result = run.measure('tx_broadcast', send_tx.terra.tx.broadcast_sync, send_tx.transaction)
+                run.measure('tx_confirm', send_tx.findTransaction)
+
+    return True
+
+def benchmark_workflow(run:BenchmarkRun, user_wallets:dict, iterations:int) -> bool:
+    """
+    Run a complete withdraw and redelegate workflow across every wallet.
+
+    @params:
+        - run: the benchmark run that records the results
+        - user_wallets: the loaded wallets
+        - iterations: how many times to run the workflow
+
+    @return: True
+    """
+
+    from workflows import Log, attach_wallets, run_workflows
+
+    for iteration in range(iterations):
+        workflow:dict = dict(BENCHMARK_WORKFLOW, wallets = list(user_wallets.keys()))
+        workflows:list = attach_wallets([workflow], user_wallets)
+
+        logs:Log        = Log()
+        logs.silentMode = True
+
+        run.measure('workflow', run_workflows, workflows, user_wallets, logs, True)
+
+    return True
+
+def current_commit() -> str:
+    """
+    Get the short hash of the current commit. If there are uncommitted changes, then '-dirty' is added to the end.
+
+    @params:
+        - None
+
+    @return: the commit hash, or 'unknown' if this isn't a git repository
+    """
+
+    try:
+        commit:str = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = REPOSITORY_ROOT, capture_output = True, text = True, check = True).stdout.strip()
+        changes:str = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd = REPOSITORY_ROOT, capture_output = True, text = True, check = True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+    if changes != '':
+        commit += '-dirty'
+
+    return commit
+
+def load_results(reference:str) -> dict:
+    """
+    Load a saved set of results. The reference can be a results file, or any commit that git understands.
+
+    @params:
+        - reference: a file name, or a commit hash/branch/tag
+
+    @return: the saved results, or None if they couldn't be found
+    """
+
+    file_name:str = reference
+    if os.path.exists(file_name) == False:
+        try:
+            commit:str = subprocess.run(['git', 'rev-parse', '--short', reference], cwd = REPOSITORY_ROOT, capture_output = True, text = True, check = True).stdout.strip()
+        except Exception:
+            commit:str = reference
+
+        file_name = f'{RESULTS_DIRECTORY}/{commit}.json'
+
+    if os.path.exists(file_name) == False:
+        print (f' 🛑 No benchmark results could be found for {reference}.')
+        return None
+
+    with open(file_name, 'r') as results_file:
+        return json.load(results_file)
+
+def compare_results(base:dict, head:dict, threshold:float) -> bool:
+    """
+    Print the median time for every benchmark in both sets of results, and flag anything that got slower.
+
+    @params:
+        - base: the results we're comparing against
+        - head: the new results
+        - threshold: how much slower (as a fraction) a median has to be before it counts as a regression
+
+    @return: True if there were no regressions
+    """
+
+    print (f"\n Comparing {base['commit']} ({base['timestamp']}) with {head['commit']} ({head['timestamp']})\n")
+
+    label_widths:list   = [len('Benchmark'), len('Base'), len('Head'), len('Change'), len('Requests')]
+    rows:list           = []
+    no_regressions:bool = True
+
+    for name in head['results']:
+        if name not in base['results']:
+            continue
+
+        base_median:float = base['results'][name]['median']
+        head_median:float = head['results'][name]['median']
+        change:float      = (head_median - base_median) / base_median if base_median > 0 else 0
+
+        marker:str = ''
+        if change > threshold:
+            marker         = ' 🛑'
+            no_regressions = False
+        elif change < -threshold:
+            marker = ' ✅'
+
+        row:list = [
+            name,
+            f'{base_median * 1000:.1f}ms',
+            f'{head_median * 1000:.1f}ms',
+            f'{change * 100:+.1f}%' + marker,
+            f"{base['results'][name]['requests']:g} → {head['results'][name]['requests']:g}"
+        ]
+        rows.append(row)
+
+        for column in range(len(row)):
+            label_widths[column] = max(label_widths[column], len(row[column]))
+
+    header_string:str = ' ' + ' | '.join([label.ljust(label_widths[column]) for column, label in enumerate(['Benchmark', 'Base', 'Head', 'Change', 'Requests'])])
+    horizontal_spacer:str = '-' * (len(header_string) + 1)
+
+    print (horizontal_spacer)
+    print (header_string)
+    print (horizontal_spacer)
+
+    for row in rows:
+        print (' ' + ' | '.join([value.ljust(label_widths[column]) for column, value in enumerate(row)]))
+
+    print (horizontal_spacer + '\n')
+
+    if no_regressions == True:
+        print (' ✅ No regressions found.\n')
+    else:
+        print (f' 🛑 Some benchmarks are more than {threshold * 100:g}% slower.\n')
+
+    return no_regressions
+
+def show_results(results:dict) -> bool:
+    """
+    Print a table of the results from this run.
+
+    @params:
+        - results: the summary from BenchmarkRun.summary()
+
+    @return: True
+    """
+
+    columns:list      = ['Benchmark', 'Samples', 'Median', 'Mean', 'P95', 'Max', 'Requests']
+    label_widths:list = [len(column) for column in columns]
+    rows:list         = []
+
+    for name in results:
+        row:list = [name, str(results[name]['samples'])]
+        for key in ['median', 'mean', 'p95', 'max']:
+            row.append(f'{results[name][key] * 1000:.1f}ms')
+        row.append(f"{results[name]['requests']:g}")
+        rows.append(row)
+
+        for column in range(len(row)):
+            label_widths[column] = max(label_widths[column], len(row[column]))
+
+    header_string:str = ' ' + ' | '.join([label.ljust(label_widths[column]) for column, label in enumerate(columns)])
+    horizontal_spacer:str = '-' * (len(header_string) + 1)
+
+    print (horizontal_spacer)
+    print (header_string)
+    print (horizontal_spacer)
+
+    for row in rows:
+        print (' ' + ' | '.join([value.ljust(label_widths[column]) for column, value in enumerate(row)]))
+
+    print (horizontal_spacer + '\n')
+
+    return True
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Benchmark the utility scripts against a local LCD')
+    parser.add_argument('--wallets', default=BENCHMARK_WALLETS, type=int, help='How many wallets to create')
+    parser.add_argument('--iterations', default=BENCHMARK_ITERATIONS, type=int, help='How many times each benchmark is repeated')
+    parser.add_argument('--only', default=None, help='A comma-separated list of benchmarks to run: wallets, balances, routes, transactions, workflow')
+    parser.add_argument('--fixtures', default=FIXTURES_FILE_NAME, help='The JSON file with the recorded LCD responses')
+    parser.add_argument('--latency', default=0, type=float, help='The delay (in seconds) added to every LCD request')
+    parser.add_argument('--jitter', default=0, type=float, help='A random extra delay (in seconds) of up to this much')
+    parser.add_argument('--error-rate', default=0, type=float, help='The fraction of LCD requests that fail with a 503 error')
+    parser.add_argument('--block-time', default=BENCHMARK_BLOCK_TIME, type=float, help='How often (in seconds) a new block is made')
+    parser.add_argument('--output', default=None, help='Where to save the results. Defaults to benchmarks/results/COMMIT.json')
+    parser.add_argument('--compare', default=None, nargs='+', help='Compare two sets of results (files or commits). With one, it is compared against this run.')
+    parser.add_argument('--threshold', default=BENCHMARK_THRESHOLD, type=float, help='How much slower (as a fraction) counts as a regression')
+    parser.add_argument('--verbose', action='store_true', help='Show the output from the scripts')
+    args = parser.parse_args()
+
+    # Just compare two saved results, there's nothing to run
+    if args.compare is not None and len(args.compare) >= 2:
+        base:dict = load_results(args.compare[0])
+        head:dict = load_results(args.compare[1])
+        if base is None or head is None:
+            exit(1)
+
+        exit(0 if compare_results(base, head, args.threshold) else 1)
+
+    benchmarks:list = ['wallets', 'balances', 'routes', 'transactions', 'workflow']
+    if args.only is not None:
+        benchmarks = ['wallets'] + [name.strip() for name in args.only.split(',') if name.strip() in benchmarks and name.strip() != 'wallets']
+
+    mock:MockLCD    = MockLCD().create(args.fixtures)
+    mock.block_time = args.block_time
+    mock.error_rate = args.error_rate
+    mock.jitter     = args.jitter
+    mock.latency    = args.latency
+
+    server = start_server(mock, port = 0)
+
+    # These have to be set before any of the scripts are imported, because the constants are read once
+    temporary_directory:str = tempfile.mkdtemp(prefix = 'benchmarks-')
+    shutil.copy(REPOSITORY_ROOT + '/osmosis.db', temporary_directory + '/osmosis.db')
+
+    os.environ['LCD_URL_OVERRIDE']      = f'http://127.0.0.1:{server.server_address[1]}'
+    os.environ['DB_FILE_NAME_OVERRIDE']  = temporary_directory + '/osmosis.db'
+    if REPOSITORY_ROOT not in sys.path:
+        sys.path.insert(0, REPOSITORY_ROOT)
+
+    print (f'\n 🕐 Running {", ".join(benchmarks)} with {args.wallets} wallets and {args.iterations} iterations - please wait...\n')
+
+    run:BenchmarkRun = BenchmarkRun().create(mock, args.verbose)
+    started:float    = time.time()
+
+    try:
+        user_wallets:dict = benchmark_wallets(run, args.wallets, args.iterations)
+
+        if 'balances' in benchmarks:
+            benchmark_balances(run, user_wallets, args.iterations)
+        if 'routes' in benchmarks:
+            benchmark_routes(run, user_wallets, args.iterations)
+        if 'transactions' in benchmarks:
+            benchmark_transactions(run, user_wallets, args.iterations)
+        if 'workflow' in benchmarks:
+            benchmark_workflow(run, user_wallets, args.iterations)
+    finally:
+        server.shutdown()
+        shutil.rmtree(temporary_directory, ignore_errors = True)
+
+    results:dict = {
+        'commit':    current_commit(),
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'duration':  round(time.time() - started, 3),
+        'python':    platform.python_version(),
+        'settings': {
+            'wallets':    args.wallets,
+            'iterations': args.iterations,
+            'latency':    args.latency,
+            'jitter':     args.jitter,
+            'error_rate': args.error_rate,
+            'block_time': args.block_time
+        },
+        'results':   run.summary()
+    }
+
+    show_results(results['results'])
+
+    output_file:str = args.output
+    if output_file is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok = True)
+        output_file = f"{RESULTS_DIRECTORY}/{results['commit']}.json"
+
+    with open(output_file, 'w') as results_file:
+        json.dump(results, results_file, indent = 2)
+
+    print (f' 🗄  Results saved to {output_file}\n')
+
+    if args.compare is not None:
+        base:dict = load_results(args.compare[0])
+        if base is None:
+            exit(1)
+
+        exit(0 if compare_results(base, results, args.threshold) else 1)
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import time
+
+from decimal import Decimal
+from sqlite3 import Connection
+
+from constants.constants import (
+    HISTORY_DOWNSAMPLE_DAYS,
+    HISTORY_RETENTION_DAYS
+)
+
+from classes.balance_snapshot import wallet_amounts
+from classes.database import database_transaction, get_connection
+from classes.wallet import UserWallet
+
+class BalanceHistory():
+    """
+    A local time-series of wallet balances, delegations, rewards and undelegations.
+
+    Only changes are stored: if an amount is the same as the last time we saw it, nothing is written.
+    The balance_latest table holds the last known amount for every wallet/category/validator/denom,
+    and balance_history gets a new row each time one of these changes.
+    """
+
+    def __init__(self):
+        self.conn:Connection = None
+        self.timestamp:int   = None
+
+    def create(self) -> BalanceHistory:
+        """
+        Use the shared database connection. The history tables are created by the database migrations.
+
+        @params:
+            - None
+
+        @return: self
+        """
+
+        self.conn      = get_connection()
+        self.timestamp = int(time.time())
+
+        return self
+
+    def close(self) -> bool:
+        """
+        Apply the retention rules. The connection is shared with the rest of this process, so it stays open.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        self.prune()
+        self.conn = None
+
+        return True
+
+    def prune(self, downsample_days:int = HISTORY_DOWNSAMPLE_DAYS, retention_days:int = HISTORY_RETENTION_DAYS) -> int:
+        """
+        Downsample and remove old history.
+        Anything older than downsample_days only keeps the last change on each day.
+        Anything older than retention_days is removed, except the last change before then for each series.
+        The history only stores changes, so that row is still the current amount if nothing has changed since.
+
+        @params:
+            - downsample_days: how many days of full detail to keep
+            - retention_days: how many days of history to keep at all
+
+        @return: the number of rows that were removed
+        """
+
+        downsample_before:int = self.timestamp - (downsample_days * 86400)
+        retention_before:int  = self.timestamp - (retention_days * 86400)
+
+        with database_transaction() as cursor:
+            cursor.execute("DELETE FROM balance_history WHERE timestamp < ? AND ID NOT IN (SELECT MAX(ID) FROM balance_history WHERE timestamp < ? GROUP BY wallet_address, category, validator, denom);", [retention_before, retention_before])
+            removed_count:int = cursor.rowcount
+
+            # Keep the last row for each series on each day
+            cursor.execute("DELETE FROM balance_history WHERE timestamp < ? AND ID NOT IN (SELECT MAX(ID) FROM balance_history WHERE timestamp < ? GROUP BY wallet_address, category, validator, denom, timestamp / 86400);", [downsample_before, downsample_before])
+            removed_count += cursor.rowcount
+
+            cursor.execute("DELETE FROM price_history WHERE timestamp < ? AND timestamp < (SELECT MAX(latest.timestamp) FROM price_history AS latest WHERE latest.denom = price_history.denom AND latest.timestamp < ?);", [retention_before, retention_before])
+            removed_count += cursor.rowcount
+
+            cursor.execute("DELETE FROM price_history WHERE timestamp < ? AND rowid NOT IN (SELECT MAX(rowid) FROM price_history WHERE timestamp < ? GROUP BY denom, timestamp / 86400);", [downsample_before, downsample_before])
+            removed_count += cursor.rowcount
+
+        return removed_count
+
+    def recordPrices(self, prices:dict) -> int:
+        """
+        Store the current USD prices, so the portfolio value can be charted later on.
+        Like the balances, a price is only stored if it has changed.
+
+        @params:
+            - prices: a dictionary of denoms and their USD price
+
+        @return: the number of prices that were stored
+        """
+
+        latest_price_query:str = "SELECT price FROM price_history WHERE denom = ? ORDER BY timestamp DESC LIMIT 1;"
+        insert_price_query:str = "INSERT OR REPLACE INTO price_history (timestamp, denom, price) VALUES (?, ?, ?);"
+
+        price_count:int = 0
+        with database_transaction() as cursor:
+            for denom in prices:
+                if prices[denom] is not None:
+                    latest_price = cursor.execute(latest_price_query, [denom]).fetchone()
+                    if latest_price is None or latest_price[0] != float(prices[denom]):
+                        cursor.execute(insert_price_query, [self.timestamp, denom, float(prices[denom])])
+                        price_count += 1
+
+        return price_count
+
+    def recordWallet(self, wallet:UserWallet, categories:tuple = ('balance', 'delegation', 'reward')) -> int:
+        """
+        Store any amounts on this wallet that have changed since the last time we saw it.
+        Amounts that have disappeared (a withdrawn reward for example) are recorded as zero.
+        Nothing is stored if the wallet didn't load properly, otherwise a failed request would look like everything went to zero.
+
+        @params:
+            - wallet: a loaded wallet
+            - categories: the parts of the wallet that were loaded. Anything else is left alone.
+
+        @return: the number of changes that were stored
+        """
+
+        latest_query:str  = "SELECT category, validator, denom, amount FROM balance_latest WHERE wallet_address = ?;"
+        history_query:str = "INSERT INTO balance_history (timestamp, wallet_address, category, validator, denom, amount) VALUES (?, ?, ?, ?, ?, ?);"
+        update_query:str  = "INSERT OR REPLACE INTO balance_latest (wallet_address, category, validator, denom, amount, timestamp) VALUES (?, ?, ?, ?, ?, ?);"
+
+        if wallet.network_error == True:
+            return 0
+
+        # What did we see last time?
+        previous:dict = {}
+        for category, validator, denom, amount in self.conn.execute(latest_query, [wallet.address]).fetchall():
+            if category in categories:
+                previous[(category, validator, denom)] = Decimal(amount)
+
+        # What can we see now?
+        current:dict = {}
+        for category, validator, denom, amount in wallet_amounts(wallet):
+            if category in categories:
+                key:tuple    = (category, validator, denom)
+                current[key] = current.get(key, Decimal(0)) + Decimal(str(amount))
+
+        # Anything we saw last time, but not now, has gone to zero
+        for key in previous:
+            if key not in current:
+                current[key] = Decimal(0)
+
+        change_count:int = 0
+        with database_transaction() as cursor:
+            for key in current:
+                if key not in previous or previous[key] != current[key]:
+                    category, validator, denom = key
+                    cursor.execute(history_query, [self.timestamp, wallet.address, category, validator, denom, str(current[key])])
+                    cursor.execute(update_query, [wallet.address, category, validator, denom, str(current[key]), self.timestamp])
+                    change_count += 1
+
+        return change_count
+
+    def series(self, wallet_address:str, denom:str, category:str = 'balance', start_time:int = 0, end_time:int = None) -> list:
+        """
+        Get the history of one amount, ready for charting.
+        The total across all validators is returned for delegations and rewards.
+
+        @params:
+            - wallet_address: the wallet we want the history for
+            - denom: the coin we want the history for, ie: uluna
+            - category: balance, delegation, reward or undelegation
+            - start_time: the earliest unix timestamp to include
+            - end_time: the latest unix timestamp to include. Defaults to now.
+
+        @return: a list of [timestamp, amount] pairs, one for each time the total changed
+        """
+
+        if end_time is None:
+            end_time = int(time.time())
+
+        series_query:str = "SELECT timestamp, validator, amount FROM balance_history WHERE wallet_address = ? AND denom = ? AND category = ? AND timestamp <= ? ORDER BY timestamp, ID;"
+
+        # Replay the changes to get the total at each point in time
+        amounts:dict = {}
+        result:list  = []
+        for timestamp, validator, amount in self.conn.execute(series_query, [wallet_address, denom, category, end_time]).fetchall():
+            amounts[validator] = Decimal(amount)
+            total:Decimal = sum(amounts.values(), Decimal(0))
+
+            if timestamp >= start_time:
+                if len(result) > 0 and result[-1][0] == timestamp:
+                    result[-1][1] = total
+                else:
+                    result.append([timestamp, total])
+
+        return result
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+from decimal import Decimal
+
+from constants.constants import (
+    ULUNA
+)
+
+from classes.common import (
+    divide_raw_balances,
+    format_raw_amounts,
+    raw_integer,
+    to_decimal
+)
+
+from classes.wallet import UserWallet
+
+class BalanceReport():
+    """
+    The data behind the balances report.
+
+    Every amount is stored as a single row of (coin, wallet, column, amount) in four parallel lists.
+    The column is either 'Available', 'Delegated', or the name of the validator that the rewards are coming from.
+    The rows are only grouped together once, when the report is rendered.
+    Amounts are kept as raw whole numbers (or Decimals for rewards) and are only converted when they are shown.
+    """
+
+    def __init__(self):
+        self.amounts:list    = []
+        self.coins:list      = []
+        self.columns:list    = []
+        self.validators:list = []
+        self.wallets:list    = []
+
+    def addRow(self, coin:str, wallet_name:str, column:str, amount) -> bool:
+        """
+        Add a single amount to the report.
+
+        @params:
+            - coin: the technical denom, ie: uluna
+            - wallet_name: the wallet this amount belongs to
+            - column: 'Available', 'Delegated', or a validator name
+            - amount: the raw amount as an int or Decimal, ie: 1000000 uluna
+
+        @return: True
+        """
+
+        self.amounts.append(amount)
+        self.coins.append(coin)
+        self.columns.append(column)
+        self.wallets.append(wallet_name)
+
+        return True
+
+    def addWallet(self, wallet:UserWallet, coin_lookup:dict) -> int:
+        """
+        Add the balances, delegations and rewards of this wallet to the report.
+        The wallet balances and delegations must already be loaded.
+
+        @params:
+            - wallet: a fully loaded wallet
+            - coin_lookup: the coins we want to show, ie: BASIC_COIN_LOOKUP or FULL_COIN_LOOKUP
+
+        @return: the number of rows that were added for this wallet
+        """
+
+        row_count:int = len(self.amounts)
+
+        for denom in wallet.balances:
+            readable_denom:str = wallet.denomTrace(denom)
+            if readable_denom in coin_lookup and raw_integer(wallet.balances[denom]) > 0:
+                self.addRow(readable_denom, wallet.name, 'Available', raw_integer(wallet.balances[denom]))
+
+        if wallet.delegations is not None:
+            delegated_amount:int = 0
+            for validator in wallet.delegations:
+                delegation:dict = wallet.delegations[validator]
+
+                if delegation['balance_denom'] == ULUNA:
+                    delegated_amount += raw_integer(delegation['balance_amount'])
+
+                # Only validators with a balance and some rewards get a column
+                if raw_integer(delegation['balance_amount']) > 0 and len(delegation['rewards']) > 0:
+                    if validator not in self.validators:
+                        self.validators.append(validator)
+
+                    for denom in delegation['rewards']:
+                        # Rewards have fractions of the smallest unit, so they are kept as Decimals
+                        reward_amount:Decimal = to_decimal(delegation['rewards'][denom])
+                        if denom in coin_lookup and reward_amount > 0:
+                            self.addRow(denom, wallet.name, validator, reward_amount)
+
+            if delegated_amount > 0 and ULUNA in coin_lookup:
+                self.addRow(ULUNA, wallet.name, 'Delegated', delegated_amount)
+
+        return len(self.amounts) - row_count
+
+    def aggregate(self) -> dict:
+        """
+        Group the rows by coin and wallet, adding up any duplicate amounts.
+        This is done in one pass over the rows.
+
+        @params:
+            - None
+
+        @return: a dictionary of {coin: {wallet name: {column: amount}}}
+        """
+
+        result:dict = {}
+        for coin, wallet_name, column, amount in zip(self.coins, self.wallets, self.columns, self.amounts):
+            if coin not in result:
+                result[coin] = {}
+            if wallet_name not in result[coin]:
+                result[coin][wallet_name] = {}
+
+            result[coin][wallet_name][column] = result[coin][wallet_name].get(column, 0) + amount
+
+        return result
+
+    def denoms(self) -> list:
+        """
+        Return the unique list of coins in this report, so we can get the prices in one request.
+
+        @params:
+            - None
+
+        @return: a list of technical denoms
+        """
+
+        return list(dict.fromkeys(self.coins))
+
+    def render(self, coin_lookup:dict, coin_prices:dict):
+        """
+        Build the report table, one line at a time.
+        Each amount is converted into a readable string exactly once.
+
+        @params:
+            - coin_lookup: the coins we want to show, ie: BASIC_COIN_LOOKUP or FULL_COIN_LOOKUP
+            - coin_prices: the USD price of each coin, from wallet.getCoinPrice()
+
+        @return: a generator of table lines
+        """
+
+        columns:list    = ['Available', 'Delegated'] + self.validators
+        aggregated:dict = self.aggregate()
+
+        # Convert every cell into its display string, and find the widths at the same time
+        label_widths:list = [len('Coin'), len('Wallet'), len('Value')] + [len(column) for column in columns]
+        table:list        = []
+
+        for coin in sorted(aggregated, key = lambda denom: coin_lookup[denom]):
+            coin_name:str = coin_lookup[coin]
+            label_widths[0] = max(label_widths[0], len(coin_name))
+
+            rows:list = []
+            for wallet_name in aggregated[coin]:
+                cells:dict = aggregated[coin][wallet_name]
+                label_widths[1] = max(label_widths[1], len(wallet_name))
+
+                # The value is based on the available and delegated amounts
+                if coin in coin_prices:
+                    denom_total:float = float(divide_raw_balances([(cells.get('Available', 0) + cells.get('Delegated', 0), coin)])[0])
+                    denom_value:str   = "${:,.2f}".format(denom_total * coin_prices[coin])
+                else:
+                    denom_value:str = '---'
+
+                label_widths[2] = max(label_widths[2], len(denom_value))
+
+                # Convert every amount in this row at once
+                row_columns:list = [column for column in columns if column in cells]
+                amounts:dict     = dict(zip(row_columns, format_raw_amounts([(cells[column], coin) for column in row_columns])))
+
+                row:list = [wallet_name, denom_value]
+                for column_id in range(len(columns)):
+                    amount:str = amounts.get(columns[column_id], '')
+
+                    label_widths[3 + column_id] = max(label_widths[3 + column_id], len(amount))
+                    row.append(amount)
+
+                rows.append(row)
+
+            table.append([coin_name, rows])
+
+        header_labels:list    = ['Coin', 'Wallet', 'Value'] + columns
+        header_string:str     = '|'.join([' ' + header_labels[column_id].ljust(label_widths[column_id]) + ' ' for column_id in range(len(header_labels))]) + '|'
+        horizontal_spacer:str = '-' * len(header_string)
+
+        yield horizontal_spacer
+        yield header_string
+        yield horizontal_spacer
+
+        for coin_name, rows in table:
+            first:bool = True
+            for row in rows:
+                if first == True:
+                    line:str = ' ' + coin_name.ljust(label_widths[0]) + ' |'
+                else:
+                    line:str = ' ' * (label_widths[0] + 2) + '|'
+
+                line += '|'.join([' ' + row[column_id].ljust(label_widths[1 + column_id]) + ' ' for column_id in range(len(row))]) + '|'
+
+                yield line
+                first = False
+
+            yield horizontal_spacer
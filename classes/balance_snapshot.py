@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import csv
+import json
+
+from datetime import datetime, timezone
+
+from constants.constants import (
+    FULL_COIN_LOOKUP,
+    ULUNA,
+    UBASE
+)
+
+from classes.common import (
+    divide_raw_balance
+)
+
+from classes.wallet import UserWallet
+
+# The columns in every snapshot file, in this order
+SNAPSHOT_FIELDS:list  = ['timestamp', 'wallet_name', 'address', 'category', 'validator', 'denom', 'coin', 'amount', 'readable_amount', 'price_usd', 'value_usd']
+SNAPSHOT_FORMATS:list = ['jsonl', 'csv', 'parquet']
+
+def wallet_amounts(wallet:UserWallet) -> list:
+    """
+    Get every amount on this wallet as a flat list.
+    Only the parts of the wallet that have been loaded will be included.
+
+    @params:
+        - wallet: a loaded wallet
+
+    @return: a list of [category, validator, denom, raw amount]
+    """
+
+    amounts:list = []
+
+    for denom in wallet.balances:
+        amounts.append(['balance', '', wallet.denomTrace(denom), wallet.balances[denom]])
+
+    if wallet.delegations is not None:
+        for validator in wallet.delegations:
+            delegation:dict = wallet.delegations[validator]
+            amounts.append(['delegation', validator, delegation['balance_denom'], delegation['balance_amount']])
+
+            for denom in delegation['rewards']:
+                amounts.append(['reward', validator, denom, delegation['rewards'][denom]])
+
+    if wallet.undelegations is not None:
+        for validator in wallet.undelegations:
+            # BASE undelegations are stored under the UBASE key, but they are paid out in LUNC
+            if validator == UBASE:
+                amounts.append(['undelegation', 'BASE', ULUNA, wallet.undelegations[validator]['balance_amount']])
+            else:
+                amounts.append(['undelegation', validator, ULUNA, wallet.undelegations[validator]['balance_amount']])
+
+    return amounts
+
+class BalanceSnapshot():
+    """
+    Write a machine-readable snapshot of every wallet's balances, delegations, rewards and undelegations.
+    Each wallet is written as soon as it has been loaded, so nothing is kept in memory between wallets.
+    """
+
+    def __init__(self):
+        self.file                 = None
+        self.file_format:str      = 'jsonl'
+        self.parquet_schema       = None
+        self.parquet_writer       = None
+        self.prices:dict          = {}
+        self.record_count:int     = 0
+        self.timestamp:str        = None
+        self.writer               = None
+
+    def create(self, file_name:str, file_format:str = 'jsonl') -> BalanceSnapshot:
+        """
+        Open the snapshot file and get it ready for writing.
+
+        @params:
+            - file_name: where the snapshot is saved
+            - file_format: jsonl, csv or parquet
+
+        @return: self
+        """
+
+        self.file_format = file_format.lower()
+        self.timestamp   = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        if self.file_format not in SNAPSHOT_FORMATS:
+            print (f' 🛑 {file_format} is not a supported snapshot format - please use one of {", ".join(SNAPSHOT_FORMATS)}.')
+            exit()
+
+        if self.file_format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                print (' 🛑 Parquet snapshots need the pyarrow library - please run "pip install pyarrow" first.')
+                exit()
+
+            self.parquet_schema = pyarrow.schema([
+                ('timestamp', pyarrow.string()),
+                ('wallet_name', pyarrow.string()),
+                ('address', pyarrow.string()),
+                ('category', pyarrow.string()),
+                ('validator', pyarrow.string()),
+                ('denom', pyarrow.string()),
+                ('coin', pyarrow.string()),
+                ('amount', pyarrow.string()),
+                ('readable_amount', pyarrow.float64()),
+                ('price_usd', pyarrow.float64()),
+                ('value_usd', pyarrow.float64())
+            ])
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(file_name, self.parquet_schema)
+        else:
+            self.file = open(file_name, 'w', newline = '')
+
+            if self.file_format == 'csv':
+                self.writer = csv.DictWriter(self.file, fieldnames = SNAPSHOT_FIELDS)
+                self.writer.writeheader()
+
+        return self
+
+    def close(self) -> int:
+        """
+        Finish writing the snapshot.
+
+        @params:
+            - None
+
+        @return: the number of records that were written
+        """
+
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        elif self.file is not None:
+            self.file.close()
+
+        return self.record_count
+
+    def getPrices(self, wallet:UserWallet, denom_list:list) -> dict:
+        """
+        Get the USD prices for these coins. Prices are shared between wallets, so each coin is only requested once.
+
+        @params:
+            - wallet: any wallet - we use it to make the price request
+            - denom_list: the coins we want prices for
+
+        @return: a dict of coins and their prices
+        """
+
+        missing_denoms:list = [denom for denom in denom_list if denom not in self.prices]
+        if len(missing_denoms) > 0:
+            coin_prices:dict = wallet.getCoinPrice(missing_denoms)
+            for denom in missing_denoms:
+                # Coins without a price are remembered as well, so we don't keep asking for them
+                self.prices[denom] = coin_prices.get(denom, None)
+
+        return self.prices
+
+    def walletRecords(self, wallet:UserWallet) -> list:
+        """
+        Convert the balances, delegations, rewards and undelegations on this wallet into a list of records.
+        The wallet must already be loaded.
+
+        @params:
+            - wallet: a fully loaded wallet
+
+        @return: a list of dictionaries, one per amount
+        """
+
+        amounts:list = wallet_amounts(wallet)
+        prices:dict  = self.getPrices(wallet, list(dict.fromkeys([amount[2] for amount in amounts])))
+        records:list = []
+
+        for category, validator, denom, amount in amounts:
+            readable_amount:float = divide_raw_balance(amount, denom)
+            price:float           = prices.get(denom, None)
+            value:float           = None
+            if price is not None:
+                value = round(readable_amount * price, 2)
+
+            records.append({
+                'timestamp':       self.timestamp,
+                'wallet_name':     wallet.name,
+                'address':         wallet.address,
+                'category':        category,
+                'validator':       validator,
+                'denom':           denom,
+                'coin':            FULL_COIN_LOOKUP.get(denom, denom),
+                'amount':          str(amount),
+                'readable_amount': readable_amount,
+                'price_usd':       price,
+                'value_usd':       value
+            })
+
+        return records
+
+    def writeWallet(self, wallet:UserWallet) -> int:
+        """
+        Write all the records for this wallet to the snapshot file.
+
+        @params:
+            - wallet: a fully loaded wallet
+
+        @return: the number of records that were written
+        """
+
+        records:list = self.walletRecords(wallet)
+
+        if self.file_format == 'parquet':
+            import pyarrow
+            table = pyarrow.Table.from_pylist(records, schema = self.parquet_schema)
+            self.parquet_writer.write_table(table)
+        elif self.file_format == 'csv':
+            self.writer.writerows(records)
+        else:
+            for record in records:
+                self.file.write(json.dumps(record) + '\n')
+
+        if self.file is not None:
+            self.file.flush()
+
+        self.record_count += len(records)
+
+        return len(records)
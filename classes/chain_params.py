@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import threading
+import time
+
+from constants.constants import (
+    CHAIN_DATA,
+    CHAIN_PARAMS_EPOCH_BLOCKS,
+    CHAIN_PARAMS_TTL,
+    ULUNA
+)
+
+from terra_classic_sdk.client.lcd import LCDClient
+
+# The gas prices we use for every transaction. These used to come from a gas price URL.
+GAS_PRICES:dict = {'uluna': '28.325', 'usdr': '0.52469', 'uusd': '0.75', 'ukrw': '850.0', 'umnt': '2142.855', 'ueur': '0.625', 'ucny': '4.9', 'ujpy': '81.85', 'ugbp': '0.55', 'uinr': '54.4', 'ucad': '0.95', 'uchf': '0.7', 'uaud': '0.95', 'usgd': '1.0', 'uthb': '23.1', 'usek': '6.25', 'unok': '6.25', 'udkk': '4.5', 'uidr': '10900.0', 'uphp': '38.0', 'uhkd': '5.85', 'umyr': '3.0', 'utwd': '20.0'}
+
+# One set of parameters per chain, shared by every transaction in this process
+cached_params:dict = {}
+params_lock        = threading.Lock()
+
+def chain_params(terra:LCDClient) -> ChainParams:
+    """
+    Get the parameters for the chain that this LCD client is connected to.
+    They are loaded the first time they are needed, and then reused until they expire.
+
+    @params:
+        - terra: the LCD client for this chain
+
+    @return: a ChainParams object
+    """
+
+    with params_lock:
+        params:ChainParams = cached_params.get(terra.chain_id, None)
+        if params is None or params.isExpired():
+            params = ChainParams().create(terra.chain_id)
+            cached_params[terra.chain_id] = params
+
+    return params
+
+def observe_height(chain_id:str, height:int) -> bool:
+    """
+    Tell the cache about a block height we've seen.
+    If the chain has moved into a new epoch since the parameters were loaded, then they are reloaded next time.
+
+    @params:
+        - chain_id: the chain this height belongs to
+        - height: the block height
+
+    @return: True if the parameters for this chain have been invalidated
+    """
+
+    with params_lock:
+        params:ChainParams = cached_params.get(chain_id, None)
+        if params is None or params.tax_rate is None:
+            return False
+
+        # If the height couldn't be loaded with the tax rate, then this is the best we have
+        if params.height is None:
+            params.height = int(height)
+        elif int(height) // CHAIN_PARAMS_EPOCH_BLOCKS != params.height // CHAIN_PARAMS_EPOCH_BLOCKS:
+            del cached_params[chain_id]
+            return True
+
+    return False
+
+class ChainParams():
+    """
+    The chain parameters that every transaction needs: the tax rate and gas prices.
+
+    Tax changes only take effect at an epoch boundary, so the parameters are reloaded when the block height
+    crosses into a new epoch, or after CHAIN_PARAMS_TTL seconds, whichever happens first.
+    The block height is requested along with the tax rate, so an epoch that starts before the next transaction is still noticed.
+    """
+
+    def __init__(self):
+        self.chain_id:str   = None
+        self.height:int     = None # The block height when the tax rate was loaded
+        self.loaded:float   = None
+        self.tax_rate:float = None
+
+    def create(self, chain_id:str) -> ChainParams:
+        """
+        Create an empty set of parameters for this chain.
+
+        @params:
+            - chain_id: the chain these parameters belong to
+
+        @return: self
+        """
+
+        self.chain_id = chain_id
+        self.loaded   = time.time()
+
+        return self
+
+    def gasPrices(self) -> dict:
+        """
+        Get the gas prices for this chain.
+
+        @params:
+            - None
+
+        @return: a dictionary of denoms and their gas prices
+        """
+
+        return dict(GAS_PRICES)
+
+    def isExpired(self) -> bool:
+        """
+        Check if these parameters are too old to use.
+
+        @params:
+            - None
+
+        @return: True if they need to be loaded again
+        """
+
+        return time.time() - self.loaded > CHAIN_PARAMS_TTL
+
+    def taxRate(self, terra:LCDClient) -> float:
+        """
+        Get the current tax rate.
+        If this is not a columbus-5 (Luna Classic) chain, then the tax rate is zero.
+
+        @params:
+            - terra: the LCD client for this chain, used if the rate hasn't been loaded yet
+
+        @return: the tax rate as a float number
+        """
+
+        if self.tax_rate is None:
+            if self.chain_id == CHAIN_DATA[ULUNA]['chain_id']:
+                self.tax_rate = float(terra.treasury.tax_rate())
+
+                # Remember which epoch this rate belongs to
+                try:
+                    self.height = int(terra.tendermint.block_info()['block']['header']['height'])
+                except Exception:
+                    self.height = None
+            else:
+                self.tax_rate = 0
+
+        return self.tax_rate
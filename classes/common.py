@@ -2,84 +2,89 @@
 # -*- coding: UTF-8 -*-
 
 
+import asyncio
 import json
 import os
-import requests
-import sqlite3
+import threading
+import time
 import traceback
 
 from datetime import datetime, timedelta
+from decimal import Context, Decimal, ROUND_HALF_EVEN
 
 from constants.constants import (
-    CHAIN_DATA,
     CHECK_FOR_UPDATES,
     DB_FILE_NAME,
+    PRECISION_LOOKUP,
+    VERSION_CACHE_FILE_NAME,
+    VERSION_CHECK_INTERVAL,
     VERSION_URI
 )
+
+from classes.database import get_cursor
+
 from terra_classic_sdk.core.coin import Coin
 from terra_classic_sdk.core.coins import Coins
 
+# Raw amounts of 18 decimal coins can be longer than the normal 28 digits, so conversions use their own context
+AMOUNT_CONTEXT:Context = Context(prec = 60, rounding = ROUND_HALF_EVEN)
+
 def check_version() -> bool:
     """
     Check the github repo to see if there's a new version.
     This check can be disabled by changing CHECK_FOR_UPDATES in the constants file.
 
+    The answer is saved in VERSION_CACHE_FILE_NAME and reused for VERSION_CHECK_INTERVAL seconds.
+    When it needs refreshing, Github is checked in a background thread so the script never waits for it,
+    and if we're offline then nothing is shown - we'll just try again next time.
+
     @params:
         - None
 
-    @return: true/false if the script is on the current version
+    @return: true/false if the script is on the current version, as far as we know
     """
 
     if CHECK_FOR_UPDATES == True:
-        local_json:json  = None
-        remote_json:json = None
-
-        print ('\nChecking for new version on Github...')
         try:
             with open('version.json') as file:
-                contents = file.read()
-            
-            local_json = json.loads(contents)
+                local_version:str = json.loads(file.read())['version']
         except:
             print ('')
             print ('The local version.json file could not be opened.')
             print ('Please make sure you are using the latest version, check https://github.com/geoffmunn/utility-scripts for updates.')
-
-        if local_json is not None:
-            try:
-                remote_json = requests.get(url = VERSION_URI, timeout = 1).json()
-            except:
-                print ('')
-                print ('The remote version.json file could not be opened.')
-                print ('Please make sure you are using the latest version, check https://github.com/geoffmunn/utility-scripts for updates.')
-        else:
             return False
-        
-        if remote_json is not None:
-            if local_json['version'] != remote_json['version']:
-                print ('')
-
-                local_bits = local_json['version'].split('.')
-                remote_bits = remote_json['version'].split('.')
-
-                if int(remote_bits[0]) > int(local_bits[0]):
-                    print (' 🛎️  A new major version is available!')
-                elif int(remote_bits[1]) > int(local_bits[1]):
-                    print (' 🛎️  A new minor version is available!')
-                elif int(remote_bits[2]) > int(local_bits[2]):
-                    print (' 🛎️  An update is available!')
-                elif int(local_bits[0]) > int(remote_bits[0]) or int(local_bits[1]) > int(remote_bits[1]) or int(local_bits[2]) > int(remote_bits[2]):
-                    print (' 🛎️  You are running a version ahead of the official release!')
-                    
-                print (' 🛎️  Please check https://github.com/geoffmunn/utility-scripts for updates.')
-                return False
-            else:
-                print ('... you have the latest version.')
-                return True
-        else:
+
+        version_cache:dict = {}
+        try:
+            with open(VERSION_CACHE_FILE_NAME) as file:
+                version_cache = json.loads(file.read())
+        except:
+            pass
+
+        if time.time() - float(version_cache.get('checked', 0)) > VERSION_CHECK_INTERVAL:
+            # This is a daemon thread, so a slow or missing connection won't stop the script from finishing
+            threading.Thread(target = refresh_version_cache, name = 'version-check', daemon = True).start()
+
+        remote_version:str = version_cache.get('version', None)
+        if remote_version is not None and remote_version != local_version:
+            print ('')
+
+            local_bits  = local_version.split('.')
+            remote_bits = remote_version.split('.')
+
+            if int(remote_bits[0]) > int(local_bits[0]):
+                print (' 🛎️  A new major version is available!')
+            elif int(remote_bits[1]) > int(local_bits[1]):
+                print (' 🛎️  A new minor version is available!')
+            elif int(remote_bits[2]) > int(local_bits[2]):
+                print (' 🛎️  An update is available!')
+            elif int(local_bits[0]) > int(remote_bits[0]) or int(local_bits[1]) > int(remote_bits[1]) or int(local_bits[2]) > int(remote_bits[2]):
+                print (' 🛎️  You are running a version ahead of the official release!')
+
+            print (' 🛎️  Please check https://github.com/geoffmunn/utility-scripts for updates.')
             return False
-    else:
-        return True
+
+    return True
     
 def check_database() -> bool:
     """
@@ -93,11 +98,11 @@ def check_database() -> bool:
 
     try:
         if os.stat(DB_FILE_NAME).st_size > 0:
-            # Check if the last scan was fairly recent:
+            # Check if the last scan was fairly recent.
+            # Opening the connection also brings the rest of the tables (ibc_denoms, trades, etc) up to date.
             try:
                 recent_scan = "SELECT last_scan_date FROM osmosis_summary WHERE ID = 1;"
-                conn        = sqlite3.connect(DB_FILE_NAME)
-                cursor      = conn.execute(recent_scan)
+                cursor      = get_cursor().execute(recent_scan)
 
                 for row in cursor.fetchone():
                     last_scan_date:datetime = datetime.strptime(row, '%Y-%m-%d %H:%M:%S')
@@ -106,49 +111,11 @@ def check_database() -> bool:
                     if last_scan_date < previous_date:
                         print ('\n 🗄  This database is out of date - you should get the latest Osmosis data.')
                         print (' 🗄  Run the get_osmosis_pools.py script to update the database.\n')
-
-                conn.close()
             except:
                 print (' 🛑 The Osmosis pool database could accessed...')
                 print (' 🛑 Run \'get_osmosis_pools.py\' first to generate the list.\n')
                 exit()
 
-            # Make sure that the ibc_denoms table is there:
-            ibc_table_exists:bool = True
-            try:
-                recent_scan = "SELECT * FROM ibc_denoms LIMIT 1;"
-                conn        = sqlite3.connect(DB_FILE_NAME)
-                cursor      = conn.execute(recent_scan)
-                conn.close()
-            except:
-                ibc_table_exists = False
-
-            if ibc_table_exists == False:
-                print ('\n 🗄  No ibc_denom table found, creating one...')
-                create_ibc_table = "CREATE TABLE ibc_denoms (ID INTEGER PRIMARY KEY AUTOINCREMENT, date_added DATETIME DEFAULT CURRENT_TIMESTAMP, ibc_denom TEXT NOT NULL, readable_denom TEXT NOT NULL);"
-                conn   = sqlite3.connect(DB_FILE_NAME)
-                cursor = conn.execute(create_ibc_table)
-                conn.commit()
-                conn.close()
-
-            # Make sure that the ibc_denoms table is there:
-            trading_table_exists:bool = True
-            try:
-                recent_scan = "SELECT * FROM trades LIMIT 1;"
-                conn        = sqlite3.connect(DB_FILE_NAME)
-                cursor      = conn.execute(recent_scan)
-                conn.close()
-            except:
-                trading_table_exists = False
-
-            if trading_table_exists == False:
-                print ('\n 🗄  No trading table found, creating one...')
-                create_trade_table = "CREATE TABLE trades (ID INTEGER PRIMARY KEY AUTOINCREMENT, date_added DATETIME DEFAULT CURRENT_TIMESTAMP, wallet_name TEXT NOT NULL, coin_from TEXT NOT NULL, amount_from INTEGER NOT NULL, price_from REAL NOT NULL, coin_to TEXT NOT NULL, amount_to INTEGER NOT NULL, price_to REAL NOT NULL, fees TEXT NOT NULL, exit_profit REAL NOT NULL, exit_loss REAL NOT NULL, linked_trade_id INTEGER, tx_hash TEXT NOT NULL, status TEXT NOT NULL);"
-                conn               = sqlite3.connect(DB_FILE_NAME)
-                cursor             = conn.execute(create_trade_table)
-                conn.commit()
-                conn.close()
-
             return True
         else:
             print (' 🛑 The Osmosis pool database is empty...')
@@ -193,6 +160,97 @@ def divide_raw_balance(amount:float, denom:str) -> float:
     
     return result
 
+def divide_raw_balances(amounts:list) -> list:
+    """
+    Return the exact human-readable amounts for a list of raw amounts, all at once.
+
+    @params:
+        - amounts: a list of (amount, denom) pairs, ie: [(1500000, 'uluna')]
+
+    @return: a list of Decimal amounts, in the same order
+    """
+
+    return [to_decimal(amount).scaleb(-PRECISION_LOOKUP.get(denom, 6), AMOUNT_CONTEXT) for amount, denom in amounts]
+
+def exit_prices(coin_from:str, amount_from:int, coin_to:str, amount_to:int, exit_profit:float, exit_loss:float) -> list[float, float]:
+    """
+    Calculate the prices that a trade should be closed at.
+    The price is how much of the original coin (coin_from) one unit of the purchased coin (coin_to) is worth.
+
+    @params:
+        - coin_from: the coin we swapped from
+        - amount_from: the raw amount we swapped
+        - coin_to: the coin we received
+        - amount_to: the raw amount we received
+        - exit_profit: the profit percentage as a fraction, ie: 0.1
+        - exit_loss: the loss percentage as a negative fraction, ie: -0.1
+
+    @return: the profit price and the loss price. Both are None if nothing was received.
+    """
+
+    if amount_to is None or int(amount_to) <= 0:
+        return None, None
+
+    readable_from:float = divide_raw_balance(amount_from, coin_from)
+    readable_to:float   = divide_raw_balance(amount_to, coin_to)
+
+    exit_profit_price:float = readable_from * (1 + float(exit_profit)) / readable_to
+    exit_loss_price:float   = readable_from * (1 + float(exit_loss)) / readable_to
+
+    return exit_profit_price, exit_loss_price
+
+def format_raw_amount(amount, denom:str) -> str:
+    """
+    Turn a raw amount into a human-readable string, ie: 1500000 uluna is '1.5'.
+    This only uses whole numbers, so it's exact for every precision and much quicker than formatting a float.
+
+    @params:
+        - amount: the raw amount. Fractions of the smallest unit are rounded to the nearest whole unit.
+        - denom: the denom so we can figure out the precision
+
+    @return: the amount with no trailing zeros
+    """
+
+    precision:int = PRECISION_LOOKUP.get(denom, 6)
+    raw:int       = raw_integer(amount)
+
+    whole, fraction = divmod(abs(raw), 10 ** precision)
+
+    result:str = str(whole)
+    if fraction > 0:
+        result += '.' + str(fraction).zfill(precision).rstrip('0')
+
+    if raw < 0:
+        result = '-' + result
+
+    return result
+
+def format_raw_amounts(amounts:list) -> list:
+    """
+    Turn a list of raw amounts into human-readable strings, all at once.
+
+    @params:
+        - amounts: a list of (amount, denom) pairs
+
+    @return: a list of strings, in the same order
+    """
+
+    return [format_raw_amount(amount, denom) for amount, denom in amounts]
+
+def new_thread_event_loop() -> None:
+    """
+    Give the current thread its own event loop.
+    The LCD client runs its requests on an event loop, so every worker thread that creates a client needs one.
+    This is used as the initializer for thread pools.
+
+    @params:
+        - None
+
+    @return: None
+    """
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
 def get_precision(denom:str) -> int:
     """
     Depending on the denomination, return the number of zeros that we need to account for
@@ -205,12 +263,7 @@ def get_precision(denom:str) -> int:
     @return: the number of zeros that this denomination has
     """
 
-    precision:int = 6
-
-    if denom in CHAIN_DATA:
-        precision = CHAIN_DATA[denom]['precision']
-
-    return precision
+    return PRECISION_LOOKUP.get(denom, 6)
     
 def is_percentage(value:str) -> bool:
     """
@@ -245,6 +298,88 @@ def multiply_raw_balance(amount:int, denom:str) -> float:
 
     return result
 
+def raw_integer(amount) -> int:
+    """
+    Convert a raw amount into a whole number of the smallest unit.
+    Amounts from the LCD can be strings or decimals (like rewards), so anything that isn't already an int is rounded.
+
+    @params:
+        - amount: an int, float, string, Decimal, or SDK number
+
+    @return: the amount as an int
+    """
+
+    if isinstance(amount, int):
+        return amount
+
+    return int(to_decimal(amount).to_integral_value(context = AMOUNT_CONTEXT))
+
+def readable_vote(vote_result:dict) -> str:
+    """
+    Convert the result of a governance vote query into a human-readable value.
+
+    @params:
+        - vote_result: the response from terra.gov.vote()
+
+    @return: Yes, No, Abstain, No with veto, or an empty string if there is no vote
+    """
+
+    result:str = ''
+    if vote_result is not None and 'options' in vote_result:
+        vote_value = vote_result['options'][0]['option']
+        if vote_value == 'VOTE_OPTION_YES':
+            result = 'Yes'
+        elif vote_value == 'VOTE_OPTION_ABSTAIN':
+            result = 'Abstain'
+        elif vote_value == 'VOTE_OPTION_NO':
+            result = 'No'
+        elif vote_value == 'VOTE_OPTION_NO_WITH_VETO':
+            result = 'No with veto'
+
+    return result
+
+def refresh_version_cache() -> bool:
+    """
+    Get the latest version number from Github and save it in VERSION_CACHE_FILE_NAME.
+    This runs in a background thread, so it doesn't print anything. If it fails, then the check time is still
+    saved so offline machines don't try on every run.
+
+    @params:
+        - None
+
+    @return: True if the latest version was found
+    """
+
+    version_cache:dict = {}
+    try:
+        with open(VERSION_CACHE_FILE_NAME) as file:
+            version_cache = json.loads(file.read())
+    except:
+        pass
+
+    found:bool = False
+    try:
+        # This is imported here so scripts that never check for updates don't load the HTTP layer
+        from classes.http_client import get_json
+
+        version_cache['version'] = get_json(VERSION_URI, attempts = 1)['version']
+        found = True
+    except:
+        pass
+
+    version_cache['checked'] = time.time()
+
+    try:
+        # Write it somewhere else first so another script never reads half a file
+        with open(VERSION_CACHE_FILE_NAME + '.tmp', 'w') as file:
+            file.write(json.dumps(version_cache))
+
+        os.replace(VERSION_CACHE_FILE_NAME + '.tmp', VERSION_CACHE_FILE_NAME)
+    except:
+        return False
+
+    return found
+
 def strtobool(val:str) -> bool:
     """
     Convert a string representation of truth to true (1) or false (0).
@@ -270,6 +405,40 @@ def strtobool(val:str) -> bool:
         #raise ValueError("invalid truth value %r" % (val,))
         return -1
 
+def to_decimal(amount) -> Decimal:
+    """
+    Convert an amount into an exact Decimal.
+    Floats are converted from their shortest string, so 0.1 becomes Decimal('0.1') and not 0.1000000000000000055...
+
+    @params:
+        - amount: an int, float, string, Decimal, or SDK number
+
+    @return: a Decimal
+    """
+
+    if isinstance(amount, Decimal):
+        return amount
+
+    if isinstance(amount, int):
+        return Decimal(amount)
+
+    return Decimal(str(amount).strip())
+
+def to_raw_amount(amount, denom:str) -> int:
+    """
+    Convert a human-readable amount into the raw amount, ie: '1.5' LUNC is 1500000 uluna.
+    Unlike multiply_raw_balance, this is exact - 0.29 LUNC is always 290000 uluna.
+    Anything smaller than the smallest unit is dropped, the same as int().
+
+    @params:
+        - amount: the human-readable amount, as a string, number, or Decimal
+        - denom: the denom so we can figure out the precision
+
+    @return: the raw amount as an int
+    """
+
+    return int(to_decimal(amount).scaleb(PRECISION_LOOKUP.get(denom, 6), AMOUNT_CONTEXT))
+
 def get_user_choice(question:str, allowed_options:list) -> str:
     """
     Get the user selection for a prompt and convert it to a standard value.
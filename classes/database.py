@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import sqlite3
+import threading
+
+from constants.constants import (
+    DB_FILE_NAME
+)
+
+# One connection is shared by everything in this process
+connection:sqlite3.Connection = None
+connection_lock               = threading.RLock()
+
+def close_connection() -> bool:
+    """
+    Save everything and close the shared connection. This is called automatically when the script finishes.
+
+    @params:
+        - None
+
+    @return: True if there was a connection to close
+    """
+
+    global connection
+
+    with connection_lock:
+        if connection is None:
+            return False
+
+        try:
+            connection.commit()
+            connection.execute('PRAGMA optimize;')
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+        connection = None
+
+    return True
+
+def create_gas_tables(conn:sqlite3.Connection) -> None:
+    """
+    Migration 3: the gas used by previous transactions, so we don't have to simulate every transaction.
+
+    @params:
+        - conn: the connection to upgrade, inside a transaction
+
+    @return: None
+    """
+
+    conn.execute("CREATE TABLE IF NOT EXISTS gas_samples (ID INTEGER PRIMARY KEY AUTOINCREMENT, chain_id TEXT NOT NULL, msg_type TEXT NOT NULL, gas_wanted INTEGER NOT NULL, gas_used INTEGER NOT NULL, gas_adjustment REAL NOT NULL, timestamp INTEGER NOT NULL);")
+    conn.execute("CREATE INDEX IF NOT EXISTS gas_samples_type ON gas_samples (chain_id, msg_type, ID);")
+    conn.execute("CREATE TABLE IF NOT EXISTS gas_estimates (chain_id TEXT NOT NULL, msg_type TEXT NOT NULL, contract TEXT NOT NULL, shape TEXT NOT NULL, gas_used INTEGER NOT NULL, sample_count INTEGER NOT NULL, timestamp INTEGER NOT NULL, PRIMARY KEY (chain_id, msg_type, contract, shape));")
+
+def create_history_tables(conn:sqlite3.Connection) -> None:
+    """
+    Migration 4: the balance and price history that balances.py keeps.
+
+    @params:
+        - conn: the connection to upgrade, inside a transaction
+
+    @return: None
+    """
+
+    conn.execute("CREATE TABLE IF NOT EXISTS balance_latest (wallet_address TEXT NOT NULL, category TEXT NOT NULL, validator TEXT NOT NULL, denom TEXT NOT NULL, amount TEXT NOT NULL, timestamp INTEGER NOT NULL, PRIMARY KEY (wallet_address, category, validator, denom));")
+    conn.execute("CREATE TABLE IF NOT EXISTS balance_history (ID INTEGER PRIMARY KEY AUTOINCREMENT, timestamp INTEGER NOT NULL, wallet_address TEXT NOT NULL, category TEXT NOT NULL, validator TEXT NOT NULL, denom TEXT NOT NULL, amount TEXT NOT NULL);")
+    conn.execute("CREATE INDEX IF NOT EXISTS balance_history_series ON balance_history (wallet_address, denom, category, timestamp);")
+    conn.execute("CREATE TABLE IF NOT EXISTS price_history (timestamp INTEGER NOT NULL, denom TEXT NOT NULL, price REAL NOT NULL, PRIMARY KEY (denom, timestamp));")
+
+def create_ibc_table(conn:sqlite3.Connection) -> None:
+    """
+    Migration 1: the readable names for IBC denoms. get_osmosis_pools.py empties this when it refreshes the pools.
+
+    @params:
+        - conn: the connection to upgrade, inside a transaction
+
+    @return: None
+    """
+
+    conn.execute("CREATE TABLE IF NOT EXISTS ibc_denoms (ID INTEGER PRIMARY KEY AUTOINCREMENT, date_added DATETIME DEFAULT CURRENT_TIMESTAMP, ibc_denom TEXT NOT NULL, readable_denom TEXT NOT NULL);")
+
+def create_trading_table(conn:sqlite3.Connection) -> None:
+    """
+    Migration 2: the trades logged by swaps, with indexed exit prices for the trading bot.
+    Older databases might already have a trades table without the exit prices, so these are added and filled in.
+
+    @params:
+        - conn: the connection to upgrade, inside a transaction
+
+    @return: None
+    """
+
+    # This is imported here because classes.common uses this module to open the database
+    from classes.common import exit_prices
+
+    conn.execute("CREATE TABLE IF NOT EXISTS trades (ID INTEGER PRIMARY KEY AUTOINCREMENT, date_added DATETIME DEFAULT CURRENT_TIMESTAMP, wallet_name TEXT NOT NULL, coin_from TEXT NOT NULL, amount_from INTEGER NOT NULL, price_from REAL NOT NULL, coin_to TEXT NOT NULL, amount_to INTEGER NOT NULL, price_to REAL NOT NULL, fees TEXT NOT NULL, exit_profit REAL NOT NULL, exit_loss REAL NOT NULL, linked_trade_id INTEGER, tx_hash TEXT NOT NULL, status TEXT NOT NULL, exit_profit_price REAL, exit_loss_price REAL);")
+
+    trade_columns:list = [row[1] for row in conn.execute("PRAGMA table_info(trades);").fetchall()]
+    if 'exit_profit_price' not in trade_columns:
+        print ('\n 🗄  Adding exit prices to the trading table...')
+        conn.execute("ALTER TABLE trades ADD COLUMN exit_profit_price REAL;")
+        conn.execute("ALTER TABLE trades ADD COLUMN exit_loss_price REAL;")
+
+        update_trade:str = "UPDATE trades SET exit_profit_price = ?, exit_loss_price = ? WHERE ID = ?;"
+        for row in conn.execute("SELECT ID, coin_from, amount_from, coin_to, amount_to, exit_profit, exit_loss FROM trades;").fetchall():
+            exit_profit_price, exit_loss_price = exit_prices(row[1], row[2], row[3], row[4], row[5], row[6])
+            conn.execute(update_trade, [exit_profit_price, exit_loss_price, row[0]])
+
+    # The trading bot only looks for open trades in a pair that have crossed an exit price
+    conn.execute("CREATE INDEX IF NOT EXISTS trades_exit_profit ON trades (status, coin_to, coin_from, exit_profit_price);")
+    conn.execute("CREATE INDEX IF NOT EXISTS trades_exit_loss ON trades (status, coin_to, coin_from, exit_loss_price);")
+
+def create_wallet_state_table(conn:sqlite3.Connection) -> None:
+    """
+    Migration 5: the last balances, delegations and undelegations we saw for each wallet, with the account sequence at the time.
+
+    @params:
+        - conn: the connection to upgrade, inside a transaction
+
+    @return: None
+    """
+
+    conn.execute("CREATE TABLE IF NOT EXISTS wallet_state (address TEXT PRIMARY KEY, sequence INTEGER NOT NULL, height INTEGER, state TEXT NOT NULL, timestamp INTEGER NOT NULL);")
+
+# The schema changes, in order. The database's user_version is the number of these that have been applied.
+# Add new changes to the end - never change or remove one that has been released.
+MIGRATIONS:list = [
+    create_ibc_table,
+    create_trading_table,
+    create_gas_tables,
+    create_history_tables,
+    create_wallet_state_table
+]
+
+@contextlib.contextmanager
+def database_transaction():
+    """
+    Make some changes as one transaction, ie: with database_transaction() as cursor:
+    Only one thread can be inside a transaction at a time. Everything is saved when the block finishes,
+    or nothing is saved if an exception is raised.
+
+    @params:
+        - None
+
+    @return: a cursor for the 'with' block
+    """
+
+    with connection_lock:
+        conn:sqlite3.Connection = get_connection()
+        cursor:sqlite3.Cursor   = conn.cursor()
+
+        try:
+            yield cursor
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Get the database connection for this process. It's opened (and the schema is brought up to date) the first time it's needed.
+
+    WAL mode lets the scripts read while another process is writing, and synchronous=NORMAL only waits for the disk
+    at checkpoints instead of on every commit, which is still safe in WAL mode.
+
+    @params:
+        - None
+
+    @return: the shared sqlite3 connection
+    """
+
+    global connection
+
+    if connection is not None:
+        return connection
+
+    with connection_lock:
+        if connection is None:
+            # The connection is shared by every thread, so writes go through database_transaction()
+            conn:sqlite3.Connection = sqlite3.connect(DB_FILE_NAME, timeout = 30, check_same_thread = False)
+            conn.execute('PRAGMA journal_mode = WAL;')
+            conn.execute('PRAGMA synchronous = NORMAL;')
+
+            migrate(conn)
+
+            connection = conn
+            atexit.register(close_connection)
+
+    return connection
+
+def get_cursor() -> sqlite3.Cursor:
+    """
+    Get a new cursor on the shared connection, for reading.
+
+    @params:
+        - None
+
+    @return: a sqlite3 cursor
+    """
+
+    return get_connection().cursor()
+
+def migrate(conn:sqlite3.Connection) -> int:
+    """
+    Apply any migrations that this database doesn't have yet.
+    Each one is applied in its own transaction, so a failed migration leaves the database as it was.
+
+    @params:
+        - conn: the connection to upgrade
+
+    @return: the schema version of the database
+    """
+
+    user_version:int = conn.execute('PRAGMA user_version;').fetchone()[0]
+
+    while user_version < len(MIGRATIONS):
+        # Another script might be doing this at the same time, so check again once we have the write lock
+        conn.execute('BEGIN IMMEDIATE;')
+        user_version = conn.execute('PRAGMA user_version;').fetchone()[0]
+
+        if user_version >= len(MIGRATIONS):
+            conn.rollback()
+            break
+
+        try:
+            MIGRATIONS[user_version](conn)
+            conn.execute(f'PRAGMA user_version = {user_version + 1};')
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+
+        user_version += 1
+
+    return user_version
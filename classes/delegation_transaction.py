@@ -9,6 +9,7 @@ from constants.constants import (
 )
 
 from classes.terra_instance import TerraInstance
+from classes.tracing import trace_phase, trace_transaction
 from classes.transaction_core import TransactionCore, TransactionResult
 from classes.wallet import UserWallet
 
@@ -28,6 +29,13 @@ from terra_classic_sdk.core.tx import Tx
 from terra_classic_sdk.exceptions import LCDResponseError
 from terra_classic_sdk.key.mnemonic import MnemonicKey
 
+# The message each action sends, so the gas estimates use the same keys as every other transaction
+ACTION_MESSAGES:dict = {
+    'delegate':   MsgDelegate.__name__,
+    'redelegate': MsgBeginRedelegate.__name__,
+    'undelegate': MsgUndelegate.__name__
+}
+
 class DelegationTransaction(TransactionCore):
 
     def __init__(self, *args, **kwargs):
@@ -67,6 +75,7 @@ class DelegationTransaction(TransactionCore):
 
         return self
     
+    @trace_phase('sign')
     def delegate(self) -> bool:
         """
         Make a delegation with the information we have so far.
@@ -89,7 +98,7 @@ class DelegationTransaction(TransactionCore):
 
             options = CreateTxOptions(
                 fee        = self.fee,
-                gas        = 'auto',
+                gas        = self.gas_limit,
                 gas_prices = self.gas_list,
                 msgs       = [msg],
                 sequence   = self.sequence
@@ -123,6 +132,7 @@ class DelegationTransaction(TransactionCore):
         except:
             return False
         
+    @trace_phase('sign')
     def redelegate(self):
         """
         Redelegate funds from one validator to another.
@@ -146,7 +156,7 @@ class DelegationTransaction(TransactionCore):
 
             options = CreateTxOptions(
                 fee        = self.fee,
-                gas        = 'auto',
+                gas        = self.gas_limit,
                 gas_prices = self.gas_list,
                 msgs       = [msgRedel],
                 sequence   = self.sequence
@@ -180,6 +190,7 @@ class DelegationTransaction(TransactionCore):
         except:
             return False 
     
+    @trace_phase('simulate')
     def simulate(self, action) -> bool:
         """
         Simulate the transaction so we can get the fee details
@@ -196,6 +207,9 @@ class DelegationTransaction(TransactionCore):
         if self.getSequenceNumber() == False:
             return False
                     
+        # Skip the gas simulation if we've done this action enough times already
+        self.gas_limit = self.cachedGasLimit(ACTION_MESSAGES[action.__name__])
+
         # This is a provided function. Depending on the original function, we might be delegating or undelegating
         action()
 
@@ -213,6 +227,7 @@ class DelegationTransaction(TransactionCore):
         else:
             return False
         
+    @trace_phase('sign')
     def undelegate(self):
         """
         Undelegate funds from the provided validator
@@ -235,7 +250,7 @@ class DelegationTransaction(TransactionCore):
 
             options = CreateTxOptions(
                 fee        = self.fee,
-                gas        = 'auto',
+                gas        = self.gas_limit,
                 gas_prices = self.gas_list,
                 msgs       = [msg],
                 sequence   = self.sequence
@@ -269,6 +284,7 @@ class DelegationTransaction(TransactionCore):
         except:
            return False
         
+@trace_transaction('delegate')
 def delegate_to_validator(wallet:UserWallet, validator_address:str, delegation_coin:Coin, deduct_fee:bool = False, silent_mode:bool = False) -> TransactionResult:
     """
     A wrapper function for workflows and wallet management.
@@ -343,6 +359,7 @@ def delegate_to_validator(wallet:UserWallet, validator_address:str, delegation_c
 
     return transaction_result
 
+@trace_transaction('redelegate')
 def switch_validator(wallet:UserWallet, new_validator_address:str, old_validator_address, delegated_coin:Coin, silent_mode:bool = False) -> TransactionResult:
     """
     A wrapper function for workflows and wallet management.
@@ -406,6 +423,7 @@ def switch_validator(wallet:UserWallet, new_validator_address:str, old_validator
 
     return transaction_result
 
+@trace_transaction('undelegate')
 def undelegate_from_validator(wallet:UserWallet, validator_address:str, undelegation_coin:Coin, silent_mode:bool = False) -> TransactionResult:
     """
     A wrapper function for workflows and wallet management.
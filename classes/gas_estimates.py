@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import math
+import time
+
+from sqlite3 import Connection
+
+from constants.constants import (
+    GAS_ADJUSTMENT_MARGIN,
+    GAS_ADJUSTMENT_MAX,
+    GAS_ADJUSTMENT_MIN,
+    GAS_ADJUSTMENT_MIN_SAMPLES,
+    GAS_ADJUSTMENT_PERCENTILE,
+    GAS_ESTIMATE_DECAY,
+    GAS_ESTIMATE_MARGIN,
+    GAS_ESTIMATE_MIN_SAMPLES,
+    GAS_SAMPLE_LIMIT
+)
+
+from classes.database import database_transaction, get_connection
+
+class GasEstimates():
+    """
+    Remember how much gas each kind of transaction actually used, so we don't have to simulate it every time.
+
+    Transactions are grouped by chain, message type, contract and shape (usually the denom being moved).
+    For each group we keep a high-water mark of the gas used: it goes straight up if a transaction uses more,
+    and slowly comes back down if later transactions use less.
+
+    Simulated transactions also keep a sample of the gas they asked for and the gas they actually used,
+    so the gas adjustment for each message type can be based on what the chain really needs.
+    """
+
+    def __init__(self):
+        self.conn:Connection = None
+
+    def create(self) -> GasEstimates:
+        """
+        Use the shared database connection. The tables are created by the database migrations.
+
+        @params:
+            - None
+
+        @return: self
+        """
+
+        self.conn = get_connection()
+
+        return self
+
+    def adjustment(self, chain_id:str, msg_type:str, default:float) -> float:
+        """
+        Work out the gas adjustment for this message type from the recent samples.
+
+        For each sample, the adjustment that would have asked for exactly the gas that was used is
+        gas_used / (gas_wanted / gas_adjustment). We take a high percentile of these and add a margin,
+        so almost every transaction has enough gas without paying for the 3.6x default every time.
+
+        @params:
+            - chain_id: the chain this transaction is on, ie: columbus-5
+            - msg_type: the message type, ie: MsgSend
+            - default: the adjustment to use if there aren't enough samples yet
+
+        @return: the gas adjustment to use
+        """
+
+        sample_query:str = "SELECT gas_wanted, gas_used, gas_adjustment FROM gas_samples WHERE chain_id = ? AND msg_type = ? ORDER BY ID DESC LIMIT ?;"
+
+        ratios:list = []
+        for gas_wanted, gas_used, gas_adjustment in self.conn.execute(sample_query, [chain_id, msg_type, GAS_SAMPLE_LIMIT]).fetchall():
+            if gas_wanted > 0:
+                ratios.append(gas_used * gas_adjustment / gas_wanted)
+
+        if len(ratios) < GAS_ADJUSTMENT_MIN_SAMPLES:
+            return default
+
+        # Nearest-rank percentile
+        ratios.sort()
+        percentile:float = ratios[min(len(ratios) - 1, int(math.ceil(GAS_ADJUSTMENT_PERCENTILE * len(ratios))) - 1)]
+
+        return round(min(GAS_ADJUSTMENT_MAX, max(GAS_ADJUSTMENT_MIN, percentile * (1 + GAS_ADJUSTMENT_MARGIN))), 2)
+
+    def close(self) -> bool:
+        """
+        Finish with the database. The connection is shared with the rest of this process, so it stays open.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        self.conn = None
+
+        return True
+
+    def estimate(self, chain_id:str, msg_type:str, contract:str = '', shape:str = '') -> int:
+        """
+        Get the gas limit we should use for this kind of transaction.
+
+        @params:
+            - chain_id: the chain this transaction is on, ie: columbus-5
+            - msg_type: the message type, ie: MsgSend
+            - contract: the contract address, if this is a contract call
+            - shape: anything else that changes the amount of gas, like the denom being sent
+
+        @return: the gas limit including the safety margin, or None if we haven't seen enough of these transactions yet
+        """
+
+        estimate_query:str = "SELECT gas_used, sample_count FROM gas_estimates WHERE chain_id = ? AND msg_type = ? AND contract = ? AND shape = ?;"
+
+        row = self.conn.execute(estimate_query, [chain_id, msg_type, contract, shape]).fetchone()
+        if row is None or row[1] < GAS_ESTIMATE_MIN_SAMPLES:
+            return None
+
+        return int(math.ceil(row[0] * (1 + GAS_ESTIMATE_MARGIN)))
+
+    def forget(self, chain_id:str, msg_type:str, contract:str = '', shape:str = '') -> bool:
+        """
+        Remove what we know about this kind of transaction, so the next one is simulated again.
+        This is used when a transaction runs out of gas.
+
+        @params:
+            - chain_id: the chain this transaction is on, ie: columbus-5
+            - msg_type: the message type, ie: MsgSend
+            - contract: the contract address, if this is a contract call
+            - shape: anything else that changes the amount of gas, like the denom being sent
+
+        @return: True
+        """
+
+        with database_transaction() as cursor:
+            cursor.execute("DELETE FROM gas_estimates WHERE chain_id = ? AND msg_type = ? AND contract = ? AND shape = ?;", [chain_id, msg_type, contract, shape])
+
+        return True
+
+    def learn(self, chain_id:str, msg_type:str, contract:str, shape:str, gas_used:int) -> int:
+        """
+        Update the high-water mark for this kind of transaction with the gas that a confirmed transaction used.
+
+        @params:
+            - chain_id: the chain this transaction is on, ie: columbus-5
+            - msg_type: the message type, ie: MsgSend
+            - contract: the contract address, if this is a contract call
+            - shape: anything else that changes the amount of gas, like the denom being sent
+            - gas_used: the gas used by the confirmed transaction
+
+        @return: the new high-water mark
+        """
+
+        select_query:str = "SELECT gas_used, sample_count FROM gas_estimates WHERE chain_id = ? AND msg_type = ? AND contract = ? AND shape = ?;"
+        update_query:str = "INSERT OR REPLACE INTO gas_estimates (chain_id, msg_type, contract, shape, gas_used, sample_count, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?);"
+
+        gas_used:int = int(gas_used)
+
+        # Another thread might be learning from the same kind of transaction, so the read and write happen together
+        with database_transaction() as cursor:
+            row = cursor.execute(select_query, [chain_id, msg_type, contract, shape]).fetchone()
+
+            if row is None:
+                high_water:int   = gas_used
+                sample_count:int = 1
+            else:
+                high_water:int   = row[0]
+                sample_count:int = row[1] + 1
+
+                if gas_used > high_water:
+                    high_water = gas_used
+                else:
+                    # Drift back down towards what we're actually using
+                    high_water = int(math.ceil(high_water - ((high_water - gas_used) * GAS_ESTIMATE_DECAY)))
+
+            cursor.execute(update_query, [chain_id, msg_type, contract, shape, high_water, sample_count, int(time.time())])
+
+        return high_water
+
+    def recordSample(self, chain_id:str, msg_type:str, gas_wanted:int, gas_used:int, gas_adjustment:float) -> bool:
+        """
+        Store the gas details of a simulated transaction. Only the most recent samples for each message type are kept.
+
+        @params:
+            - chain_id: the chain this transaction is on, ie: columbus-5
+            - msg_type: the message type, ie: MsgSend
+            - gas_wanted: the gas limit the transaction was signed with
+            - gas_used: the gas the transaction actually used
+            - gas_adjustment: the adjustment that was applied to the simulated gas
+
+        @return: True
+        """
+
+        with database_transaction() as cursor:
+            cursor.execute("INSERT INTO gas_samples (chain_id, msg_type, gas_wanted, gas_used, gas_adjustment, timestamp) VALUES (?, ?, ?, ?, ?, ?);", [chain_id, msg_type, int(gas_wanted), int(gas_used), float(gas_adjustment), int(time.time())])
+            cursor.execute("DELETE FROM gas_samples WHERE chain_id = ? AND msg_type = ? AND ID NOT IN (SELECT ID FROM gas_samples WHERE chain_id = ? AND msg_type = ? ORDER BY ID DESC LIMIT ?);", [chain_id, msg_type, chain_id, msg_type, GAS_SAMPLE_LIMIT])
+
+        return True
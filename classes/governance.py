@@ -5,14 +5,25 @@ from __future__ import annotations
 
 import json
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from classes.common import (
+    coin_list,
+    new_thread_event_loop,
+    readable_vote
+)
+
 from constants.constants import (
     CHAIN_DATA,
+    GOVERNANCE_WORKERS,
     ULUNA,
     USER_ACTION_QUIT,
-    PROPOSAL_STATUS_VOTING_PERIOD
+    PROPOSAL_STATUS_VOTING_PERIOD,
+    VOTE_UNKNOWN
 )
 
 from classes.terra_instance import TerraInstance
+from classes.tracing import trace_phase, trace_transaction
 from classes.transaction_core import TransactionCore, TransactionResult
 from classes.wallet import UserWallet
 
@@ -58,19 +69,22 @@ class Governance(TransactionCore):
 
         return self
     
-    def getUserSingleChoice(self, question:str) -> list[int, int]:
+    def getUserSingleChoice(self, question:str, proposals:list = None, tallies:dict = None) -> list[int, int]:
         """
         Get a single user selection from a list.
         This is a custom function because the options are specific to this list.
 
         @params:
             - question: The text prompting the user
+            - proposals: (optional) the active proposals, if they have already been loaded
+            - tallies: (optional) the tally for each proposal, if they have already been loaded
 
         @return: the proposal ID, and the user answer
         """
 
         # Get the active proposals:
-        proposals:dict = self.proposals()
+        if proposals is None:
+            proposals = self.proposals()
 
         # Get the longest proposal name:
         label_widths:list = []
@@ -83,7 +97,9 @@ class Governance(TransactionCore):
         label_widths.append(len('No with veto'))
         label_widths.append(len('Abstain'))
         
-        tallies:dict = {}
+        if tallies is None:
+            tallies = {}
+
         for proposal in proposals:
             if len(str(proposal['id'])) > label_widths[1]:
                 label_widths[1] = len(str(proposal['id']))
@@ -91,8 +107,9 @@ class Governance(TransactionCore):
                 label_widths[2] = len(str(proposal['title']))
 
             # Go and get the tally results so we don't have to slow the display refresh down
-            self.proposal_id = int(proposal['id'])
-            tallies[proposal['id']] = self.tally()
+            if proposal['id'] not in tallies:
+                self.proposal_id = int(proposal['id'])
+                tallies[proposal['id']] = self.tally()
 
         padding_str:str   = ' ' * 100
         header_string:str = ' Number'
@@ -215,6 +232,35 @@ class Governance(TransactionCore):
 
         return proposal_list
     
+    def walletVote(self, proposal_id:int, wallet_address:str) -> str:
+        """
+        Get the vote that a wallet has made on a proposal.
+        This does not need the wallet to be loaded, so it can be used for any address.
+
+        @params:
+            - proposal_id: the proposal we're interested in
+            - wallet_address: the wallet that might have voted
+
+        @return: a human-readable value of the vote, an empty string if it hasn't voted,
+                 or VOTE_UNKNOWN if the LCD failed and we can't tell
+        """
+
+        try:
+            vote_result:dict = self.terra.gov.vote(int(proposal_id), wallet_address)
+        except LCDResponseError as err:
+            # The LCD returns 'not found' if this wallet hasn't voted yet. Anything else means we don't know.
+            status:int = getattr(err.response, 'status', None)
+            if status == 404 or 'not found' in str(err.message).lower():
+                vote_result:dict = None
+            else:
+                return VOTE_UNKNOWN
+        except Exception:
+            # Timeouts, busy servers and open circuits
+            return VOTE_UNKNOWN
+
+        return readable_vote(vote_result)
+
+    @trace_phase('simulate')
     def simulate(self):
         """
         Simulate a vote so we can get the fee details.
@@ -233,6 +279,9 @@ class Governance(TransactionCore):
 
         if self.getSequenceNumber() == False:
             return False
+
+        # Skip the gas simulation if we've voted enough times already
+        self.gas_limit = self.cachedGasLimit('MsgVote')
         
         # Perform the swap as a simulation, with no fee details
         self.vote()
@@ -288,6 +337,7 @@ class Governance(TransactionCore):
 
         return self
     
+    @trace_phase('sign')
     def vote(self) -> bool:
         """
         Cast the vote with the details provided by the user.
@@ -341,81 +391,167 @@ class Governance(TransactionCore):
 
         return True
     
-def cast_governance_vote(user_wallets:dict, proposal_id:int, user_vote:int, memo:str = '' ) -> dict:
+def cast_governance_vote(user_wallets:dict, proposal_id:int, user_vote:int, memo:str = '', max_workers:int = GOVERNANCE_WORKERS) -> dict:
     """
     A wrapper function for casting governance votes.
-    The wrapper function adds any error messages depending on the results that got returned.
+    Every wallet is an independent account, so the votes are cast in parallel with a limited number of workers.
     
     @params:
       - user_wallets: a dictionary of all the wallets we're voting with
       - proposal_id: the id of the proposal ID we're voting on
       - user_vote: one of the values in the PROPOSAL constant list
       - memo: an optional message to include. Defaults to an empty string.
+      - max_workers: how many wallets can vote at the same time
 
     @returns a dictionary of transaction_result objects (wallet name is the dictionary key)
     """
 
     transaction_results:dict = {}
 
+    if len(user_wallets) == 0:
+        return transaction_results
+
+    print (f'\n 🕐 Casting votes on {len(user_wallets)} wallets, please wait...\n')
+
+    # Each worker thread needs its own event loop for the LCD client it creates
+    with ThreadPoolExecutor(max_workers = min(max_workers, len(user_wallets)), initializer = new_thread_event_loop) as executor:
+        futures:dict = {}
+        for wallet_name in user_wallets:
+            futures[executor.submit(vote_with_wallet, user_wallets[wallet_name], proposal_id, user_vote, memo)] = wallet_name
+
+        for future in as_completed(futures):
+            wallet_name:str = futures[future]
+            try:
+                transaction_result:TransactionResult = future.result()
+            except Exception as err:
+                transaction_result:TransactionResult = TransactionResult()
+                transaction_result.is_error          = True
+                transaction_result.message           = f' 🛎️  The vote transaction on {wallet_name} failed, an error occurred:'
+                transaction_result.log               = err
+
+            transaction_results[wallet_name] = transaction_result
+
+            if transaction_result.is_error == False:
+                print (f' ✅ {len(transaction_results)}/{len(user_wallets)} {wallet_name}')
+            else:
+                print (f' 🛎️  {len(transaction_results)}/{len(user_wallets)} {wallet_name}')
+
+    # Return the results in the same order as the wallets
+    return {wallet_name: transaction_results[wallet_name] for wallet_name in user_wallets}
+
+def show_vote_summary(transaction_results:dict) -> bool:
+    """
+    Show a single table with the result of every vote.
+
+    @params:
+        - transaction_results: the dictionary returned by cast_governance_vote
+
+    @return: True if every vote succeeded
+    """
+
+    label_widths:list = [len('Wallet'), len('Result'), len('Details')]
+    rows:list         = []
+
+    for wallet_name in transaction_results:
+        transaction_result:TransactionResult = transaction_results[wallet_name]
+
+        if transaction_result.is_error == False and transaction_result.broadcast_result is not None:
+            rows.append([wallet_name, 'Voted', transaction_result.broadcast_result.txhash])
+        else:
+            details:str = str(transaction_result.message).strip()
+            if transaction_result.log is not None:
+                details += ' ' + str(transaction_result.log).strip()
+            rows.append([wallet_name, 'Failed', details])
+
+    for row in rows:
+        for column_id in range(len(row)):
+            label_widths[column_id] = max(label_widths[column_id], len(row[column_id]))
+
+    header_string:str     = ' ' + ' | '.join([['Wallet', 'Result', 'Details'][column_id].ljust(label_widths[column_id]) for column_id in range(3)])
+    horizontal_spacer:str = '-' * (len(header_string) + 1)
+
+    print ('\n' + horizontal_spacer)
+    print (header_string)
+    print (horizontal_spacer)
+    for row in rows:
+        print (' ' + ' | '.join([row[column_id].ljust(label_widths[column_id]) for column_id in range(3)]))
+    print (horizontal_spacer + '\n')
+
+    success_count:int = len([row for row in rows if row[1] == 'Voted'])
+    print (f' ✅ {success_count}/{len(rows)} votes were successful.\n')
+
+    return success_count == len(rows)
+
+@trace_transaction('vote')
+def vote_with_wallet(wallet:UserWallet, proposal_id:int, user_vote:int, memo:str = '') -> TransactionResult:
+    """
+    Cast a governance vote with a single wallet.
+    This creates its own governance object (and LCD connection), so it can be run at the same time as other wallets.
+
+    @params:
+      - wallet: the wallet we're voting with
+      - proposal_id: the id of the proposal ID we're voting on
+      - user_vote: one of the values in the PROPOSAL constant list
+      - memo: an optional message to include. Defaults to an empty string.
+
+    @return: a TransactionResult object
+    """
+
     transaction_result:TransactionResult = TransactionResult()
 
-    # Create the basic governance object
+    # Create the governance object for this wallet
     governance:Governance = Governance().create()
 
     # Populate it with the relevant details
     governance.proposal_id = proposal_id
     governance.user_vote   = user_vote
     governance.memo        = memo
+    governance.silent_mode = True
 
-    for wallet_name in user_wallets:
-
-        wallet:UserWallet = user_wallets[wallet_name]
-        wallet.getBalances()
+    governance.update(wallet.seed)
 
-        governance.balances = wallet.balances
-        governance.update(wallet.seed)
+    # Get the balances with this object's own connection, so we don't share it with other threads
+    balances, pagination = governance.terra.bank.balance(address = governance.address)
+    governance.balances  = coin_list(balances, {})
 
-        governance.simulate()
-        governance_result = governance.vote()
+    governance.simulate()
+    governance_result = governance.vote()
 
-        if governance_result == True:
-            transaction_result = governance.broadcast()
+    if governance_result == True:
+        transaction_result = governance.broadcast()
 
-            if transaction_result.broadcast_result is not None and transaction_result.broadcast_result.code == 32:
-                while True:
-                    print (' 🛎️  Boosting sequence number and trying again...')
-
-                    governance.sequence = governance.sequence + 1
-                    
-                    governance.simulate()
-                    governance.send()
+        if transaction_result.broadcast_result is not None and transaction_result.broadcast_result.code == 32:
+            while True:
+                governance.sequence = governance.sequence + 1
+                
+                governance.simulate()
+                governance.vote()
 
-                    transaction_result = governance.broadcast()
+                transaction_result = governance.broadcast()
 
-                    if transaction_result is None:
-                        break
+                if transaction_result is None or transaction_result.broadcast_result is None:
+                    break
 
-                    # Code 32 = account sequence mismatch
-                    if transaction_result.broadcast_result.code != 32:
-                        break
+                # Code 32 = account sequence mismatch
+                if transaction_result.broadcast_result.code != 32:
+                    break
 
-            if transaction_result.broadcast_result is None or transaction_result.broadcast_result.is_tx_error():
-                if transaction_result.broadcast_result is None:
-                    transaction_result.message = ' 🛎️  The vote transaction on {wallet.name} failed, no broadcast object was returned.'
+        if transaction_result.broadcast_result is None or transaction_result.broadcast_result.is_tx_error():
+            transaction_result.is_error = True
+            if transaction_result.broadcast_result is None:
+                transaction_result.message = f' 🛎️  The vote transaction on {wallet.name} failed, no broadcast object was returned.'
+            else:
+                if transaction_result.broadcast_result.raw_log is not None:
+                    transaction_result.message = f' 🛎️ The governance vote on {wallet.name} failed, an error occurred:'
+                    transaction_result.code    = f' 🛎️ Error code {transaction_result.broadcast_result.code}'
+                    transaction_result.log     = f' 🛎️ {transaction_result.broadcast_result.raw_log}'
                 else:
-                    if transaction_result.broadcast_result.raw_log is not None:
-                        transaction_result.message = f' 🛎️ The governance vote on {wallet.name} failed, an error occurred:'
-                        transaction_result.code    = f' 🛎️ Error code {transaction_result.broadcast_result.code}'
-                        transaction_result.log     = f' 🛎️ {transaction_result.broadcast_result.raw_log}'
-                    else:
-                        transaction_result.message = f' 🛎️ No broadcast log on {wallet.name} was available.'
-        else:
-            transaction_result.message = f' 🛎️ The vote transaction on {wallet.name} could not be completed'
-
-        # Give this a label:
-        transaction_result.label = f'Vote successful on the {wallet.name} wallet!'
+                    transaction_result.message = f' 🛎️ No broadcast log on {wallet.name} was available.'
+    else:
+        transaction_result.is_error = True
+        transaction_result.message  = f' 🛎️ The vote transaction on {wallet.name} could not be completed'
 
-        # Add this result to the returned dictionary
-        transaction_results[wallet_name] = transaction_result
+    # Give this a label:
+    transaction_result.label = f'Vote successful on the {wallet.name} wallet!'
 
-    return transaction_results
+    return transaction_result
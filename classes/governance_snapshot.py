@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from classes.common import (
+    new_thread_event_loop
+)
+
+from constants.constants import (
+    GOVERNANCE_CACHE_TTL,
+    GOVERNANCE_WORKERS
+)
+
+from classes.governance import Governance
+from classes.wallet import UserWallet
+
+# Snapshots are shared by everything in this process until they expire
+cached_snapshots:dict = {}
+
+# Each worker thread keeps its own governance object (and LCD connection)
+thread_data = threading.local()
+
+def thread_governance() -> Governance:
+    """
+    Get the governance object for the current worker thread, creating it if necessary.
+
+    @params:
+        - None
+
+    @return: a governance object that only this thread uses
+    """
+
+    if getattr(thread_data, 'governance', None) is None:
+        thread_data.governance = Governance().create()
+
+    return thread_data.governance
+
+def fetch_tally(proposal_id:int) -> dict:
+    """
+    Get the tally for one proposal, using this thread's connection.
+
+    @params:
+        - proposal_id: the proposal we want the tally for
+
+    @return: a dictionary of the different vote types and percentage vote for each
+    """
+
+    governance:Governance  = thread_governance()
+    governance.proposal_id = int(proposal_id)
+
+    return governance.tally()
+
+def fetch_vote(proposal_id:int, wallet_address:str) -> str:
+    """
+    Get the vote that a wallet made on a proposal, using this thread's connection.
+
+    @params:
+        - proposal_id: the proposal we're interested in
+        - wallet_address: the wallet that might have voted
+
+    @return: a human-readable value of the vote, an empty string if it hasn't voted, or VOTE_UNKNOWN
+    """
+
+    return thread_governance().walletVote(proposal_id, wallet_address)
+
+class GovernanceSnapshot():
+    """
+    Every active proposal, its tally, and the vote from every wallet, loaded once and cached for a short time.
+    """
+
+    def __init__(self):
+        self.created:float  = None
+        self.proposals:list = []
+        self.tallies:dict   = {}
+        self.votes:dict     = {}
+        self.wallets:dict   = {}
+
+    def create(self, user_wallets:dict, refresh:bool = False) -> GovernanceSnapshot:
+        """
+        Load the proposals, tallies and votes, or reuse a recent snapshot for the same wallets.
+
+        @params:
+            - user_wallets: the wallets we want the votes for
+            - refresh: if True, then always go back to the network
+
+        @return: self
+        """
+
+        cache_key:tuple = tuple(sorted(user_wallets.keys()))
+
+        if refresh == False and cache_key in cached_snapshots:
+            cached:GovernanceSnapshot = cached_snapshots[cache_key]
+            if time.time() - cached.created < GOVERNANCE_CACHE_TTL:
+                self.created   = cached.created
+                self.proposals = cached.proposals
+                self.tallies   = cached.tallies
+                self.votes     = cached.votes
+                self.wallets   = user_wallets
+
+                return self
+
+        self.wallets = user_wallets
+        self.load()
+
+        cached_snapshots[cache_key] = self
+
+        return self
+
+    def load(self) -> bool:
+        """
+        Get the active proposals, then get every tally and every wallet vote at the same time.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        self.proposals = Governance().create().proposals()
+        self.tallies   = {}
+        self.votes     = {}
+
+        with ThreadPoolExecutor(max_workers = GOVERNANCE_WORKERS, initializer = new_thread_event_loop) as executor:
+            tally_futures:dict = {}
+            vote_futures:dict  = {}
+
+            for proposal in self.proposals:
+                proposal_id = proposal['id']
+                tally_futures[proposal_id] = executor.submit(fetch_tally, proposal_id)
+
+                for wallet_name in self.wallets:
+                    wallet:UserWallet = self.wallets[wallet_name]
+                    vote_futures[(proposal_id, wallet_name)] = executor.submit(fetch_vote, proposal_id, wallet.address)
+
+            for proposal_id in tally_futures:
+                self.tallies[proposal_id] = tally_futures[proposal_id].result()
+
+            for proposal_id, wallet_name in vote_futures:
+                if proposal_id not in self.votes:
+                    self.votes[proposal_id] = {}
+                self.votes[proposal_id][wallet_name] = vote_futures[(proposal_id, wallet_name)].result()
+
+        self.created = time.time()
+
+        return True
+
+    def matrix(self) -> dict:
+        """
+        Return the votes as a proposals x wallets matrix.
+
+        @params:
+            - None
+
+        @return: a dictionary of {proposal id: {wallet name: vote}}
+        """
+
+        return self.votes
+
+    def showMatrix(self) -> bool:
+        """
+        Print a table of every wallet and its vote on each active proposal.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        label_widths:list = [len('Wallet name')]
+        for wallet_name in self.wallets:
+            label_widths[0] = max(label_widths[0], len(wallet_name))
+
+        for proposal in self.proposals:
+            width:int = len(str(proposal['id']))
+            for wallet_name in self.wallets:
+                width = max(width, len(self.votes[proposal['id']][wallet_name]))
+            label_widths.append(max(width, len('-')))
+
+        header_string:str = ' ' + 'Wallet name'.ljust(label_widths[0])
+        for proposal_id in range(len(self.proposals)):
+            header_string += ' | ' + str(self.proposals[proposal_id]['id']).ljust(label_widths[proposal_id + 1])
+
+        horizontal_spacer:str = '-' * (len(header_string) + 1)
+
+        print (horizontal_spacer)
+        print (header_string)
+        print (horizontal_spacer)
+
+        for wallet_name in self.wallets:
+            row:str = ' ' + wallet_name.ljust(label_widths[0])
+            for proposal_id in range(len(self.proposals)):
+                vote:str = self.votes[self.proposals[proposal_id]['id']][wallet_name]
+                if vote == '':
+                    vote = '-'
+                row += ' | ' + vote.ljust(label_widths[proposal_id + 1])
+            print (row)
+
+        print (horizontal_spacer + '\n')
+
+        return True
+
+    def unvotedWallets(self, proposal_id:int) -> dict:
+        """
+        Find the wallets that haven't voted on this proposal yet.
+        Wallets where the vote couldn't be loaded (VOTE_UNKNOWN) are left out, since they might have voted already.
+
+        @params:
+            - proposal_id: the proposal we're interested in
+
+        @return: a dictionary of wallets, in the same format as user_wallets
+        """
+
+        result:dict = {}
+        if proposal_id in self.votes:
+            for wallet_name in self.votes[proposal_id]:
+                if self.votes[proposal_id][wallet_name] == '':
+                    result[wallet_name] = self.wallets[wallet_name]
+
+        return result
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import random
+import sys
+import threading
+import time
+
+from urllib.parse import urlparse
+
+from constants.constants import (
+    BUSY_RETRY_COUNT,
+    CIRCUIT_BREAKER_COOLDOWN,
+    CIRCUIT_BREAKER_FAILURES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_RETRY_BUDGET
+)
+
+from classes.instrumentation import install_http_timings
+from classes.rate_limiter import retry_after, slow_down, wait_for_rate_limit
+
+# One session is shared by every thread, so connections to each host are kept open and reused
+http_session:requests.Session = None
+session_lock                  = threading.Lock()
+
+# The retry budget and circuit breaker for each host
+host_states:dict = {}
+states_lock      = threading.Lock()
+
+class RequestError(Exception):
+    """
+    A request that failed, after any retries that were allowed.
+    """
+
+class CircuitOpenError(RequestError):
+    """
+    A request that wasn't made, because the host has failed too many times in a row.
+    """
+
+def backoff_delay(attempt:int) -> float:
+    """
+    How long to wait before the next attempt. The delay doubles each time, and a random amount of it is used
+    so that many wallets retrying at the same time don't all hit the server at the same moment.
+
+    @params:
+        - attempt: how many attempts have failed so far, starting at 1
+
+    @return: the number of seconds to wait
+    """
+
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** (attempt - 1))))
+
+def call_with_retries(host:str, function, *args, attempts:int = BUSY_RETRY_COUNT, silent:bool = True, **kwargs):
+    """
+    Call a function that makes a request (like an LCD client method), and retry it if it fails.
+    Retries use an exponential backoff with jitter, and stop early if the retry budget or circuit breaker for this host says so.
+    If the server sends a Retry-After header, then we wait at least that long, and so does every other request to this host.
+
+    @params:
+        - host: the server this request goes to, ie: terra-classic-lcd.publicnode.com
+        - function: the function to call
+        - *args, **kwargs: passed to the function
+        - attempts: the most number of times to try
+        - silent: if False, then each failed attempt is printed
+
+    @return: whatever the function returns. If every attempt fails, then the last error is raised.
+    """
+
+    state:HostState = host_state(host)
+    attempt:int     = 0
+
+    while True:
+        attempt += 1
+
+        if not state.allowRequest():
+            raise CircuitOpenError(f'{host} has failed {CIRCUIT_BREAKER_FAILURES} times in a row, so it is being left alone for {CIRCUIT_BREAKER_COOLDOWN} seconds.')
+
+        try:
+            result = function(*args, **kwargs)
+        except Exception as err:
+            if not is_retryable(err):
+                if response_status(err) is not None:
+                    # The server answered, it just didn't like the request
+                    state.recordSuccess()
+                else:
+                    # This is our own problem (like a parsing error), so it says nothing about the host
+                    state.cancelTrial()
+
+                raise
+
+            state.recordFailure()
+
+            wait_time:float = retry_after(err)
+            if wait_time is not None:
+                slow_down(host, wait_time)
+
+            if attempt >= attempts or not state.allowRetry():
+                raise
+
+            if silent == False:
+                print (f'    {err}')
+                print (f'    The LCD is busy - trying again {attempt}/{attempts}')
+
+            time.sleep(max(backoff_delay(attempt), wait_time or 0))
+            continue
+
+        state.recordSuccess()
+
+        return result
+
+def get_json(url:str, params:dict = None, attempts:int = BUSY_RETRY_COUNT):
+    """
+    Make a GET request with the shared session, and return the JSON result.
+    The request waits for the rate limit of this host first.
+
+    @params:
+        - url: the full address, ie: https://api.coingecko.com/api/v3/simple/price
+        - params: any query string values
+        - attempts: the most number of times to try
+
+    @return: the decoded JSON. If the request fails, then a RequestError is raised.
+    """
+
+    host:str = urlparse(url).netloc
+
+    def make_request():
+        wait_for_rate_limit(host)
+
+        response:requests.Response = get_session().get(url, params = params, timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        response.raise_for_status()
+
+        return response.json()
+
+    try:
+        return call_with_retries(host, make_request, attempts = attempts)
+    except RequestError:
+        raise
+    except Exception as err:
+        raise RequestError(f'{url} could not be loaded: {err}') from err
+
+def get_session() -> requests.Session:
+    """
+    Get the shared HTTP session. It's created the first time it's needed.
+    requests is only imported here, so scripts that don't make any HTTP requests (or haven't yet) don't wait for it to load.
+
+    @params:
+        - None
+
+    @return: a requests.Session object
+    """
+
+    global http_session
+
+    install_http_timings()
+
+    with session_lock:
+        if http_session is None:
+            import requests
+
+            from requests.adapters import HTTPAdapter
+
+            http_session = requests.Session()
+
+            # Keep enough connections open for the wallets that run at the same time
+            adapter = HTTPAdapter(pool_connections = 10, pool_maxsize = 20)
+            http_session.mount('http://', adapter)
+            http_session.mount('https://', adapter)
+
+    return http_session
+
+def host_state(host:str) -> HostState:
+    """
+    Get the retry budget and circuit breaker for a host.
+
+    @params:
+        - host: the server name
+
+    @return: a HostState object
+    """
+
+    with states_lock:
+        if host not in host_states:
+            host_states[host] = HostState().create(host)
+
+        return host_states[host]
+
+def is_retryable(err:Exception) -> bool:
+    """
+    Check if a failed request is worth trying again.
+    Connection problems, timeouts, rate limits (429) and server errors (5xx) are retried.
+    Other HTTP errors (like 404) will just fail again, so they are not.
+    Anything else (like a KeyError while reading the result) is a bug on our side, so it isn't retried either.
+
+    @params:
+        - err: the exception that the request raised
+
+    @return: True if it should be retried
+    """
+
+    status:int = response_status(err)
+
+    if status is None:
+        return is_transport_error(err)
+
+    return status == 429 or status >= 500
+
+def is_transport_error(err:Exception) -> bool:
+    """
+    Check if a request failed because the server couldn't be reached, or didn't answer in time.
+    requests and aiohttp are only checked if they've been loaded - if they haven't, then they can't have raised this error.
+
+    @params:
+        - err: the exception that the request raised
+
+    @return: True if this was a connection problem or a timeout
+    """
+
+    if isinstance(err, (ConnectionError, TimeoutError)):
+        return True
+
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is not None and isinstance(err, asyncio.TimeoutError):
+        return True
+
+    requests = sys.modules.get('requests')
+    if requests is not None and isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+
+    aiohttp = sys.modules.get('aiohttp')
+    if aiohttp is not None and isinstance(err, aiohttp.ClientError):
+        return True
+
+    return False
+
+def lcd_host(terra) -> str:
+    """
+    Get the host name for an LCD client, so LCD calls share a retry budget and circuit breaker.
+
+    @params:
+        - terra: an LCDClient object
+
+    @return: the host name
+    """
+
+    return urlparse(str(terra.url)).netloc
+
+def response_status(err:Exception) -> int:
+    """
+    Get the HTTP status code that came with a failed request.
+
+    @params:
+        - err: the exception that the request raised
+
+    @return: the status code, or None if the server didn't answer
+    """
+
+    status:int = None
+
+    response = getattr(err, 'response', None)
+    if response is not None:
+        # requests uses status_code, and the LCD client (aiohttp) uses status
+        status = getattr(response, 'status_code', getattr(response, 'status', None))
+    elif isinstance(getattr(err, 'status', None), int):
+        # aiohttp errors that were raised before the LCD client could wrap them
+        status = err.status
+
+    if status is None:
+        return None
+
+    return int(status)
+
+class HostState():
+    """
+    The retry budget and circuit breaker for one host.
+
+    Every request adds a fraction (HTTP_RETRY_BUDGET) of a retry to the budget, and every retry uses one up,
+    so retries can't be more than that fraction of the traffic to a host once the starting allowance is gone.
+
+    After CIRCUIT_BREAKER_FAILURES failures in a row the circuit opens, and requests fail straight away
+    until CIRCUIT_BREAKER_COOLDOWN seconds have passed. Then one request is let through to see if the host has recovered.
+    """
+
+    def __init__(self):
+        self.failures:int       = 0
+        self.host:str           = None
+        self.lock               = threading.Lock()
+        self.opened_at:float    = None
+        self.retry_tokens:float = BUSY_RETRY_COUNT
+        self.trial_running:bool = False
+
+    def create(self, host:str) -> HostState:
+        """
+        Create the state for a host.
+
+        @params:
+            - host: the server name
+
+        @return: self
+        """
+
+        self.host = host
+
+        return self
+
+    def allowRequest(self) -> bool:
+        """
+        Check if a request can be made to this host.
+
+        @params:
+            - None
+
+        @return: True if the circuit is closed, or if this is the trial request after the cooldown
+        """
+
+        with self.lock:
+            self.retry_tokens = min(BUSY_RETRY_COUNT, self.retry_tokens + HTTP_RETRY_BUDGET)
+
+            if self.opened_at is None:
+                return True
+
+            if time.time() - self.opened_at >= CIRCUIT_BREAKER_COOLDOWN and self.trial_running == False:
+                self.trial_running = True
+                return True
+
+            return False
+
+    def allowRetry(self) -> bool:
+        """
+        Use up one retry from the budget, if there is one left.
+
+        @params:
+            - None
+
+        @return: True if the request can be retried
+        """
+
+        with self.lock:
+            if self.opened_at is not None or self.retry_tokens < 1:
+                return False
+
+            self.retry_tokens -= 1
+
+            return True
+
+    def cancelTrial(self) -> bool:
+        """
+        The trial request after the cooldown didn't reach the host, so let the next request try instead.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        with self.lock:
+            self.trial_running = False
+
+        return True
+
+    def recordFailure(self) -> bool:
+        """
+        Count a failed request, and open the circuit if there have been too many in a row.
+
+        @params:
+            - None
+
+        @return: True if the circuit is now open
+        """
+
+        with self.lock:
+            self.failures     += 1
+            self.trial_running = False
+
+            if self.failures >= CIRCUIT_BREAKER_FAILURES:
+                self.opened_at = time.time()
+
+            return self.opened_at is not None
+
+    def recordSuccess(self) -> bool:
+        """
+        The host answered, so close the circuit.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        with self.lock:
+            self.failures      = 0
+            self.opened_at     = None
+            self.trial_running = False
+
+        return True
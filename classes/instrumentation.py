@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import functools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from urllib.parse import urlparse
+
+from constants.constants import (
+    REQUEST_METRICS_FILE,
+    REQUEST_TIMING_SAMPLE_SIZE,
+    SHOW_REQUEST_TIMINGS
+)
+
+# Path segments that change on every call are replaced so the same endpoint is grouped together
+ADDRESS_PATTERN = re.compile(r'^[a-z]{2,12}1[02-9ac-hj-np-z]{38,}$')
+HASH_PATTERN    = re.compile(r'^[0-9A-Fa-f]{64}$')
+NUMBER_PATTERN  = re.compile(r'^[0-9]+$')
+
+# Every request made by this process
+request_timings:RequestTimings = None
+timings_lock                   = threading.Lock()
+http_installed:bool            = False
+
+# The last request that failed on each thread, so we can tell when it's being retried
+thread_data = threading.local()
+
+def install_http_timings() -> bool:
+    """
+    Record every HTTP request, by wrapping the requests library.
+    This is called by classes/http_client.py when it first needs a session, so requests isn't imported
+    until a script actually makes an HTTP request. Nothing happens unless install_request_timings() has been called.
+
+    @params:
+        - None
+
+    @return: True if the requests library was wrapped by this call
+    """
+
+    global http_installed
+
+    if http_installed == True:
+        return False
+
+    with timings_lock:
+        if request_timings is None or http_installed == True:
+            return False
+
+        import requests
+
+        requests.Session.request = wrap_http_call(requests.Session.request)
+        http_installed           = True
+
+    return True
+
+def install_request_timings() -> RequestTimings:
+    """
+    Start recording every LCD and HTTP request made by this process.
+    LCD calls are recorded by wrapping the LCD client, and everything else (Coingecko, cosmos.directory, Github)
+    is recorded by wrapping the requests library once it is first used. It's safe to call this more than once.
+
+    @params:
+        - None
+
+    @return: the RequestTimings object that the requests are recorded in
+    """
+
+    global request_timings
+
+    with timings_lock:
+        if request_timings is not None:
+            return request_timings
+
+        from terra_classic_sdk.client.lcd.lcdclient import AsyncLCDClient
+
+        request_timings      = RequestTimings()
+        AsyncLCDClient._get  = wrap_lcd_call(AsyncLCDClient._get, 'GET')
+        AsyncLCDClient._post = wrap_lcd_call(AsyncLCDClient._post, 'POST')
+
+    return request_timings
+
+def normalise_endpoint(path:str) -> str:
+    """
+    Replace the addresses, hashes, numbers and query payloads in a path with placeholders.
+
+    @params:
+        - path: the request path, ie: /cosmos/bank/v1beta1/balances/terra1abc...
+
+    @return: the endpoint, ie: /cosmos/bank/v1beta1/balances/{address}
+    """
+
+    segments:list = []
+    for segment in path.split('?')[0].split('/'):
+        if ADDRESS_PATTERN.match(segment):
+            segment = '{address}'
+        elif HASH_PATTERN.match(segment):
+            segment = '{hash}'
+        elif NUMBER_PATTERN.match(segment):
+            segment = '{id}'
+        elif len(segment) > 40:
+            # Base64 contract queries and anything else that's too long to be a real path segment
+            segment = '{value}'
+
+        segments.append(segment)
+
+    return '/'.join(segments)
+
+def readable_bytes(size:int) -> str:
+    """
+    Show a number of bytes in KB or MB if it's big enough.
+
+    @params:
+        - size: the number of bytes
+
+    @return: a readable string, ie: 12.3KB
+    """
+
+    if size >= 1024 * 1024:
+        return f'{size / (1024 * 1024):.1f}MB'
+    if size >= 1024:
+        return f'{size / 1024:.1f}KB'
+
+    return f'{size}B'
+
+def record_request(host:str, method:str, path:str, duration:float, response_bytes:int, is_error:bool) -> bool:
+    """
+    Add a finished request to the timings. If the last request on this thread failed on the same endpoint, then this is a retry.
+
+    @params:
+        - host: the server the request was made to
+        - method: GET or POST
+        - path: the request path, before it is normalised
+        - duration: how long the request took, in seconds
+        - response_bytes: the size of the response
+        - is_error: True if the request failed
+
+    @return: True
+    """
+
+    endpoint:str = normalise_endpoint(path)
+    key:tuple    = (host, method, endpoint)
+
+    is_retry:bool = getattr(thread_data, 'last_failed', None) == key
+    thread_data.last_failed = key if is_error else None
+
+    request_timings.record(key, duration, response_bytes, is_error, is_retry)
+
+    return True
+
+def response_size(result) -> int:
+    """
+    Work out roughly how big an LCD response was. The LCD client only gives us the decoded result, so it's measured as JSON.
+
+    @params:
+        - result: the decoded response
+
+    @return: the size in bytes
+    """
+
+    try:
+        return len(json.dumps(result, default = str))
+    except Exception:
+        return 0
+
+def save_request_metrics() -> bool:
+    """
+    Save the Prometheus metrics file if REQUEST_METRICS_FILE is set.
+    The workflow daemon calls this after every run so the file stays up to date.
+
+    @params:
+        - None
+
+    @return: True if the file was saved
+    """
+
+    if request_timings is None or REQUEST_METRICS_FILE is None:
+        return False
+
+    return request_timings.saveMetrics(REQUEST_METRICS_FILE)
+
+def show_request_timings() -> bool:
+    """
+    Show the timings table and save the metrics file, depending on what the constants file asks for.
+    This is called at the end of workflows.py and balances.py.
+
+    @params:
+        - None
+
+    @return: True if anything was recorded
+    """
+
+    if request_timings is None or len(request_timings.endpoints) == 0:
+        return False
+
+    if SHOW_REQUEST_TIMINGS == True:
+        print ('')
+        for line in request_timings.render():
+            print (line)
+
+    save_request_metrics()
+
+    return True
+
+def wrap_http_call(function):
+    """
+    Wrap requests.Session.request so every HTTP call is timed. requests.get() and the shared session in classes/http_client.py both use this.
+
+    @params:
+        - function: the original method
+
+    @return: the wrapped method
+    """
+
+    @functools.wraps(function)
+    def timed_call(self, method:str, url:str, *args, **kwargs):
+        parsed_url       = urlparse(url)
+        start_time:float = time.perf_counter()
+
+        try:
+            response:requests.Response = function(self, method, url, *args, **kwargs)
+        except Exception:
+            record_request(parsed_url.netloc, method.upper(), parsed_url.path, time.perf_counter() - start_time, 0, True)
+            raise
+
+        record_request(parsed_url.netloc, method.upper(), parsed_url.path, time.perf_counter() - start_time, len(response.content or b''), response.status_code >= 400)
+
+        return response
+
+    return timed_call
+
+def wrap_lcd_call(function, method:str):
+    """
+    Wrap AsyncLCDClient._get or _post so every call is timed.
+    The synchronous LCDClient uses the same methods, so this covers both.
+
+    @params:
+        - function: the original method
+        - method: GET or POST
+
+    @return: the wrapped method
+    """
+
+    @functools.wraps(function)
+    async def timed_call(self, endpoint:str, *args, **kwargs):
+        host:str         = urlparse(self.url).netloc
+        start_time:float = time.perf_counter()
+
+        try:
+            result = await function(self, endpoint, *args, **kwargs)
+        except Exception:
+            record_request(host, method, endpoint, time.perf_counter() - start_time, 0, True)
+            raise
+
+        record_request(host, method, endpoint, time.perf_counter() - start_time, response_size(result), False)
+
+        return result
+
+    return timed_call
+
+class RequestTimings():
+    """
+    The calls, errors, retries, time and bytes for every endpoint that this process has used.
+
+    The workflow daemon keeps these for as long as it runs, so each endpoint only keeps its totals and the slowest time,
+    plus a random sample of up to REQUEST_TIMING_SAMPLE_SIZE durations for the P95.
+    """
+
+    def __init__(self):
+        self.endpoints:dict = {}
+        self.lock           = threading.Lock()
+        self.started:float  = time.time()
+
+    def metrics(self) -> str:
+        """
+        Return the totals in the Prometheus text format, so they can be picked up by the node exporter textfile collector.
+
+        @params:
+            - None
+
+        @return: the metrics as a string
+        """
+
+        lines:list = []
+        for name, metric_type, description in [
+            ('utility_scripts_request_duration_seconds', 'summary', 'Time spent waiting for LCD and HTTP requests.'),
+            ('utility_scripts_request_errors_total', 'counter', 'LCD and HTTP requests that failed.'),
+            ('utility_scripts_request_retries_total', 'counter', 'LCD and HTTP requests that repeated a request that had just failed.'),
+            ('utility_scripts_response_bytes_total', 'counter', 'The size of every LCD and HTTP response.')
+        ]:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+            for host, method, endpoint in sorted(self.endpoints):
+                values:dict = self.endpoints[(host, method, endpoint)]
+                labels:str  = f'host="{host}",method="{method}",endpoint="{endpoint}"'
+
+                if metric_type == 'summary':
+                    lines.append(f'{name}_sum{{{labels}}} {values["total"]:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {values["calls"]}')
+                elif name.endswith('errors_total'):
+                    lines.append(f'{name}{{{labels}}} {values["errors"]}')
+                elif name.endswith('retries_total'):
+                    lines.append(f'{name}{{{labels}}} {values["retries"]}')
+                else:
+                    lines.append(f'{name}{{{labels}}} {values["bytes"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def record(self, key:tuple, duration:float, response_bytes:int, is_error:bool, is_retry:bool) -> bool:
+        """
+        Add a request to the totals for its endpoint.
+
+        @params:
+            - key: a (host, method, endpoint) tuple
+            - duration: how long the request took, in seconds
+            - response_bytes: the size of the response
+            - is_error: True if the request failed
+            - is_retry: True if this request is repeating one that just failed
+
+        @return: True
+        """
+
+        with self.lock:
+            if key not in self.endpoints:
+                self.endpoints[key] = {'calls': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'max': 0.0, 'samples': [], 'total': 0.0}
+
+            endpoint:dict = self.endpoints[key]
+            endpoint['calls'] += 1
+            endpoint['bytes'] += int(response_bytes)
+            endpoint['max']    = max(endpoint['max'], duration)
+            endpoint['total'] += duration
+
+            # Reservoir sampling: every request has the same chance of being in the sample
+            if len(endpoint['samples']) < REQUEST_TIMING_SAMPLE_SIZE:
+                endpoint['samples'].append(duration)
+            else:
+                sample_id:int = random.randrange(endpoint['calls'])
+                if sample_id < REQUEST_TIMING_SAMPLE_SIZE:
+                    endpoint['samples'][sample_id] = duration
+
+            if is_error == True:
+                endpoint['errors'] += 1
+            if is_retry == True:
+                endpoint['retries'] += 1
+
+        return True
+
+    def render(self) -> list:
+        """
+        Build a table of every endpoint, with the slowest (by total time) at the top.
+
+        @params:
+            - None
+
+        @return: a list of lines to print
+        """
+
+        columns:list      = ['Host', 'Method', 'Endpoint', 'Calls', 'Errors', 'Retries', 'Total', 'Mean', 'P95', 'Max', 'Bytes']
+        label_widths:list = [len(column) for column in columns]
+        rows:list         = []
+
+        with self.lock:
+            endpoints:list = [(key, dict(values, samples = sorted(values['samples']))) for key, values in self.endpoints.items()]
+
+        endpoints.sort(key = lambda item: item[1]['total'], reverse = True)
+
+        total_calls:int  = 0
+        total_time:float = 0
+        for (host, method, endpoint), values in endpoints:
+            samples:list = values['samples']
+            total_calls += values['calls']
+            total_time  += values['total']
+
+            row:list = [
+                host,
+                method,
+                endpoint,
+                str(values['calls']),
+                str(values['errors']),
+                str(values['retries']),
+                f'{values["total"]:.2f}s',
+                f'{values["total"] / values["calls"] * 1000:.0f}ms',
+                f'{samples[min(len(samples) - 1, int(math.ceil(0.95 * len(samples))) - 1)] * 1000:.0f}ms',
+                f'{values["max"] * 1000:.0f}ms',
+                readable_bytes(values['bytes'])
+            ]
+            rows.append(row)
+
+            for column in range(len(row)):
+                label_widths[column] = max(label_widths[column], len(row[column]))
+
+        header_string:str     = ' ' + ' | '.join([label.ljust(label_widths[column]) for column, label in enumerate(columns)])
+        horizontal_spacer:str = '-' * (len(header_string) + 1)
+
+        lines:list = [horizontal_spacer, header_string, horizontal_spacer]
+        for row in rows:
+            lines.append(' ' + ' | '.join([value.ljust(label_widths[column]) for column, value in enumerate(row)]))
+        lines.append(horizontal_spacer)
+        lines.append(f' {total_calls} requests took {total_time:.2f}s in total, over {time.time() - self.started:.2f}s of running time.\n')
+
+        return lines
+
+    def saveMetrics(self, file_name:str) -> bool:
+        """
+        Write the Prometheus metrics to a file. It's written to a temporary file first so a collector never sees half of it.
+
+        @params:
+            - file_name: where the metrics are saved
+
+        @return: True if the file was saved
+        """
+
+        try:
+            with open(file_name + '.tmp', 'w') as metrics_file:
+                metrics_file.write(self.metrics())
+
+            os.replace(file_name + '.tmp', file_name)
+        except Exception as err:
+            print (f' 🛑 The request metrics could not be saved to {file_name}:')
+            print (err)
+            return False
+
+        return True
@@ -4,20 +4,18 @@
 from __future__ import annotations
 
 from hashlib import sha256
-import sqlite3
-from sqlite3 import Cursor, Connection
+from sqlite3 import Cursor
 import time
-from terra_classic_sdk.core.osmosis import Pool
 
 from classes.common import (
     get_precision,
-    get_user_choice
+    get_user_choice,
+    to_decimal
 )
 
 from constants.constants import (
     BUSY_RETRY_COUNT,
     CHAIN_DATA,
-    DB_FILE_NAME,
     FULL_COIN_LOOKUP,
     OSMOSIS_FEE_MULTIPLIER,
     OSMOSIS_LIQUIDITIY_SPREAD,
@@ -27,7 +25,12 @@ from constants.constants import (
     USER_ACTION_QUIT
 )
 
+from classes.database import get_cursor
+from classes.http_client import call_with_retries, lcd_host
+from classes.money import Amount
+from classes.records import PoolState
 from classes.terra_instance import TerraInstance    
+from classes.tracing import trace_phase, trace_transaction
 from classes.transaction_core import TransactionCore, TransactionResult
 from classes.wallet import UserWallet
 
@@ -42,7 +45,7 @@ from terra_classic_sdk.core.tx import Tx
 from terra_classic_sdk.exceptions import LCDResponseError
 from terra_classic_sdk.key.mnemonic import MnemonicKey
 
-from terra_classic_sdk.core.osmosis import MsgJoinSwapExternAmountIn, PoolAsset, MsgExitPool
+from terra_classic_sdk.core.osmosis import MsgJoinSwapExternAmountIn, MsgExitPool
 
 class LiquidityTransaction(TransactionCore):
 
@@ -101,28 +104,24 @@ class LiquidityTransaction(TransactionCore):
         @return: the number of shares that this transaction will return
         """
 
-        share_out_amount: int = 0
+        share_out_amount:int = 0
         # Get the pool details from the network
-        pool:Pool = self.getOsmosisPool(self.pool_id)
+        pool:PoolState = self.getOsmosisPool(self.pool_id)
         
         if pool is not None:
-            total_weight:int = int(pool.total_weight)
-
-            # Get the actual amount of this asset in the pool
-            divisor:float = 0
-            asset:PoolAsset
-            for asset in pool.pool_assets:
-                if asset.token.denom == coin.denom:
-                    pool_asset_amount:int = int(asset.token.amount)
-                    divisor:float =  total_weight / int(asset.weight)
+            total_weight:int = pool.total_weight
+
+            # Get the actual amount and weight of this asset in the pool
+            for asset_denom, asset_amount, asset_weight in pool.assets:
+                if asset_denom == coin.denom:
+                    pool_asset_amount:int = asset_amount
                     break
-                    
-            shift_val:int         = 10 ** 18
-            token_in_amount:float = float(coin.amount)
-            total_share_exp:float = float(int(pool.total_shares.amount) / shift_val)
 
-            # This is the basic amount we expect to receive
-            share_out_amount = (((token_in_amount * total_share_exp) / pool_asset_amount) * shift_val) / divisor
+            # This is the basic amount we expect to receive:
+            # token in * total shares / pool asset amount, scaled by this asset's share of the pool weight.
+            # The share amounts have 18 decimals, so this is done with whole numbers only.
+            token_in_amount:Amount = Amount.fromCoin(coin)
+            share_out_amount       = int(token_in_amount.mulDiv(pool.total_shares * asset_weight, pool_asset_amount * total_weight))
 
         return share_out_amount
 
@@ -150,6 +149,7 @@ class LiquidityTransaction(TransactionCore):
 
         return self
     
+    @trace_phase('sign')
     def exitPool(self) -> bool:
         """
         Join a pool with the information we have so far.
@@ -210,6 +210,7 @@ class LiquidityTransaction(TransactionCore):
             print (err)
             return False
 
+    @trace_phase('simulate')
     def exitSimulate(self):
         """
         Simulate a liquidity deposit so we can get the fee details.
@@ -291,35 +292,30 @@ class LiquidityTransaction(TransactionCore):
 
         return prices
     
-    def getOsmosisPool(self, pool_id) -> Pool:
+    def getOsmosisPool(self, pool_id) -> PoolState:
         """
         Get the pool from Osmosis.
         Cache the results so we don't have to do this again.
+        Only the details we need are kept, so every pool can be cached without using much memory.
 
         @params:
-            - assets: a dictionary of the assets we want prices for
+            - pool_id: the ID of the pool we want
 
-        @return: a dictionary of assets and their prices
+        @return: a PoolState object, or None if the pool couldn't be found
         """
 
-        pool:Pool = None
+        pool:PoolState = None
 
         if pool_id in self.cached_pools:
             pool = self.cached_pools[pool_id]
         else:
-            # Get the pool details from the network
-            retry_count: int = 0
-
-            while retry_count < BUSY_RETRY_COUNT:
-                try:
-                    pool:Pool = self.terra.pool.osmosis_pool(pool_id)
-                    # Cache this so we don't have to check again
-                    self.cached_pools[pool_id] = pool
-                    break
-                except Exception as err:
-                    retry_count += 1
-                    print (err)
-                    print (f'    The LCD is busy - trying again {retry_count}/{BUSY_RETRY_COUNT}')            
+            # Get the pool details from the network. Busy LCDs are retried with a backoff.
+            try:
+                pool:PoolState = PoolState.fromPool(call_with_retries(lcd_host(self.terra), self.terra.pool.osmosis_pool, pool_id, silent = False))
+                # Cache this so we don't have to check again
+                self.cached_pools[pool_id] = pool
+            except Exception as err:
+                print (err)
 
         return pool
 
@@ -337,20 +333,19 @@ class LiquidityTransaction(TransactionCore):
         asset_list:dict = {}
         if self.pool_id in self.pools:
             # Get the pool details from the network
-            pool:Pool = self.getOsmosisPool(self.pool_id)
+            pool:PoolState = self.getOsmosisPool(self.pool_id)
 
             if pool is not None:
                 # Calculate the two basic components of this request:
-                total_shares:int   = int(pool.total_shares.amount)
+                total_shares:int   = pool.total_shares
                 share_fraction:int = int(total_shares / self.pools[self.pool_id])
 
                 # Go through each asset and calculate the actual amount the user has
-                asset:PoolAsset
-                for asset in pool.pool_assets:
-                    denom:str     = self.denomTrace(asset.token.denom)
+                for asset_denom, asset_amount, asset_weight in pool.assets:
+                    denom:str     = self.denomTrace(asset_denom)
                     
                     # Add this to the list
-                    asset_list[denom] = int(asset.token.amount) / share_fraction
+                    asset_list[denom] = asset_amount / share_fraction
 
         return asset_list
     
@@ -514,6 +509,7 @@ class LiquidityTransaction(TransactionCore):
 
         return pool_to_use, answer
 
+    @trace_phase('sign')
     def joinPool(self) -> bool:
         """
         Join a pool with the information we have so far.
@@ -572,6 +568,7 @@ class LiquidityTransaction(TransactionCore):
            print (err)
            return False
 
+    @trace_phase('simulate')
     def joinSimulate(self) -> bool:
         """
         Simulate a liquidity deposit so we can get the fee details.
@@ -604,17 +601,17 @@ class LiquidityTransaction(TransactionCore):
         liquidity_denom:str = self.IBCfromDenom(self.source_channel, ULUNA)
         
         # This is the amount we are adding to the pool
-        token_in_coin:Coin = Coin(liquidity_denom, int(float(self.amount_in)))
+        token_in_coin:Coin = Amount(self.amount_in, liquidity_denom).toCoin()
 
         # This is the final amount we expect to get
         self.share_out_amount:int = self.calcShareOutAmount(token_in_coin)
 
         if self.share_out_amount > 0:
             # Reduce it by the spread amount
-            self.share_out_amount = round(self.share_out_amount * (1 - self.max_spread))
+            self.share_out_amount = int(Amount(self.share_out_amount, f'gamm/pool/{self.pool_id}').multiply(1 - to_decimal(self.max_spread)))
 
             # This is the amount we are contributing. It will be resized by the pool depending on the share split of each asset
-            token_in_coin      = {'amount': int(float(self.amount_in)), 'denom': liquidity_denom}
+            token_in_coin      = {'amount': int(token_in_coin.amount), 'denom': liquidity_denom}
             self.token_in_coin = token_in_coin
 
             # Perform the liquidity action as a simulation, with no fee details
@@ -657,8 +654,7 @@ class LiquidityTransaction(TransactionCore):
         all_pools:str = "SELECT pool_id, token_readable_denom FROM asset WHERE pool_id IN (SELECT pool_id FROM asset WHERE token_readable_denom = ?);"
         
         # Open the database and make the query
-        conn:Connection = sqlite3.connect(DB_FILE_NAME)
-        cursor:Cursor   = conn.execute(all_pools, [liquidity_asset_denom])
+        cursor:Cursor = get_cursor().execute(all_pools, [liquidity_asset_denom])
         rows:list       = cursor.fetchall()
 
         # Go through the database results and get the live liquidity
@@ -667,7 +663,7 @@ class LiquidityTransaction(TransactionCore):
         for row in rows:
             if row[0] not in pools:
                 # If this pool is not in the list, then add it
-                pool:Pool = self.getOsmosisPool(row[0])
+                pool:PoolState = self.getOsmosisPool(row[0])
 
                 if pool is not None:
                     # Based on the assets, get the value of this pool:
@@ -677,11 +673,10 @@ class LiquidityTransaction(TransactionCore):
                     # To make things faster, we'll query all the denoms in one go:
                     cg_denom_list:list = []
 
-                    pool_asset:PoolAsset
-                    for pool_asset in pool.pool_assets:
-                        readable_denom:str = self.denomTrace(pool_asset.token.denom)
+                    for asset_denom, asset_amount, asset_weight in pool.assets:
+                        readable_denom:str = self.denomTrace(asset_denom)
                         
-                        if pool_asset.token.denom == 'ibc/785AFEC6B3741100D15E7AF01374E3C4C36F24888E96479B1C33F5C71F364EF9':
+                        if asset_denom == 'ibc/785AFEC6B3741100D15E7AF01374E3C4C36F24888E96479B1C33F5C71F364EF9':
                             readable_denom = 'uluna2'
 
                         cg_denom_list.append(readable_denom)
@@ -689,20 +684,20 @@ class LiquidityTransaction(TransactionCore):
                     prices:dict = self.wallet.getCoinPrice(cg_denom_list)
 
                     # Now we can calculate the balance for each pool
-                    for pool_asset in pool.pool_assets:
-                        readable_denom:str = self.denomTrace(pool_asset.token.denom)
+                    for asset_denom, asset_amount, asset_weight in pool.assets:
+                        readable_denom:str = self.denomTrace(asset_denom)
                         
-                        if pool_asset.token.denom == 'ibc/785AFEC6B3741100D15E7AF01374E3C4C36F24888E96479B1C33F5C71F364EF9':
+                        if asset_denom == 'ibc/785AFEC6B3741100D15E7AF01374E3C4C36F24888E96479B1C33F5C71F364EF9':
                             readable_denom = 'uluna2'
 
                         if readable_denom not in CHAIN_DATA:
                             valid_pool = False
                             break
 
-                        asset_amount:float = int(pool_asset.token.amount) / (10 ** get_precision(readable_denom))
+                        readable_amount:float = asset_amount / (10 ** get_precision(readable_denom))
 
                         price:float   = prices[readable_denom]
-                        pool_balance += (price * asset_amount)
+                        pool_balance += (price * readable_amount)
 
                     if valid_pool == True:
                         pools[int(row[0])] = {'assets': [], 'liquidity': pool_balance}
@@ -729,28 +724,28 @@ class LiquidityTransaction(TransactionCore):
         token_out_list:list = []
 
         # Get the pool details from the network
-        pool:Pool = self.getOsmosisPool(self.pool_id)
+        pool:PoolState = self.getOsmosisPool(self.pool_id)
         
         if pool is not None:
-            # Step 1: calculate the fraction that the user has of the entire pool:
-            total_shares:int   = int(pool.total_shares.amount)
-            share_fraction:int = int(total_shares / self.pools[self.pool_id])
+            # Step 1: get the shares that the user has, and the shares in the entire pool:
+            total_shares:int = pool.total_shares
+            user_shares:int  = int(self.pools[self.pool_id])
             
             # Step 2: now get the actual amount of each asset across this pool:
-            asset:PoolAsset
             # Go through each asset and add it to the list
-            for asset in pool.pool_assets:
+            for asset_denom, pool_amount, asset_weight in pool.assets:
 
-                # Get the amount of this asset as percentage of the total amount
-                asset_amount:float = int(asset.token.amount) / share_fraction
+                # Get the user's part of this asset
+                asset_amount:Amount = Amount(pool_amount, asset_denom).mulDiv(user_shares, total_shares)
 
                 # This is the actual amount we're removing, minus the pool tax
-                user_amount:int = int(int(asset_amount * self.amount_out) * (1 - OSMOSIS_POOL_TAX))
+                user_amount:Amount = asset_amount.multiply(self.amount_out).multiply(1 - to_decimal(OSMOSIS_POOL_TAX))
                 
-                token_out_list.append(Coin.from_data({'amount': user_amount, 'denom': asset.token.denom}))
+                token_out_list.append(user_amount.toCoin())
 
         return token_out_list
     
+@trace_transaction('join pool')
 def join_liquidity_pool(wallet:UserWallet, pool_id:int, amount_in:int, silent_mode:bool = False) -> TransactionResult:
     """
     A wrapper function for workflows and wallet management.
@@ -843,6 +838,7 @@ def join_liquidity_pool(wallet:UserWallet, pool_id:int, amount_in:int, silent_mo
 
     return transaction_result
 
+@trace_transaction('exit pool')
 def exit_liquidity_pool(wallet:UserWallet, pool_id:int, amount_out:float, silent_mode:bool = False) -> TransactionResult:
     """
     A wrapper function for workflows and wallet management.
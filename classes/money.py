@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import functools
+import re
+
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+
+from constants.constants import (
+    PRECISION_LOOKUP
+)
+
+from classes.common import (
+    AMOUNT_CONTEXT,
+    format_raw_amount,
+    raw_integer,
+    to_decimal,
+    to_raw_amount
+)
+
+from terra_classic_sdk.core.coin import Coin
+from terra_classic_sdk.core.coins import Coins
+
+# A coin string from the LCD, ie: 1000uluna or 5ibc/0EF15DF2...
+COIN_PATTERN = re.compile(r'^(-?[0-9]+(?:\.[0-9]+)?)([a-zA-Z][a-zA-Z0-9/:._-]*)$')
+
+@functools.total_ordering
+class Amount():
+    """
+    An exact amount of one coin, kept as a whole number of the smallest unit (ie: uluna, or wei for 18 decimal coins).
+    Amounts can't be changed once they're made - every calculation returns a new Amount.
+
+    Adding and subtracting only works with the same denom. Multiplying by a rate (like the tax rate or a swap fee)
+    is done with Decimal and then rounded down, unless round_up is used (like for taxes).
+    """
+
+    __slots__ = ('denom', 'precision', 'raw')
+
+    def __init__(self, raw, denom:str, precision:int = None):
+        if precision is None:
+            precision = PRECISION_LOOKUP.get(denom, 6)
+
+        object.__setattr__(self, 'denom', denom)
+        object.__setattr__(self, 'precision', precision)
+        object.__setattr__(self, 'raw', raw_integer(raw))
+
+    @classmethod
+    def fromCoin(cls, coin:Coin) -> Amount:
+        """
+        Create an amount from an SDK Coin.
+
+        @params:
+            - coin: a Coin object
+
+        @return: an Amount
+        """
+
+        return cls(coin.amount, coin.denom)
+
+    @classmethod
+    def fromCoins(cls, coins:Coins) -> Amount:
+        """
+        Create an amount from the first coin in a Coins object, like the fee from a simulation.
+
+        @params:
+            - coins: a Coins object with at least one coin
+
+        @return: an Amount
+        """
+
+        return cls.fromCoin(coins.to_list()[0])
+
+    @classmethod
+    def fromReadable(cls, amount, denom:str) -> Amount:
+        """
+        Create an amount from a human-readable value, ie: 1.5 LUNC is 1500000 uluna.
+        Anything smaller than the smallest unit is dropped.
+
+        @params:
+            - amount: the readable amount, as a string, number or Decimal
+            - denom: the denom of this amount
+
+        @return: an Amount
+        """
+
+        return cls(to_raw_amount(amount, denom), denom)
+
+    @classmethod
+    def fromString(cls, value:str) -> Amount:
+        """
+        Create an amount from a coin string, ie: 1000uluna.
+        This is a lot quicker than Coin.from_str.
+
+        @params:
+            - value: the coin string
+
+        @return: an Amount
+        """
+
+        match = COIN_PATTERN.match(str(value).strip())
+        if match is None:
+            raise ValueError(f"'{value}' is not a coin amount")
+
+        return cls(match.group(1), match.group(2))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Amounts cannot be changed')
+
+    def __delattr__(self, name):
+        raise AttributeError('Amounts cannot be changed')
+
+    def __add__(self, other:Amount) -> Amount:
+        return Amount(self.raw + self.otherRaw(other), self.denom, self.precision)
+
+    def __sub__(self, other:Amount) -> Amount:
+        return Amount(self.raw - self.otherRaw(other), self.denom, self.precision)
+
+    def __mul__(self, rate) -> Amount:
+        return self.multiply(rate)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Amount):
+            return self.denom == other.denom and self.raw == other.raw
+        if isinstance(other, int):
+            return self.raw == other
+
+        return NotImplemented
+
+    def __lt__(self, other) -> bool:
+        return self.raw < self.otherRaw(other)
+
+    def __hash__(self) -> int:
+        return hash((self.raw, self.denom))
+
+    def __bool__(self) -> bool:
+        return self.raw != 0
+
+    def __int__(self) -> int:
+        return self.raw
+
+    def __index__(self) -> int:
+        return self.raw
+
+    def __repr__(self) -> str:
+        return f'Amount({self.raw}, {self.denom!r})'
+
+    def __str__(self) -> str:
+        return f'{self.raw}{self.denom}'
+
+    def convert(self, denom:str, rate = 1) -> Amount:
+        """
+        Convert this amount into another coin, ie: with the price of this coin divided by the price of the other one.
+        The difference in precision is handled exactly, so 1 LUNC into an 18 decimal coin is 10^18 wei (times the rate).
+
+        @params:
+            - denom: the coin we're converting to
+            - rate: how much of the other coin one unit of this coin is worth
+
+        @return: a new Amount in the other denom, rounded down
+        """
+
+        precision:int = PRECISION_LOOKUP.get(denom, 6)
+        value:Decimal = AMOUNT_CONTEXT.multiply(Decimal(self.raw), to_decimal(rate)).scaleb(precision - self.precision, AMOUNT_CONTEXT)
+
+        return Amount(int(value.to_integral_value(rounding = ROUND_FLOOR, context = AMOUNT_CONTEXT)), denom, precision)
+
+    def mulDiv(self, numerator:int, denominator:int) -> Amount:
+        """
+        Multiply this amount by a fraction of two whole numbers, with no rounding until the end.
+        This is used for pool shares, where the numbers are too big for a float.
+
+        @params:
+            - numerator: the top of the fraction
+            - denominator: the bottom of the fraction
+
+        @return: a new Amount, rounded down
+        """
+
+        return Amount((self.raw * int(numerator)) // int(denominator), self.denom, self.precision)
+
+    def multiply(self, rate, round_up:bool = False) -> Amount:
+        """
+        Multiply this amount by a rate, like the tax rate or (1 - swap fee).
+
+        @params:
+            - rate: a number, string, Decimal, or SDK Dec
+            - round_up: if True, then any fraction is rounded up instead of down
+
+        @return: a new Amount in the same denom
+        """
+
+        value:Decimal = AMOUNT_CONTEXT.multiply(Decimal(self.raw), to_decimal(rate))
+        rounding:str  = ROUND_CEILING if round_up == True else ROUND_FLOOR
+
+        return Amount(int(value.to_integral_value(rounding = rounding, context = AMOUNT_CONTEXT)), self.denom, self.precision)
+
+    def otherRaw(self, other) -> int:
+        """
+        Get the raw value of something we're adding, subtracting or comparing with.
+        Plain whole numbers are treated as raw amounts of this denom.
+
+        @params:
+            - other: an Amount or an int
+
+        @return: the raw amount
+        """
+
+        if isinstance(other, Amount):
+            if other.denom != self.denom:
+                raise ValueError(f'{other.denom} cannot be used with {self.denom}')
+
+            return other.raw
+
+        if isinstance(other, int):
+            return other
+
+        raise TypeError(f'{type(other).__name__} cannot be used with an Amount')
+
+    def readable(self) -> str:
+        """
+        Return this amount as a human-readable string, ie: '1.5'.
+
+        @params:
+            - None
+
+        @return: the amount with no trailing zeros
+        """
+
+        return format_raw_amount(self.raw, self.denom)
+
+    def toCoin(self, denom:str = None) -> Coin:
+        """
+        Return this amount as an SDK Coin.
+
+        @params:
+            - denom: use a different denom, like the IBC version of this coin
+
+        @return: a Coin object
+        """
+
+        if denom is None:
+            denom = self.denom
+
+        return Coin(denom, self.raw)
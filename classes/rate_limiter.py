@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+import time
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from constants.constants import (
+    RATE_LIMIT_DEFAULT,
+    RATE_LIMITS
+)
+
+# One token bucket per host, shared by every thread
+rate_limiters:dict = {}
+limiters_lock      = threading.Lock()
+lcd_installed:bool = False
+
+def install_lcd_rate_limits() -> bool:
+    """
+    Apply the rate limits to every LCD request, including the ones the LCD client makes by itself (balances, delegations, etc).
+    It's safe to call this more than once.
+
+    @params:
+        - None
+
+    @return: True if the LCD client was wrapped by this call
+    """
+
+    global lcd_installed
+
+    with limiters_lock:
+        if lcd_installed == True:
+            return False
+
+        from terra_classic_sdk.client.lcd.lcdclient import AsyncLCDClient
+
+        AsyncLCDClient._get  = wrap_lcd_call(AsyncLCDClient._get)
+        AsyncLCDClient._post = wrap_lcd_call(AsyncLCDClient._post)
+        lcd_installed        = True
+
+    return True
+
+def rate_limiter(host:str) -> RateLimiter:
+    """
+    Get the token bucket for a host, based on the RATE_LIMITS constant.
+
+    @params:
+        - host: the server name, ie: api.coingecko.com
+
+    @return: a RateLimiter object, or None if this host isn't limited
+    """
+
+    with limiters_lock:
+        if host not in rate_limiters:
+            limit:tuple = RATE_LIMITS.get(host, RATE_LIMIT_DEFAULT)
+            if limit is None:
+                rate_limiters[host] = None
+            else:
+                rate_limiters[host] = RateLimiter().create(limit[0], limit[1])
+
+        return rate_limiters[host]
+
+def retry_after(err:Exception) -> float:
+    """
+    Get the Retry-After value from a failed request, if the server sent one.
+    It can be a number of seconds or a date.
+
+    @params:
+        - err: the exception that the request raised
+
+    @return: the number of seconds to wait, or None if there wasn't a Retry-After header
+    """
+
+    response = getattr(err, 'response', None)
+    headers  = getattr(response, 'headers', None)
+    if headers is None:
+        return None
+
+    value:str = headers.get('Retry-After', None)
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def slow_down(host:str, seconds:float) -> bool:
+    """
+    Tell the rate limiter for this host that the server asked us to wait, so every thread waits before its next request.
+
+    @params:
+        - host: the server name
+        - seconds: how long the server asked us to wait
+
+    @return: True if this host is rate limited
+    """
+
+    limiter:RateLimiter = rate_limiter(host)
+    if limiter is None:
+        return False
+
+    limiter.pause(seconds)
+
+    return True
+
+def wait_for_rate_limit(host:str) -> float:
+    """
+    Wait until a request can be made to this host.
+
+    @params:
+        - host: the server name
+
+    @return: how long we waited, in seconds
+    """
+
+    limiter:RateLimiter = rate_limiter(host)
+    if limiter is None:
+        return 0
+
+    delay:float = limiter.reserve()
+    if delay > 0:
+        time.sleep(delay)
+
+    return delay
+
+def wrap_lcd_call(function):
+    """
+    Wrap AsyncLCDClient._get or _post so every LCD call waits for the rate limiter first.
+    If the LCD says it's overloaded and sends a Retry-After header, then every thread waits that long.
+
+    @params:
+        - function: the original method
+
+    @return: the wrapped method
+    """
+
+    @functools.wraps(function)
+    async def limited_call(self, *args, **kwargs):
+        host:str            = urlparse(str(self.url)).netloc
+        limiter:RateLimiter = rate_limiter(host)
+
+        if limiter is not None:
+            delay:float = limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        try:
+            return await function(self, *args, **kwargs)
+        except Exception as err:
+            seconds:float = retry_after(err)
+            if seconds is not None:
+                slow_down(host, seconds)
+            raise
+
+    return limited_call
+
+class RateLimiter():
+    """
+    A token bucket for one host. Tokens are added at 'rate' per second, up to 'burst' tokens.
+    Each request takes a token, and if there aren't any left then it waits until there will be.
+    Waiting requests reserve their token in advance, so they are let through in order and evenly spaced.
+    """
+
+    def __init__(self):
+        self.burst:int     = None
+        self.lock          = threading.Lock()
+        self.rate:float    = None
+        self.tokens:float  = None
+        self.updated:float = None
+
+    def create(self, rate:float, burst:int) -> RateLimiter:
+        """
+        Create a full token bucket.
+
+        @params:
+            - rate: how many requests per second are allowed
+            - burst: how many requests can be made at once
+
+        @return: self
+        """
+
+        self.burst   = max(1, int(burst))
+        self.rate    = float(rate)
+        self.tokens  = float(self.burst)
+        self.updated = time.monotonic()
+
+        return self
+
+    def pause(self, seconds:float) -> bool:
+        """
+        Empty the bucket and stop adding tokens until this many seconds have passed.
+        This is used when the server sends a Retry-After header.
+
+        @params:
+            - seconds: how long to wait
+
+        @return: True
+        """
+
+        with self.lock:
+            self.tokens  = min(self.tokens, 0)
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+        return True
+
+    def reserve(self) -> float:
+        """
+        Take a token from the bucket.
+
+        @params:
+            - None
+
+        @return: how many seconds the caller needs to wait before making the request
+        """
+
+        with self.lock:
+            now:float = time.monotonic()
+
+            # Nothing is added while we're paused, so 'updated' can be in the future
+            if now > self.updated:
+                self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+            self.tokens -= 1
+
+            return max(0, self.updated - now) + max(0, -self.tokens) / self.rate
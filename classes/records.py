@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import sys
+
+from classes.common import (
+    raw_integer,
+    to_decimal
+)
+
+def intern_denom(denom:str) -> str:
+    """
+    Return the shared copy of a denom string.
+    Every wallet and pool holds the same few denoms, so they all point at one string instead of a copy each.
+
+    @params:
+        - denom: the denom, ie: uluna or ibc/0EF15DF2...
+
+    @return: the interned denom
+    """
+
+    if denom is None:
+        return None
+
+    return sys.intern(str(denom))
+
+class Record():
+    """
+    The base class for the slotted records below.
+    Records used to be dictionaries, so they can still be read and updated with record['key'], record.get('key') and 'key' in record.
+    """
+
+    __slots__ = ()
+
+    def __contains__(self, key:str) -> bool:
+        return key in self.__slots__
+
+    def __getitem__(self, key:str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __repr__(self) -> str:
+        return type(self).__name__ + '(' + ', '.join([f'{key}={getattr(self, key)!r}' for key in self.__slots__]) + ')'
+
+    def __setitem__(self, key:str, value) -> None:
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+        setattr(self, key, value)
+
+    def get(self, key:str, default = None):
+        """
+        Get a value, or the default if this record doesn't have it.
+
+        @params:
+            - key: the field name
+            - default: what to return if there is no field with this name
+
+        @return: the value
+        """
+
+        if key not in self.__slots__:
+            return default
+
+        return getattr(self, key)
+
+    def items(self) -> list:
+        """
+        Get every field and value, like dict.items().
+
+        @params:
+            - None
+
+        @return: a list of (key, value) pairs
+        """
+
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def keys(self) -> tuple:
+        """
+        Get the field names, like dict.keys().
+
+        @params:
+            - None
+
+        @return: the field names
+        """
+
+        return self.__slots__
+
+    def toDict(self) -> dict:
+        """
+        Convert this record into a plain dictionary, ie: for saving it as JSON.
+
+        @params:
+            - None
+
+        @return: a dictionary of every field
+        """
+
+        return dict(self.items())
+
+class Balance(Record):
+    """
+    An amount of one coin that becomes available at a certain time, like an undelegation entry.
+    """
+
+    __slots__ = ('balance', 'completion_time', 'denom')
+
+    def __init__(self, balance, denom:str = None, completion_time = None):
+        self.balance         = raw_integer(balance)
+        self.completion_time = completion_time
+        self.denom           = intern_denom(denom)
+
+class Delegation(Record):
+    """
+    A delegation from one wallet to one validator, with the rewards that are waiting to be withdrawn.
+    """
+
+    __slots__ = ('balance_amount', 'balance_denom', 'commission', 'delegator', 'rewards', 'validator', 'validator_name')
+
+    def __init__(self, balance_amount, balance_denom:str, commission:float, delegator:str, rewards:dict, validator:str, validator_name:str):
+        self.balance_amount = raw_integer(balance_amount)
+        self.balance_denom  = intern_denom(balance_denom)
+        self.commission     = commission
+        self.delegator      = delegator
+        self.rewards        = {intern_denom(denom): rewards[denom] for denom in rewards}
+        self.validator      = validator
+        self.validator_name = validator_name
+
+class PoolState(Record):
+    """
+    The parts of an Osmosis pool that the swap and liquidity calculations use.
+    This is a lot smaller than the full SDK Pool object, so every pool can be kept in memory.
+
+    Each asset is a (denom, amount, weight) tuple.
+    """
+
+    __slots__ = ('assets', 'id', 'swap_fee', 'total_shares', 'total_weight')
+
+    def __init__(self, id:int, assets:tuple, swap_fee, total_shares:int, total_weight:int):
+        self.assets       = tuple((intern_denom(denom), int(amount), int(weight)) for denom, amount, weight in assets)
+        self.id           = int(id)
+        self.swap_fee     = to_decimal(swap_fee)
+        self.total_shares = int(total_shares)
+        self.total_weight = int(total_weight)
+
+    @classmethod
+    def fromPool(cls, pool) -> PoolState:
+        """
+        Keep just the details we need from an SDK Pool object.
+
+        @params:
+            - pool: the Pool object from terra.pool.osmosis_pool()
+
+        @return: a PoolState
+        """
+
+        assets:list = [(asset.token.denom, asset.token.amount, asset.weight) for asset in pool.pool_assets]
+
+        return cls(pool.id, assets, pool.pool_params.swap_fee, pool.total_shares.amount, pool.total_weight)
+
+class Undelegation(Record):
+    """
+    The undelegations from one wallet to one validator. Each entry is a Balance with its completion time.
+    """
+
+    __slots__ = ('balance_amount', 'delegator_address', 'entries', 'validator_address')
+
+    def __init__(self, balance_amount, delegator_address:str, entries:list, validator_address:str):
+        self.balance_amount    = raw_integer(balance_amount)
+        self.delegator_address = delegator_address
+        self.entries           = entries
+        self.validator_address = validator_address
+
+class Validator(Record):
+    """
+    The details of one validator, from the list of every validator on the chain.
+    """
+
+    __slots__ = ('commission', 'details', 'identity', 'is_jailed', 'moniker', 'operator_address', 'status', 'token_count', 'unbonding_time', 'voting_power')
+
+    def __init__(self, commission:int, details:str, identity:str, is_jailed:bool, moniker:str, operator_address:str, status, token_count, unbonding_time, voting_power:float = 0):
+        self.commission       = commission
+        self.details          = details
+        self.identity         = identity
+        self.is_jailed        = is_jailed
+        self.moniker          = moniker
+        self.operator_address = operator_address
+        self.status           = status
+        self.token_count      = raw_integer(token_count)
+        self.unbonding_time   = unbonding_time
+        self.voting_power     = voting_power
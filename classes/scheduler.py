@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from constants.constants import (
+    WORKFLOW_DAEMON_INTERVAL
+)
+
+# How far ahead we look for the next matching day/time before giving up
+SCHEDULE_LOOKAHEAD_DAYS = 8
+
+def parse_clock(requirement:str) -> list[int, int]:
+    """
+    Convert a 'time' trigger requirement into a 24 hour clock value.
+    Supported formats are '5pm', '05pm', '5:30pm' and '05:30pm'.
+
+    @params:
+        - requirement: the value from the workflow trigger, ie: 'Time = 5:30pm'
+
+    @return: the hour (0-23) and the minute (None if only the hour was provided). Both are None if it can't be parsed
+    """
+
+    requirement = requirement.lower().strip()
+
+    if requirement[-2:] not in ['am', 'pm']:
+        return None, None
+
+    suffix:str     = requirement[-2:]
+    time_bits:list = requirement[0:-2].split(':')
+
+    if len(time_bits) > 2 or not all(bit.isnumeric() for bit in time_bits):
+        return None, None
+
+    hour:int   = int(time_bits[0])
+    minute:int = None
+    if len(time_bits) == 2:
+        minute = int(time_bits[1])
+
+    if hour < 1 or hour > 12 or (minute is not None and minute > 59):
+        return None, None
+
+    # Convert to the 24 hour clock
+    hour = hour % 12
+    if suffix == 'pm':
+        hour += 12
+
+    return hour, minute
+
+class WorkflowScheduler:
+    """
+    Works out when each workflow should next be run when workflows.py is running in daemon mode.
+
+    Steps with 'day' and 'time' triggers are scheduled for the exact minute they match.
+    If any step in a workflow has no day/time requirements, then the workflow is also run every 'interval' minutes.
+    """
+
+    def __init__(self):
+        self.interval:int    = WORKFLOW_DAEMON_INTERVAL
+        self.next_runs:dict  = {}
+        self.schedules:dict  = {}
+        self.workflows:list  = []
+
+    def create(self, workflows:list, interval:int = WORKFLOW_DAEMON_INTERVAL, start_time:datetime = None) -> WorkflowScheduler:
+        """
+        Build the schedule for the provided list of workflows.
+
+        @params:
+            - workflows: the 'workflows' list from the user_workflows.yml file
+            - interval: how often (in minutes) the workflows without a day/time trigger are run
+            - start_time: the time we are starting the schedule from. Defaults to now.
+
+        @return: self
+        """
+
+        if start_time is None:
+            start_time = datetime.now()
+
+        self.interval  = interval
+        self.workflows = workflows
+        self.next_runs = {}
+        self.schedules = {}
+
+        for workflow_id in range(len(workflows)):
+            self.schedules[workflow_id] = self.parseWorkflow(workflows[workflow_id])
+            if self.schedules[workflow_id]['interval'] == True:
+                # Interval-based workflows run straight away, like they would from cron
+                self.next_runs[workflow_id] = start_time.replace(second = 0, microsecond = 0)
+            else:
+                self.next_runs[workflow_id] = self.nextFireTime(workflow_id, start_time - timedelta(minutes = 1))
+
+        return self
+
+    def dueWorkflows(self, current_time:datetime = None) -> list:
+        """
+        Return the workflows which should be run at the current time.
+
+        @params:
+            - current_time: the time we are checking against. Defaults to now.
+
+        @return: a list of (workflow, fire time) pairs, in the order they appear in the workflows file
+        """
+
+        if current_time is None:
+            current_time = datetime.now()
+
+        result:list = []
+        for workflow_id in self.next_runs:
+            fire_time:datetime = self.next_runs[workflow_id]
+            if fire_time is not None and fire_time <= current_time:
+                result.append([self.workflows[workflow_id], fire_time])
+                # Schedule the next run from now. If a slow run meant this workflow missed some fire times,
+                # they are covered by this one run instead of all running straight after each other.
+                self.next_runs[workflow_id] = self.nextFireTime(workflow_id, max(fire_time, current_time.replace(second = 0, microsecond = 0)))
+
+        return result
+
+    def nextFireTime(self, workflow_id:int, after:datetime) -> datetime:
+        """
+        Calculate the next time this workflow should be run.
+
+        @params:
+            - workflow_id: the index of the workflow in the workflows list
+            - after: the returned time will be strictly later than this
+
+        @return: the next fire time, or None if this workflow will never fire
+        """
+
+        schedule:dict   = self.schedules[workflow_id]
+        candidates:list = []
+        after           = after.replace(second = 0, microsecond = 0)
+
+        if schedule['interval'] == True:
+            # Align interval runs to the clock, ie: every 60 minutes runs on the hour
+            minutes_since_midnight:int = after.hour * 60 + after.minute
+            next_slot:int              = ((minutes_since_midnight // self.interval) + 1) * self.interval
+            candidates.append(after.replace(hour = 0, minute = 0) + timedelta(minutes = next_slot))
+
+        if len(schedule['times']) > 0:
+            candidate:datetime = after + timedelta(minutes = 1)
+            end_time:datetime  = after + timedelta(days = SCHEDULE_LOOKAHEAD_DAYS)
+            found:bool         = False
+            while candidate <= end_time and found == False:
+                for time_trigger in schedule['times']:
+                    if self.isMatch(time_trigger, candidate):
+                        candidates.append(candidate)
+                        found = True
+                        break
+
+                if found == False:
+                    candidate += timedelta(minutes = 1)
+
+        if len(candidates) == 0:
+            return None
+
+        return min(candidates)
+
+    def isMatch(self, time_trigger:dict, candidate:datetime) -> bool:
+        """
+        Does this candidate time match the day/time trigger?
+
+        @params:
+            - time_trigger: a dictionary with days, hour and minute requirements
+            - candidate: the time we are checking
+
+        @return: True if it matches
+        """
+
+        if time_trigger['days'] is not None and candidate.strftime('%A').lower() not in time_trigger['days']:
+            return False
+
+        if time_trigger['hour'] is not None and candidate.hour != time_trigger['hour']:
+            return False
+
+        if time_trigger['minute'] is not None and candidate.minute != time_trigger['minute']:
+            return False
+
+        # A day-only trigger runs once, at the start of the day
+        if time_trigger['hour'] is None and (candidate.hour != 0 or candidate.minute != 0):
+            return False
+
+        return True
+
+    def parseWorkflow(self, workflow:dict) -> dict:
+        """
+        Go through the steps in this workflow and find the day/time triggers.
+
+        @params:
+            - workflow: a single workflow from the user_workflows.yml file
+
+        @return: a dictionary with the interval flag and a list of time triggers
+        """
+
+        result:dict = {'interval': False, 'times': []}
+
+        steps:list = []
+        if 'steps' in workflow and workflow['steps'] is not None:
+            steps = workflow['steps']
+
+        for step in steps:
+            days:list     = None
+            hour:int      = None
+            minute:int    = None
+            is_valid:bool = True
+
+            triggers:list = []
+            if 'when' in step and step['when'] is not None:
+                triggers = step['when']
+
+            for trigger in triggers:
+                trigger_bits:list = str(trigger).split(' ')
+                if len(trigger_bits) == 3:
+                    condition:str   = trigger_bits[0].lower()
+                    requirement:str = trigger_bits[2].lower()
+                    if condition == 'day':
+                        days = [requirement]
+                    elif condition == 'time':
+                        hour, minute = parse_clock(requirement)
+                        if hour is None:
+                            # This will never match, so don't schedule it
+                            is_valid = False
+                        elif minute is None:
+                            # Hour-only triggers are run at the top of the hour
+                            minute = 0
+
+            if days is None and hour is None:
+                if is_valid == True:
+                    result['interval'] = True
+            elif is_valid == True:
+                result['times'].append({'days': days, 'hour': hour, 'minute': minute})
+
+        return result
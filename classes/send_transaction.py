@@ -3,7 +3,6 @@
 
 from __future__ import annotations
 
-import math
 import time
 
 from classes.common import (
@@ -11,6 +10,8 @@ from classes.common import (
 )
 
 from constants.constants import (
+    BATCH_SEND_MAX_GAS,
+    BATCH_SEND_SIZE,
     CHAIN_DATA,
     FULL_COIN_LOOKUP,
     GRDX,
@@ -22,7 +23,10 @@ from constants.constants import (
     UUSD
 )
 
+from classes.chain_params import observe_height
+from classes.money import Amount
 from classes.terra_instance import TerraInstance
+from classes.tracing import trace_phase, trace_transaction
 from classes.transaction_core import TransactionCore, TransactionResult
 from classes.wallet import UserWallet
 
@@ -30,7 +34,7 @@ from terra_classic_sdk.client.lcd.api.tx import (
     CreateTxOptions,
     Tx
 )
-from terra_classic_sdk.core.bank import MsgSend
+from terra_classic_sdk.core.bank import MsgMultiSend, MsgSend, MultiSendInput, MultiSendOutput
 from terra_classic_sdk.core.coin import Coin
 from terra_classic_sdk.core.coins import Coins
 from terra_classic_sdk.core.fee import Fee
@@ -41,6 +45,241 @@ from terra_classic_sdk.core.wasm.msgs import MsgExecuteContract
 from terra_classic_sdk.exceptions import LCDResponseError
 from terra_classic_sdk.key.mnemonic import MnemonicKey
 
+class BatchSendTransaction(TransactionCore):
+    """
+    Send coins from one wallet to many recipients in a single transaction.
+    Native coins are sent with one MsgMultiSend, and CW20 tokens (like BASE and GRDX) with one transfer message per recipient.
+    Only recipients on the same chain as the wallet are supported.
+    """
+
+    def __init__(self, *args, **kwargs):
+
+        super(BatchSendTransaction, self).__init__(*args, **kwargs)
+
+        self.fee:Fee              = None
+        self.gas_limit:str        = 'auto'
+        self.memo:str             = ''
+        self.recipients:list      = [] # A list of {'address', 'coin'} dictionaries
+        self.sender_address:str   = None
+        self.tax:dict             = {} # The tax for each denom being sent
+
+    def create(self, seed:str, denom:str = 'uluna') -> BatchSendTransaction:
+        """
+        Create a batch send object and set it up with the provided details.
+        
+        @params:
+            - seed: the wallet seed so we can create the wallet
+            - denom: the native denom of the wallet's chain
+
+        @return: self
+        """
+
+        # Create the terra instance
+        self.terra = TerraInstance().create(denom)
+
+        # Create the wallet based on the calculated key
+        prefix              = CHAIN_DATA[denom]['bech32_prefix']
+        current_wallet_key  = MnemonicKey(mnemonic = seed, prefix = prefix)
+        self.current_wallet = self.terra.wallet(current_wallet_key)
+
+        # Get the gas prices and tax rate:
+        self.gas_list = self.gasList()
+        self.tax_rate = self.taxRate()
+
+        return self
+
+    def gasWanted(self) -> int:
+        """
+        Get the gas limit of the simulated transaction, so we can tell if this batch is too big.
+
+        @params:
+            - None
+
+        @return: the gas limit, or 0 if there is no transaction
+        """
+
+        if self.transaction is None:
+            return 0
+
+        return int(self.transaction.auth_info.fee.gas_limit)
+
+    def gasShape(self) -> str:
+        """
+        Describe the messages in this batch, so the learned gas limit is only reused for the same mix of messages.
+        The native outputs all go into one MsgMultiSend, but each CW20 transfer is its own contract call.
+
+        @params:
+            - None
+
+        @return: a string like 'native:5,ubase:2'
+        """
+
+        counts:dict = {'native': 0}
+        for recipient in self.recipients:
+            denom:str = recipient['coin'].denom
+
+            if denom in NON_ULUNA_COINS.values():
+                counts[denom] = counts.get(denom, 0) + 1
+            else:
+                counts['native'] += 1
+
+        return ','.join([f'{key}:{counts[key]}' for key in sorted(counts)])
+
+    def messages(self) -> list:
+        """
+        Build the messages for every recipient in this batch.
+        All the native coins go into one MsgMultiSend, and each CW20 transfer is a separate message.
+
+        @params:
+            - None
+
+        @return: a list of messages
+        """
+
+        msgs:list          = []
+        native_totals:dict = {}
+        outputs:list       = []
+
+        for recipient in self.recipients:
+            coin:Coin = recipient['coin']
+
+            if coin.denom in NON_ULUNA_COINS.values():
+                if coin.denom == GRDX:
+                    contract_address = TERRASWAP_GRDX_TO_LUNC_ADDRESS
+                else:
+                    contract_address = (list(NON_ULUNA_COINS.keys())[list(NON_ULUNA_COINS.values()).index(coin.denom)])
+
+                msgs.append(MsgExecuteContract(
+                    sender   = self.sender_address,
+                    contract = contract_address,
+                    msg = {
+                        "transfer": {
+                            "amount": str(int(coin.amount)),
+                            "recipient": recipient['address']
+                        }
+                    }
+                ))
+            else:
+                outputs.append(MultiSendOutput(address = recipient['address'], coins = Coins(str(int(coin.amount)) + coin.denom)))
+                native_totals[coin.denom] = native_totals.get(coin.denom, 0) + int(coin.amount)
+
+        if len(outputs) > 0:
+            # The chain only allows one input, and it has to match the total of the outputs
+            total_coins:Coins = Coins([Coin(denom, native_totals[denom]) for denom in native_totals])
+            msgs.insert(0, MsgMultiSend(inputs = [MultiSendInput(address = self.sender_address, coins = total_coins)], outputs = outputs))
+
+        return msgs
+
+    @trace_phase('sign')
+    def send(self) -> bool:
+        """
+        Sign the batch with the information we have so far.
+        If fee is None then it will be a simulation.
+        
+        @params:
+            - None
+
+        @return: True/False depending on if the transaction was signed
+        """
+
+        try:
+            tx:Tx = None
+
+            options = CreateTxOptions(
+                account_number = self.account_number,
+                fee            = self.fee,
+                fee_denoms     = ['uluna'],
+                gas            = str(self.gas_limit),
+                gas_prices     = self.gas_list,
+                memo           = self.memo,
+                msgs           = self.messages(),
+                sequence       = self.sequence
+            )
+
+            # This process often generates sequence errors. If we get a response error, then
+            # bump up the sequence number by one and try again.
+            while True:
+                try:
+                    tx:Tx = self.current_wallet.create_and_sign_tx(options)
+                    break
+                except LCDResponseError as err:
+                    if 'account sequence mismatch' in err.message:
+                        self.sequence    = self.sequence + 1
+                        options.sequence = self.sequence
+                        print (' 🛎️  Boosting sequence number')
+                    else:
+                        print (' 🛑 An unexpected error occurred in the batch send function:')
+                        print (err)
+                        break
+                except Exception as err:
+                    print (' 🛑 An unexpected error occurred in the batch send function:')
+                    print (err)
+                    break
+
+            # Store the transaction
+            self.transaction = tx
+
+            return tx is not None
+        
+        except Exception as err:
+            print (' 🛑 An unexpected error occurred in the batch send function:')
+            print (err)
+            return False
+
+    @trace_phase('simulate')
+    def simulate(self) -> bool:
+        """
+        Simulate the batch so we can get the fee details.
+        The tax is worked out on the total of each native denom, and added to the fee.
+
+        @params:
+            - None
+
+        @return: True/False depending on if the simulation succeeded
+        """
+
+        # Reset these values in case this is a re-used object:
+        self.account_number = self.current_wallet.account_number()
+        self.fee            = None
+        self.prices         = None
+        self.tax            = {}
+        self.transaction    = None
+
+        if self.getSequenceNumber() == False:
+            return False
+
+        # The gas mostly depends on how many recipients there are, and how many of them are CW20 transfers
+        self.gas_limit = self.cachedGasLimit('MsgMultiSend', shape = self.gasShape())
+
+        # Perform the send as a simulation, with no fee details
+        if self.send() == False:
+            return False
+
+        requested_fee:Fee = self.transaction.auth_info.fee
+        requested_fee     = self.calculateFee(requested_fee = requested_fee, specific_denom = ULUNA)
+
+        fee_bit:Amount   = Amount.fromCoins(requested_fee.amount)
+        fee_amounts:dict = {fee_bit.denom: fee_bit}
+
+        # No taxes for BASE and GRDX transfers
+        totals:dict = {}
+        for recipient in self.recipients:
+            coin:Coin = recipient['coin']
+            if coin.denom not in NON_ULUNA_COINS.values():
+                totals[coin.denom] = totals.get(coin.denom, Amount(0, coin.denom)) + Amount.fromCoin(coin)
+
+        for denom in totals:
+            tax:Amount         = totals[denom].multiply(self.tax_rate, round_up = True)
+            self.tax[denom]    = int(tax)
+            fee_amounts[denom] = fee_amounts.get(denom, Amount(0, denom)) + tax
+
+        requested_fee.amount = Coins([fee_amounts[denom].toCoin() for denom in fee_amounts if fee_amounts[denom] > 0])
+
+        # This will be used by the send function next time we call it
+        self.fee = requested_fee
+
+        return True
+
 class SendTransaction(TransactionCore):
     def __init__(self, *args, **kwargs):
 
@@ -89,6 +328,7 @@ class SendTransaction(TransactionCore):
 
         return self
 
+    @trace_phase('sign')
     def send(self) -> bool:
         """
         Complete a send transaction with the information we have so far.
@@ -175,6 +415,7 @@ class SendTransaction(TransactionCore):
             print (err)
             return False
         
+    @trace_phase('sign')
     def sendOffchain(self) -> bool:
         """
         Complete a send transaction with the information we have so far.
@@ -258,6 +499,7 @@ class SendTransaction(TransactionCore):
             print (err)
             return False
     
+    @trace_phase('simulate')
     def simulate(self) -> bool:
         """
         Simulate a delegation so we can get the fee details.
@@ -288,6 +530,12 @@ class SendTransaction(TransactionCore):
         if self.terra.chain_id == CHAIN_DATA[UOSMO]['chain_id'] and self.denom != UOSMO:
             self.denom = self.IBCfromDenom(self.source_channel, self.denom)
 
+        # Skip the gas simulation if we've done this kind of send enough times already
+        if self.denom in NON_ULUNA_COINS.values():
+            self.gas_limit = self.cachedGasLimit('MsgExecuteContract', shape = self.denom)
+        else:
+            self.gas_limit = self.cachedGasLimit('MsgSend', shape = self.denom)
+
         # Perform the swap as a simulation, with no fee details
         self.send()
 
@@ -305,33 +553,32 @@ class SendTransaction(TransactionCore):
             self.fee = self.calculateFee(requested_fee = requested_fee, specific_denom = ULUNA, convert_to_ibc = self.is_ibc_transfer)
             
             # Figure out the fee structure
-            fee_bit:Coin = Coin.from_str(str(requested_fee.amount))
-            fee_amount   = fee_bit.amount
-            fee_denom    = fee_bit.denom
+            fee_amount:Amount = Amount.fromCoins(requested_fee.amount)
+            fee_denom:str     = fee_amount.denom
         
             # Calculate the tax portion
             if self.denom in NON_ULUNA_COINS.values():
                 # No taxes for BASE and GRDX transfers
                 self.tax = 0
             else:
-                self.tax = int(math.ceil(self.amount * float(self.tax_rate)))
+                self.tax = int(Amount(self.amount, self.denom).multiply(self.tax_rate, round_up = True))
 
             # Build a fee object
             if fee_denom == ULUNA and self.denom == ULUNA:
-                new_coin:Coins = Coins({Coin(fee_denom, int(fee_amount + self.tax))})
+                new_coin:Coins = Coins({(fee_amount + self.tax).toCoin()})
             elif self.denom in NON_ULUNA_COINS.values():
-                new_coin:Coins = Coins({Coin(fee_denom, int(fee_amount))})
+                new_coin:Coins = Coins({fee_amount.toCoin()})
             else:
-                new_coin:Coins = Coins({Coin(fee_denom, int(fee_amount)), Coin(self.denom, int(self.tax))})
+                new_coin:Coins = Coins({fee_amount.toCoin(), Coin(self.denom, int(self.tax))})
 
             # If the chain is Osmosis then adjust the fee amount    
             if self.terra.chain_id != CHAIN_DATA[ULUNA]['chain_id']:
-                fee_amount = fee_amount * 1.2
+                fee_amount = fee_amount.multiply('1.2')
 
                 # Change the denom to an IBC version
                 fee_denom = self.IBCfromDenom(self.source_channel, fee_denom)
 
-                new_coin:Coins = Coins({Coin(fee_denom, int(fee_amount))})
+                new_coin:Coins = Coins({fee_amount.toCoin(fee_denom)})
 
             requested_fee.amount = new_coin
             
@@ -355,6 +602,7 @@ class SendTransaction(TransactionCore):
         else:
             return False
         
+    @trace_phase('simulate')
     def simulateOffchain(self) -> bool:
         """
         Simulate a delegation so we can get the fee details.
@@ -406,17 +654,15 @@ class SendTransaction(TransactionCore):
                 self.fee = self.calculateFee(requested_fee, ULUNA)    
 
             # Figure out the fee structure
-            fee_bit:Coin = Coin.from_str(str(requested_fee.amount))
-            fee_amount   = fee_bit.amount
+            fee_amount:Amount = Amount.fromCoins(requested_fee.amount)
         
             self.tax = 0
             
             # For osmosis-1 transfers, we need to adjust the fee:
-            fee_amount    = fee_amount * 1.2
-            fee_denom:str = fee_bit.denom
+            fee_amount = fee_amount.multiply('1.2')
 
             # Create the coin object
-            new_coin:Coins = Coins({Coin(fee_denom, int(fee_amount))})
+            new_coin:Coins = Coins({fee_amount.toCoin()})
 
             # This will be used by the swap function next time we call it
             self.fee.amount = new_coin
@@ -431,6 +677,106 @@ class SendTransaction(TransactionCore):
         else:
             return False
         
+@trace_transaction('batch send')
+def batch_send_transaction(wallet:UserWallet, recipients:list, memo:str = '', silent_mode:bool = False) -> list:
+    """
+    Send coins to many recipients from one wallet.
+    The recipients are split into batches of BATCH_SEND_SIZE, and each batch is one transaction.
+    If a batch needs more than BATCH_SEND_MAX_GAS, then it's split in half and tried again.
+
+    @params:
+      - wallet: a fully complete wallet object
+      - recipients: a list of {'address', 'coin'} dictionaries. Every address must be on the same chain as the wallet.
+      - memo: optional text to include on every transaction
+      - silent_mode: if False, then each batch is confirmed with the user before it is sent
+
+    @return: the recipients list, with 'status', 'tx_hash' and 'message' added to each recipient
+    """
+
+    sender_prefix:str = wallet.getPrefix(wallet.address)
+
+    for recipient in recipients:
+        recipient['status']  = 'Pending'
+        recipient['tx_hash'] = ''
+        recipient['message'] = ''
+
+        # IBC transfers can't be combined, so they need to be sent one at a time with send_transaction
+        if wallet.getPrefix(recipient['address']) != sender_prefix:
+            recipient['status']  = 'Skipped'
+            recipient['message'] = 'Only addresses on the same chain can be sent in a batch'
+
+    # Make sure there's enough of each coin before we start
+    totals:dict = {}
+    for recipient in [recipient for recipient in recipients if recipient['status'] == 'Pending']:
+        totals[recipient['coin'].denom] = totals.get(recipient['coin'].denom, 0) + int(recipient['coin'].amount)
+
+    for denom in totals:
+        if denom not in wallet.balances or int(wallet.balances[denom]) < totals[denom]:
+            for recipient in recipients:
+                if recipient['coin'].denom == denom and recipient['status'] == 'Pending':
+                    recipient['status']  = 'Failed'
+                    recipient['message'] = f'The {wallet.name} wallet does not have enough {FULL_COIN_LOOKUP.get(denom, denom)}'
+
+    pending:list = [recipient for recipient in recipients if recipient['status'] == 'Pending']
+    batches:list = [pending[index:index + BATCH_SEND_SIZE] for index in range(0, len(pending), BATCH_SEND_SIZE)]
+
+    if len(batches) == 0:
+        return recipients
+
+    batch_tx = BatchSendTransaction().create(wallet.seed, wallet.denom)
+
+    batch_tx.balances       = wallet.balances
+    batch_tx.memo           = memo
+    batch_tx.sender_address = wallet.address
+    batch_tx.silent_mode    = silent_mode
+    batch_tx.wallet_denom   = wallet.denom
+
+    while len(batches) > 0:
+        batch:list          = batches.pop(0)
+        batch_tx.recipients = batch
+
+        if batch_tx.simulate() == False:
+            for recipient in batch:
+                recipient['status']  = 'Failed'
+                recipient['message'] = 'The batch could not be simulated'
+            continue
+
+        if batch_tx.gasWanted() > BATCH_SEND_MAX_GAS and len(batch) > 1:
+            # Too big for one transaction, so try each half on its own
+            half:int = int(len(batch) / 2)
+            batches  = [batch[0:half], batch[half:]] + batches
+            continue
+
+        if silent_mode == False:
+            print ('')
+            print (f'  ➜ You are about to send {len(batch)} transfers from the {wallet.name} wallet')
+            print (batch_tx.readableFee())
+            print ('')
+            user_choice = get_user_choice(' ❓ Do you want to continue? (y/n) ', [])
+
+            if user_choice == False:
+                for recipient in batch + [recipient for remaining in batches for recipient in remaining]:
+                    recipient['status'] = 'Skipped'
+
+                break
+
+        transaction_result:TransactionResult = TransactionResult()
+        if batch_tx.send() == True:
+            transaction_result = batch_tx.broadcast()
+
+        for recipient in batch:
+            if transaction_result.broadcast_result is not None:
+                recipient['tx_hash'] = transaction_result.broadcast_result.txhash
+
+            if transaction_result.is_error == False and transaction_result.transaction_confirmed == True:
+                recipient['status'] = 'Sent'
+            else:
+                recipient['status']  = 'Failed'
+                recipient['message'] = str(transaction_result.log or transaction_result.message).strip()
+
+    return recipients
+
+@trace_transaction('send')
 def send_transaction(wallet:UserWallet, recipient_address:str, send_coin:Coin, memo:str = '', silent_mode:bool = False) -> TransactionResult:
     """
     A wrapper function for workflows and wallet management.
@@ -492,6 +838,8 @@ def send_transaction(wallet:UserWallet, recipient_address:str, send_coin:Coin, m
     send_tx.memo         = memo
     send_tx.amount       = int(send_coin.amount)
     send_tx.block_height = send_tx.terra.tendermint.block_info()['block']['header']['height']
+
+    observe_height(send_tx.terra.chain_id, send_tx.block_height)
         
     # Simulate it            
     if send_tx.is_on_chain == True:
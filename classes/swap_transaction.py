@@ -5,14 +5,12 @@ from __future__ import annotations
 
 import base64
 import json
-import math
-import sqlite3
 
-from sqlite3 import Cursor, Connection
+from decimal import Decimal
+from sqlite3 import Cursor
 
 from constants.constants import (
     CHAIN_DATA,
-    DB_FILE_NAME,
     FULL_COIN_LOOKUP,
     GAS_ADJUSTMENT_OSMOSIS,
     GAS_ADJUSTMENT_SWAPS,
@@ -42,12 +40,20 @@ from constants.constants import (
 
 from classes.common import (
     divide_raw_balance,
+    divide_raw_balances,
+    exit_prices,
+    format_raw_amount,
     get_precision,
     get_user_choice,
-    multiply_raw_balance
+    to_decimal,
+    to_raw_amount
 )
 
+from classes.database import database_transaction, get_cursor
+from classes.money import Amount
+from classes.records import PoolState
 from classes.terra_instance import TerraInstance    
+from classes.tracing import trace_phase, trace_transaction
 from classes.transaction_core import TransactionCore, TransactionResult
 
 from terra_classic_sdk.client.lcd.api.tx import CreateTxOptions, Tx
@@ -55,7 +61,7 @@ from terra_classic_sdk.core.coin import Coin
 from terra_classic_sdk.core.coins import Coins
 from terra_classic_sdk.core.fee import Fee
 from terra_classic_sdk.core.market.msgs import MsgSwap
-from terra_classic_sdk.core.osmosis import MsgSwapExactAmountIn, Pool
+from terra_classic_sdk.core.osmosis import MsgSwapExactAmountIn
 from terra_classic_sdk.core.tx import Tx
 from terra_classic_sdk.core.wasm.msgs import MsgExecuteContract
 from terra_classic_sdk.exceptions import LCDResponseError
@@ -188,6 +194,7 @@ class SwapTransaction(TransactionCore):
         # else:
         return self
     
+    @trace_phase('simulate')
     def marketSimulate(self) -> bool:
         """
         Simulate a market swap so we can get the fee details.
@@ -211,8 +218,8 @@ class SwapTransaction(TransactionCore):
         if self.getSequenceNumber() == False:
             return False
 
-        # Bump up the gas adjustment - it needs to be higher for swaps it turns out
-        self.terra.gas_adjustment = float(GAS_ADJUSTMENT_SWAPS)
+        # Swaps need a higher gas adjustment until we've learned what they actually use
+        self.gas_limit = self.cachedGasLimit('MsgSwap', shape = f'{self.swap_denom}:{self.swap_request_denom}', default_adjustment = GAS_ADJUSTMENT_SWAPS)
 
         #Perform the swap as a simulation, with no fee details
         self.marketSwap()
@@ -231,6 +238,7 @@ class SwapTransaction(TransactionCore):
         else:
             return False
 
+    @trace_phase('sign')
     def marketSwap(self) -> bool:
         """
         Make a market swap with the information we have so far.
@@ -302,8 +310,7 @@ class SwapTransaction(TransactionCore):
         path_query:str      = "SELECT pool.pool_id, token_denom, token_readable_denom, pool_swap_fee FROM pool INNER JOIN asset ON pool.pool_id=asset.pool_id WHERE pool.pool_id IN (SELECT pool_id FROM asset WHERE token_readable_denom = ?) AND token_readable_denom=? ORDER BY pool_swap_fee ASC;"
         liquidity_query:str = "SELECT token_readable_denom, token_amount FROM asset WHERE pool_id = ?;"
 
-        conn:Connection = sqlite3.connect(DB_FILE_NAME)
-        cursor:Cursor   = conn.execute(path_query, [denom_in, denom_out])
+        cursor:Cursor = get_cursor().execute(path_query, [denom_in, denom_out])
         rows:list       = cursor.fetchall()
 
         # This is the base option we will be returning
@@ -331,7 +338,7 @@ class SwapTransaction(TransactionCore):
                 prices:json       = self.getPrices(denom_in, denom_out)
                 swap_amount:float = (initial_amount * float(prices['from']) / float(prices['to']))
 
-                swap_amount = multiply_raw_balance(divide_raw_balance(swap_amount, denom_in), denom_out)
+                swap_amount = to_raw_amount(divide_raw_balances([(swap_amount, denom_in)])[0], denom_out)
                 if exit_liquidity[1] > float(swap_amount * 10):
                     if row[3] < current_option['swap_fee']:
                         current_option['pool_id']         = row[0]
@@ -380,7 +387,7 @@ class SwapTransaction(TransactionCore):
 
         if transaction_result.is_error == False:
 
-            insert_trade_query:str = "INSERT INTO trades (wallet_name, coin_from, amount_from, price_from, coin_to, amount_to, price_to, fees, exit_profit, exit_loss, tx_hash, status) VALUES (?,?,?,?,?,?,?,?,?,?,?,'OPEN');"
+            insert_trade_query:str = "INSERT INTO trades (wallet_name, coin_from, amount_from, price_from, coin_to, amount_to, price_to, fees, exit_profit, exit_loss, tx_hash, exit_profit_price, exit_loss_price, status) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,'OPEN');"
 
             wallet_name:str = wallet.name
             coin_from:str   = self.swap_denom
@@ -422,8 +429,7 @@ class SwapTransaction(TransactionCore):
             fee_coins:Coins = self.fee.amount
             for fee_coin in fee_coins.to_list():
 
-                amount:float   = divide_raw_balance(fee_coin.amount, fee_coin.denom)
-                amount_str:str = ("%.6f" % (amount)).rstrip('0').rstrip('.')
+                amount_str:str = format_raw_amount(fee_coin.amount, fee_coin.denom)
 
                 # Get the readable denom if this is an IBC token
                 denom:str = self.denomTrace(fee_coin.denom)
@@ -436,18 +442,19 @@ class SwapTransaction(TransactionCore):
             exit_profit:float = log_trade_params['exit_profit']
             exit_loss:float   = -abs(float(log_trade_params['exit_loss']))
 
-            conn   = sqlite3.connect(DB_FILE_NAME)
-            cursor = conn.cursor()
-            cursor.execute(insert_trade_query, [wallet_name, coin_from, amount_from, price_from, coin_to, amount_to, price_to, json.dumps(fees), exit_profit, exit_loss, tx_hash])
-            
-            new_id = cursor.lastrowid
-            conn.commit()
+            # Work out the exit prices now, so the trading bot can find triggered trades with a range query
+            exit_profit_price, exit_loss_price = exit_prices(coin_from, amount_from, coin_to, amount_to, exit_profit, exit_loss)
+
+            with database_transaction() as cursor:
+                cursor.execute(insert_trade_query, [wallet_name, coin_from, amount_from, price_from, coin_to, amount_to, price_to, json.dumps(fees), exit_profit, exit_loss, tx_hash, exit_profit_price, exit_loss_price])
+                new_id = cursor.lastrowid
 
             return new_id
             
         else:
             return 0
 
+    @trace_phase('simulate')
     def offChainSimulate(self) -> bool:
         """
         Simulate an offchain swap so we can get the fee details.
@@ -515,8 +522,8 @@ class SwapTransaction(TransactionCore):
         # Figure out the minimum expected coins for this swap:
         fee_multiplier:float = OSMOSIS_FEE_MULTIPLIER
         
-        current_amount:int = self.swap_amount
-        current_denom:str  = self.swap_denom
+        current_amount:Amount = Amount(self.swap_amount, self.swap_denom)
+        current_denom:str     = self.swap_denom
 
         # For each route:
         # Step 1: convert the current coin to the base price
@@ -533,55 +540,35 @@ class SwapTransaction(TransactionCore):
             # Get the prices for the current denom and the output denom
             coin_prices:json = self.getPrices(current_denom, token_out_denom)
             
-            # Get the initial base price (no fee deductions)
-            base_amount = (current_amount * coin_prices['from']) / coin_prices['to']
-
-            #step 1: run price conversion
-            #step 2: divide by $eth precision
-            #Step 3: multiple by Cosmo precision
-            #step 4: round to cosmo precision
-
-            from_precision:int   = get_precision(current_denom)
-            target_precision:int = get_precision(token_out_denom)
-
-            if from_precision != target_precision:
-                base_amount:float = divide_raw_balance(base_amount, current_denom)
-            
-            # Only multiply if the token out demo has a higher precision
-            if target_precision < from_precision:
-                base_amount:float = multiply_raw_balance(base_amount, token_out_denom)
+            # Get the initial base price (no fee deductions).
+            # This also moves the amount from the precision of the current coin to the token out precision.
+            price_rate:Decimal = to_decimal(coin_prices['from']) / to_decimal(coin_prices['to'])
+            base_amount:Amount = current_amount.convert(token_out_denom, price_rate)
 
             # deduct the swap fee:
             #print ('pool:', self.osmosisPoolByID(route['pool_id']))
             try:
-                swap_fee:float = float(self.osmosisPoolByID(route['pool_id']).pool_params.swap_fee)
+                swap_fee:Decimal = self.osmosisPoolByID(route['pool_id']).swap_fee
             except Exception as err:
                 # Something went wrong, we'll abandon this attempt
                 return False
             
             #print ('swap fee:', swap_fee)
             # Deduct the swap fee
-            base_amount_minus_swap_fee:float = float(base_amount) * (1 - swap_fee)
+            base_amount_minus_swap_fee:Amount = base_amount.multiply(1 - swap_fee)
 
             # Deduct the slippage
-            base_amount_minus_swap_fee = float(base_amount_minus_swap_fee * (1 - max_spread))
+            base_amount_minus_swap_fee = base_amount_minus_swap_fee.multiply(1 - to_decimal(max_spread))
 
             # Now we have the new denom and the new value
-            prev_denom:str       = current_denom
-            current_denom:str    = token_out_denom        
-            current_amount:float = base_amount_minus_swap_fee
-            precision:int        = get_precision(token_out_denom)
-
-        from_precision:int   = get_precision(prev_denom)
-        target_precision:int = get_precision(current_denom)
-                    
-        if target_precision > from_precision:
-            current_amount = multiply_raw_balance(current_amount, current_denom)
+            current_denom:str     = token_out_denom        
+            current_amount:Amount = base_amount_minus_swap_fee
             
         # Finish off the final value and store it:
-        precision:int  = get_precision(current_denom)
-        current_amount = round(current_amount, precision)
-        self.min_out   = math.floor(current_amount)
+        self.min_out = int(current_amount)
+
+        # The gas depends on how many pools we're going through
+        self.gas_limit = self.cachedGasLimit('MsgSwapExactAmountIn', shape = str(len(self.ibc_routes)), default_adjustment = GAS_ADJUSTMENT_OSMOSIS)
         
         self.offChainSwap()
 
@@ -601,8 +588,7 @@ class SwapTransaction(TransactionCore):
             
             # Now calculate the actual fee
             #(0.007264 * 0.424455) / 0.00006641 = 43.7972496474
-            min_uosmo_gas:float = MIN_OSMO_GAS
-            uosmo_fee:float     = min_uosmo_gas * float(self.gas_limit)
+            uosmo_fee:Amount = Amount(self.gas_limit, UOSMO).multiply(MIN_OSMO_GAS, round_up = True)
 
             # Calculate the LUNC fee
             # (osmosis amount * osmosis unit cost) / lunc price
@@ -615,13 +601,13 @@ class SwapTransaction(TransactionCore):
             prices:json = self.getPrices(from_denom, to_denom)
             
             # OSMO -> LUNC:
-            fee_amount:float = float((uosmo_fee * prices['from']) / prices['to'])
-            fee_amount       = fee_amount * fee_multiplier
-            fee_denom:str    = fee_coin.denom
-            fee_denom:str    = 'ibc/0EF15DF2F02480ADE0BB6E85D9EBB5DAEA2836D3860E9F97F9AADE4F57A31AA0'
+            fee_amount:Amount = uosmo_fee.convert(to_denom, to_decimal(prices['from']) / to_decimal(prices['to']))
+            fee_amount        = fee_amount.multiply(fee_multiplier)
+            fee_denom:str     = fee_coin.denom
+            fee_denom:str     = 'ibc/0EF15DF2F02480ADE0BB6E85D9EBB5DAEA2836D3860E9F97F9AADE4F57A31AA0'
 
             # Create the coin object
-            new_coin:Coins = Coins({Coin(fee_denom, int(fee_amount))})
+            new_coin:Coins = Coins({fee_amount.toCoin(fee_denom)})
 
             # This will be used by the swap function next time we call it
             self.fee.amount = new_coin
@@ -634,6 +620,7 @@ class SwapTransaction(TransactionCore):
         else:
             return False
 
+    @trace_phase('sign')
     def offChainSwap(self) -> bool:
         """
         Make an offchain swap with the information we have so far.
@@ -674,7 +661,7 @@ class SwapTransaction(TransactionCore):
                 account_number = self.account_number,
                 fee            = self.fee,
                 gas            = self.gas_limit,
-                gas_adjustment = GAS_ADJUSTMENT_OSMOSIS,
+                gas_adjustment = self.gas_adjustment,
                 msgs           = [tx_msg],
                 sequence       = self.sequence
             )
@@ -689,7 +676,7 @@ class SwapTransaction(TransactionCore):
             print (err)
             return False
 
-    def osmosisPoolByID(self, pool_id:int) -> Pool:
+    def osmosisPoolByID(self, pool_id:int) -> PoolState:
         """
         Get the pool details for the provided pool id.
         Save them in memory so we can access individual details and discover the best paths.
@@ -697,15 +684,15 @@ class SwapTransaction(TransactionCore):
         @params:
             - pool_id: the Pool ID that we want to get info on
 
-        @return: a Pool object matching the provided ID
+        @return: a PoolState object matching the provided ID
         """
 
-        result:Pool = None
+        result:PoolState = None
 
         if pool_id not in self.osmosis_pools:
             # Get this pool:
             try:
-                pool:Pool = self.terra.pool.osmosis_pool(pool_id)
+                pool:PoolState = PoolState.fromPool(self.terra.pool.osmosis_pool(pool_id))
                 # Save it in the publicly available object:
                 self.osmosis_pools[pool.id] = pool
 
@@ -769,6 +756,7 @@ class SwapTransaction(TransactionCore):
 
         return use_market_swap
       
+    @trace_phase('simulate')
     def simulate(self) -> bool:
         """
         Simulate a delegation so we can get the fee details.
@@ -817,15 +805,14 @@ class SwapTransaction(TransactionCore):
             self.fee = self.calculateFee(requested_fee, ULUNA)
 
             # Figure out the fee structure
-            fee_bit:Coin = Coin.from_str(str(requested_fee.amount))
-            fee_amount   = fee_bit.amount
-            fee_denom    = fee_bit.denom
+            fee_amount:Amount = Amount.fromCoins(requested_fee.amount)
+            fee_denom:str     = fee_amount.denom
 
             # Calculate the tax portion 
             if self.swap_denom in NON_ULUNA_COINS.values():
                 self.tax = None
             else:
-                self.tax = int(math.ceil(self.swap_amount * float(self.tax_rate)))
+                self.tax = int(Amount(self.swap_amount, self.swap_denom).multiply(self.tax_rate, round_up = True))
 
             # Build a fee object
             if fee_denom == ULUNA and self.swap_denom == ULUNA:
@@ -862,6 +849,7 @@ class SwapTransaction(TransactionCore):
         else:
             return False
     
+    @trace_phase('sign')
     def swap(self) -> bool:
         """
         Make a swap with the information we have so far.
@@ -1117,7 +1105,7 @@ class SwapTransaction(TransactionCore):
                         estimated_amount = float(self.swap_amount * swap_price)
                     
         else:
-            if self.swap_denom in OFFCHAIN_COINS + [ULUNA] and self.swap_request_denom in OFFCHAIN_COINS + [ULUNA]:
+            if (self.swap_denom in OFFCHAIN_COINS or self.swap_denom == ULUNA) and (self.swap_request_denom in OFFCHAIN_COINS or self.swap_request_denom == ULUNA):
                 # Calculate the amount of OSMO (or whatever) we'll be getting:
                 # (lunc amount * lunc unit cost) / osmo price
                 if self.wallet_denom in CHAIN_DATA and self.swap_request_denom in CHAIN_DATA[self.wallet_denom]['ibc_channels']:
@@ -1137,6 +1125,7 @@ class SwapTransaction(TransactionCore):
         #print (self.swap_denom, ' to ', self.swap_request_denom, ' = ', estimated_amount)
         return estimated_amount
 
+@trace_transaction('swap')
 def swap_coins(wallet, swap_coin:Coin, swap_to_denom:str, estimated_amount:int = 0, silent_mode:bool = False, log_trade:bool = False, log_trade_params:dict = {}):
     """
     A wrapper function for workflows and wallet management.
@@ -1174,9 +1163,6 @@ def swap_coins(wallet, swap_coin:Coin, swap_to_denom:str, estimated_amount:int =
     swap_tx.swap_request_denom = swap_to_denom
     swap_tx.wallet_denom       = wallet.denom
 
-    # Bump up the gas adjustment - it needs to be higher for swaps it turns out
-    swap_tx.terra.gas_adjustment = float(GAS_ADJUSTMENT_SWAPS)
-
     # Set the contract based on what we've picked
     # As long as the swap_denom and swap_request_denom values are set, the correct contract should be picked
     use_market_swap:bool  = swap_tx.setContract()
@@ -4,9 +4,12 @@
 from constants.constants import (
     CHAIN_DATA,
     GAS_ADJUSTMENT,
+    LCD_URL_OVERRIDE,
     UOSMO
 )
 
+from classes.rate_limiter import install_lcd_rate_limits
+
 from terra_classic_sdk.client.lcd import LCDClient
     
 class TerraInstance:
@@ -37,8 +40,15 @@ class TerraInstance:
                     
             if 'lcd_urls' in CHAIN_DATA[denom]:
                 self.url = CHAIN_DATA[denom]['lcd_urls'][0]
+
+            # Used for benchmarks and testing against a local server
+            if LCD_URL_OVERRIDE is not None:
+                self.url = LCD_URL_OVERRIDE
             
             if self.chain_id is not None and self.url is not None:
+                # Every LCD client shares the rate limits for its host
+                install_lcd_rate_limits()
+
                 terra:LCDClient = LCDClient(
                     chain_id       = self.chain_id,
                     gas_adjustment = float(self.gas_adjustment),
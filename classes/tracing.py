@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from constants.constants import (
+    TRACE_FILE_NAME
+)
+
+# The spans that are open on each thread, innermost last
+thread_data = threading.local()
+
+# Only one thread can write to the trace file at a time
+export_lock = threading.Lock()
+
+# The transaction phases. These never contain each other, so a transaction signed during a simulation is part of the simulation.
+TRACE_PHASES:list = ['simulate', 'sign', 'broadcast', 'confirm']
+
+def current_spans() -> list:
+    """
+    Get the list of open spans for this thread.
+
+    @params:
+        - None
+
+    @return: the open spans, with the innermost span last
+    """
+
+    if getattr(thread_data, 'spans', None) is None:
+        thread_data.spans = []
+
+    return thread_data.spans
+
+def export_trace(spans:list) -> bool:
+    """
+    Add a finished trace to the trace file. Each line is an OTLP JSON export request,
+    so the file can be loaded by the OpenTelemetry collector (otlpjsonfile receiver) or anything else that reads OTLP.
+
+    @params:
+        - spans: every span in this trace
+
+    @return: True if the trace was saved
+    """
+
+    export:dict = {
+        'resourceSpans': [{
+            'resource': {'attributes': otlp_attributes({'service.name': 'utility-scripts'})},
+            'scopeSpans': [{
+                'scope': {'name': 'classes.tracing'},
+                'spans': [span.otlp() for span in spans]
+            }]
+        }]
+    }
+
+    try:
+        with export_lock:
+            with open(TRACE_FILE_NAME, 'a') as trace_file:
+                trace_file.write(json.dumps(export) + '\n')
+    except Exception as err:
+        print (f' 🛑 The trace could not be saved to {TRACE_FILE_NAME}:')
+        print (err)
+        return False
+
+    return True
+
+def otlp_attributes(attributes:dict) -> list:
+    """
+    Convert a dictionary of attributes into the OTLP key/value list.
+
+    @params:
+        - attributes: a dictionary of strings, numbers and booleans
+
+    @return: a list of OTLP attributes
+    """
+
+    result:list = []
+    for key in attributes:
+        value = attributes[key]
+        if isinstance(value, bool):
+            result.append({'key': key, 'value': {'boolValue': value}})
+        elif isinstance(value, int):
+            result.append({'key': key, 'value': {'intValue': str(value)}})
+        elif isinstance(value, float):
+            result.append({'key': key, 'value': {'doubleValue': value}})
+        else:
+            result.append({'key': key, 'value': {'stringValue': str(value)}})
+
+    return result
+
+def set_trace_attribute(key:str, value) -> bool:
+    """
+    Add an attribute to the current span and to the root span of this trace, ie: the transaction hash once we know it.
+
+    @params:
+        - key: the attribute name
+        - value: the attribute value
+
+    @return: True if there was a span to add it to
+    """
+
+    spans:list = current_spans()
+    if len(spans) == 0 or value is None:
+        return False
+
+    spans[0].attributes[key]  = value
+    spans[-1].attributes[key] = value
+
+    return True
+
+def transaction_attributes(transaction) -> dict:
+    """
+    Get the chain, class and hash attributes for a transaction object.
+
+    @params:
+        - transaction: a TransactionCore object
+
+    @return: a dictionary of attributes
+    """
+
+    attributes:dict = {'code.namespace': type(transaction).__name__}
+
+    terra = getattr(transaction, 'terra', None)
+    if terra is not None:
+        attributes['chain.id'] = terra.chain_id
+
+    broadcast_result = getattr(transaction, 'broadcast_result', None)
+    if broadcast_result is not None and getattr(broadcast_result, 'txhash', None) is not None:
+        attributes['tx.hash'] = broadcast_result.txhash
+
+    return attributes
+
+def start_span(name:str, attributes:dict = None):
+    """
+    Open a span for a block of code, ie: with start_span('broadcast'):
+    If tracing is turned off, then nothing is recorded.
+
+    @params:
+        - name: the name of the operation
+        - attributes: any details about this operation
+
+    @return: a context manager for the 'with' block
+    """
+
+    if TRACE_FILE_NAME is None:
+        return contextlib.nullcontext()
+
+    return TraceSpan().create(name, attributes)
+
+def trace_phase(phase:str):
+    """
+    A decorator for transaction methods, so each simulate/sign/broadcast/confirm phase gets its own span.
+    If a phase is already open (like signing inside a simulation), then no new span is made.
+
+    @params:
+        - phase: one of TRACE_PHASES
+
+    @return: the decorator
+    """
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def traced_method(self, *args, **kwargs):
+            if TRACE_FILE_NAME is None:
+                return function(self, *args, **kwargs)
+
+            spans:list = current_spans()
+            if len(spans) > 0 and spans[-1].name in TRACE_PHASES:
+                return function(self, *args, **kwargs)
+
+            with TraceSpan().create(phase, dict(transaction_attributes(self), **{'code.function': function.__qualname__})) as span:
+                result = function(self, *args, **kwargs)
+
+                if result is False or getattr(result, 'is_error', False) == True:
+                    span.setError(f'{function.__qualname__} did not succeed')
+                elif getattr(result, 'transaction_confirmed', None) == False:
+                    span.setError('The transaction was not found')
+
+                set_trace_attribute('tx.hash', transaction_attributes(self).get('tx.hash', None))
+
+            return result
+
+        return traced_method
+
+    return decorator
+
+def trace_transaction(tx_type:str):
+    """
+    A decorator for the transaction wrapper functions (send_transaction, swap_coins, etc).
+    Every phase of the transaction is recorded under one trace with the wallet and chain details.
+    The first argument of the wrapped function must be the wallet.
+
+    @params:
+        - tx_type: the kind of transaction, ie: send
+
+    @return: the decorator
+    """
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def traced_function(wallet, *args, **kwargs):
+            if TRACE_FILE_NAME is None:
+                return function(wallet, *args, **kwargs)
+
+            attributes:dict = {'tx.type': tx_type, 'wallet.name': wallet.name, 'wallet.address': wallet.address}
+            if getattr(wallet, 'terra', None) is not None:
+                attributes['chain.id'] = wallet.terra.chain_id
+
+            with TraceSpan().create(tx_type, attributes) as span:
+                result = function(wallet, *args, **kwargs)
+
+                if getattr(result, 'is_error', False) == True:
+                    span.setError(str(getattr(result, 'message', '')).strip())
+
+            return result
+
+        return traced_function
+
+    return decorator
+
+class TraceSpan():
+    """
+    One timed operation. Spans are opened with a 'with' block, and the outermost span on a thread is the root of the trace.
+    When the root span finishes, the whole trace is written to TRACE_FILE_NAME.
+    """
+
+    def __init__(self):
+        self.attributes:dict    = {}
+        self.children:list      = []
+        self.end_time:int       = None
+        self.name:str           = None
+        self.parent_span_id:str = ''
+        self.span_id:str        = None
+        self.start_time:int     = None
+        self.status_code:int    = 1 # OK
+        self.status_message:str = ''
+        self.trace_id:str       = None
+
+    def create(self, name:str, attributes:dict = None) -> TraceSpan:
+        """
+        Create a span. The timer doesn't start until the 'with' block is entered.
+
+        @params:
+            - name: the name of the operation, ie: simulate
+            - attributes: any details about this operation
+
+        @return: self
+        """
+
+        self.name    = name
+        self.span_id = os.urandom(8).hex()
+
+        if attributes is not None:
+            self.attributes = dict(attributes)
+
+        return self
+
+    def __enter__(self) -> TraceSpan:
+        spans:list = current_spans()
+
+        if len(spans) > 0:
+            self.trace_id       = spans[-1].trace_id
+            self.parent_span_id = spans[-1].span_id
+            spans[0].children.append(self)
+
+            # Every span in the trace can be filtered by the wallet and transaction type
+            for key in ['tx.type', 'wallet.name', 'chain.id']:
+                if key in spans[0].attributes and key not in self.attributes:
+                    self.attributes[key] = spans[0].attributes[key]
+        else:
+            self.trace_id = os.urandom(16).hex()
+
+        spans.append(self)
+        self.start_time = time.time_ns()
+
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback) -> bool:
+        self.end_time = time.time_ns()
+
+        if exception is not None:
+            self.setError(f'{exception_type.__name__}: {exception}')
+
+        spans:list = current_spans()
+        if self in spans:
+            spans.remove(self)
+
+        # The root span has finished, so the trace is complete
+        if self.parent_span_id == '':
+            export_trace([self] + self.children)
+
+        # Don't hide any exceptions
+        return False
+
+    def otlp(self) -> dict:
+        """
+        Return this span in the OTLP JSON format.
+
+        @params:
+            - None
+
+        @return: a dictionary that can be added to an OTLP export request
+        """
+
+        return {
+            'traceId':           self.trace_id,
+            'spanId':            self.span_id,
+            'parentSpanId':      self.parent_span_id,
+            'name':              self.name,
+            'kind':              1, # INTERNAL
+            'startTimeUnixNano': str(self.start_time),
+            'endTimeUnixNano':   str(self.end_time),
+            'attributes':        otlp_attributes(self.attributes),
+            'status':            {'code': self.status_code, 'message': self.status_message}
+        }
+
+    def setError(self, message:str) -> bool:
+        """
+        Mark this span as failed.
+
+        @params:
+            - message: what went wrong
+
+        @return: True
+        """
+
+        self.status_code    = 2 # ERROR
+        self.status_message = message
+
+        return True
@@ -4,27 +4,24 @@
 from __future__ import annotations
 
 import json
-import requests
-import sqlite3
+import math
 import time
 
 from hashlib import sha256
-from sqlite3 import Cursor, Connection
+from sqlite3 import Cursor
 
 from classes.common import (
-    divide_raw_balance,
-    get_precision
+    format_raw_amount
 )
 
 from constants.constants import (
     BASE_SMART_CONTRACT_ADDRESS,
-    BUSY_RETRY_COUNT,
     CANDY_SMART_CONTRACT_ADDRESS,
     CHAIN_DATA,
     COIN_ALIASES,
     CREMAT_SMART_CONTRACT_ADDRESS,
-    DB_FILE_NAME,
     FULL_COIN_LOOKUP,
+    GAS_OUT_OF_GAS_INCREASE,
     #GAS_PRICE_URI,
     GRDX_SMART_CONTRACT_ADDRESS,
     LENNY_SMART_CONTRACT_ADDRESS,
@@ -32,9 +29,16 @@ from constants.constants import (
     SEARCH_RETRY_COUNT,
     UBASE,
     ULUNA,
+    USE_GAS_ESTIMATES,
     UUSD
 )
 
+from classes.chain_params import chain_params, observe_height
+from classes.database import database_transaction, get_cursor
+from classes.gas_estimates import GasEstimates
+from classes.http_client import RequestError, call_with_retries, get_json, lcd_host
+from classes.tracing import set_trace_attribute, start_span, trace_phase, transaction_attributes
+
 from terra_classic_sdk.client.lcd import LCDClient
 from terra_classic_sdk.client.lcd.api.tx import TxInfo, Tx
 from terra_classic_sdk.client.lcd.wallet import Wallet
@@ -56,6 +60,10 @@ class TransactionCore():
         self.cached_traces:dict                      = {}
         self.current_wallet:Wallet                   = None # The generated wallet based on the provided details
         self.fee:Fee                                 = None
+        self.gas_adjustment:float                    = None  # The gas adjustment that was used in the simulation
+        self.gas_cached:bool                         = False # True if the gas limit came from previous transactions
+        self.gas_key:list                            = None # The chain, message type, contract and shape of this transaction
+        self.gas_limit:str                           = 'auto'
         self.gas_list:json                           = None
         #self.gas_price_url:str                       = None
         self.ibc_routes:list                         = None # Only used by swaps
@@ -87,8 +95,11 @@ class TransactionCore():
         transaction_result:TransactionResult = TransactionResult()
 
         try:
-            transaction_result.broadcast_result = self.terra.tx.broadcast_sync(self.transaction)
-            self.broadcast_result = transaction_result.broadcast_result
+            with start_span('broadcast', transaction_attributes(self)):
+                transaction_result.broadcast_result = self.terra.tx.broadcast_sync(self.transaction)
+                self.broadcast_result = transaction_result.broadcast_result
+
+                set_trace_attribute('tx.hash', getattr(self.broadcast_result, 'txhash', None))
         except Exception as err:
             transaction_result.message          = ' 🛑 A broadcast error occurred.'
             transaction_result.log              = err
@@ -107,33 +118,61 @@ class TransactionCore():
                 # Send this back for a retry with a higher gas adjustment value
                 return transaction_result
             else:
-                # Put in a loop for busy LCDs here:
-
-                retry_count: int = 0
-                found: bool      = False
-                # Find the transaction on the network and return the result
-                while retry_count < BUSY_RETRY_COUNT:
-                    try:
-                        transaction_result:TransactionResult = self.findTransaction()
-
-                        if transaction_result.transaction_confirmed == True:
-                            transaction_result.message = 'This transaction should be visible in your wallet now.'
-                        else:
-                            transaction_result.message = 'The transaction did not appear. Future transactions might fail due to a lack of expected funds.'
-                            
-                        found = True
-                        break
-                    except Exception as err:
-                        retry_count += 1
-                        print (f'    {err}')
-                        print (f'    The LCD is busy - trying again {retry_count}/{BUSY_RETRY_COUNT}')
-                         
-                if found == False:
+                # Find the transaction on the network and return the result. Busy LCDs are retried with a backoff.
+                try:
+                    transaction_result:TransactionResult = call_with_retries(lcd_host(self.terra), self.findTransaction, silent = False)
+
+                    if transaction_result.transaction_confirmed == True:
+                        transaction_result.message = 'This transaction should be visible in your wallet now.'
+                    else:
+                        transaction_result.message = 'The transaction did not appear. Future transactions might fail due to a lack of expected funds.'
+                except Exception as err:
                     transaction_result = TransactionResult()
                     transaction_result.message = 'An unexpected error occurred when broadcasting.'
                  
         return transaction_result
     
+    def cachedGasLimit(self, msg_type:str, contract:str = '', shape:str = '', default_adjustment:float = None):
+        """
+        Get the gas limit for this kind of transaction, based on what previous transactions actually used.
+        If we've seen enough of them, the simulation round trip can be skipped.
+
+        If it still needs to be simulated, then the gas adjustment for this message type is learned from
+        previous transactions as well, and applied to the LCD client.
+        The key is remembered so the confirmed result can be learned from.
+
+        @params:
+            - msg_type: the message type, ie: MsgSend
+            - contract: the contract address, if this is a contract call
+            - shape: anything else that changes the amount of gas, like the denom being sent
+            - default_adjustment: the gas adjustment to use if nothing has been learned yet. Defaults to the LCD client value.
+
+        @return: a gas limit, or 'auto' if this transaction needs to be simulated
+        """
+
+        if default_adjustment is None:
+            default_adjustment = self.terra.gas_adjustment
+
+        self.gas_key    = [self.terra.chain_id, msg_type, contract, shape]
+        self.gas_cached = False
+
+        estimates:GasEstimates = GasEstimates().create()
+
+        gas_limit = 'auto'
+        if USE_GAS_ESTIMATES == True:
+            estimate:int = estimates.estimate(*self.gas_key)
+
+            if estimate is not None:
+                gas_limit       = str(estimate)
+                self.gas_cached = True
+
+        self.gas_adjustment       = estimates.adjustment(self.terra.chain_id, msg_type, float(default_adjustment))
+        self.terra.gas_adjustment = self.gas_adjustment
+
+        estimates.close()
+
+        return gas_limit
+
     def cachePrices(self) -> bool:
         """
         Load all the coin prices into a dictionary we can use later.
@@ -144,39 +183,25 @@ class TransactionCore():
         @return: True
         """
 
-        retry_count:int  = 0
-        retry:bool       = True
-        
         if self.prices is None:
-            while retry == True:
-                try:
-                    # Get all the prices we are interested in and cache them so we don't get rate limited by Coingecko
-                    id_str:str = ''
-                    for denom in CHAIN_DATA:
-                        id_str += CHAIN_DATA[denom]['coingecko_id'] + ','
-
-                    uri:str     = 'https://api.coingecko.com/api/v3/simple/price'
-                    params:dict = {  
-                        'ids': id_str,
-                        'vs_currencies': 'USD'
-                    }
+            try:
+                # Get all the prices we are interested in and cache them so we don't get rate limited by Coingecko
+                id_str:str = ''
+                for denom in CHAIN_DATA:
+                    id_str += CHAIN_DATA[denom]['coingecko_id'] + ','
 
-                    self.prices = requests.get(uri, params = params).json()
+                uri:str     = 'https://api.coingecko.com/api/v3/simple/price'
+                params:dict = {  
+                    'ids': id_str,
+                    'vs_currencies': 'USD'
+                }
 
-                    # Exit this loop
-                    retry = False
-                    break
+                self.prices = get_json(uri, params)
 
-                except Exception as err:
-                    retry_count += 1
-                    if retry_count == 10:
-                        print (' 🛑 Error getting coin prices')
-                        print (err)
-
-                        retry = False
-                        exit()
-                    else:
-                        time.sleep(1)
+            except RequestError as err:
+                print (' 🛑 Error getting coin prices')
+                print (err)
+                exit()
 
         return True
             
@@ -271,44 +296,28 @@ class TransactionCore():
             insert_ibc_denom = "INSERT INTO ibc_denoms (ibc_denom, readable_denom) VALUES (?, ?);"
 
             # Get the database results
-            conn:Connection = sqlite3.connect(DB_FILE_NAME)
-            cursor:Cursor   = conn.execute(get_ibc_query, [uri])
-            row:list        = cursor.fetchone()
+            cursor:Cursor = get_cursor().execute(get_ibc_query, [uri])
+            row:list      = cursor.fetchone()
 
             if row is None:
                 # Go and get this denom trace:
+                try:
+                    trace_result:json = get_json(uri)
 
-                retry_count:int = 0
-                retry:bool      = True
-
-                while retry == True:
-                    try:
-                        trace_result:json = requests.get(uri).json()
-                    
-                        if 'denom_trace' in trace_result:
-                            # Return this result
-                            result = trace_result['denom_trace']['base_denom']
-                            
-                            # Add this IBC value and readable version into the database:
-                            cursor:Cursor = conn.execute(insert_ibc_denom, [uri, result])
-                            conn.commit()
-
-                            # Store this result for future requests
-                            self.cached_traces[uri] = result
-                            
-                            break
-                        else:
-                            break
-                    except Exception as err:
-                        retry_count += 1
-                        if retry_count == 10:
-                            print (f'Denom trace error for {uri}:')
-                            print (err)
-                            retry  = False
-                            result = ''
-                            break
-                        else:
-                            time.sleep(1)
+                    if 'denom_trace' in trace_result:
+                        # Return this result
+                        result = trace_result['denom_trace']['base_denom']
+                        
+                        # Add this IBC value and readable version into the database:
+                        with database_transaction() as cursor:
+                            cursor.execute(insert_ibc_denom, [uri, result])
+
+                        # Store this result for future requests
+                        self.cached_traces[uri] = result
+                except RequestError as err:
+                    print (f'Denom trace error for {uri}:')
+                    print (err)
+                    result = ''
             else:
                 # This IBC entry is in the database
                 result = row[0]
@@ -321,6 +330,7 @@ class TransactionCore():
 
         return result
         
+    @trace_phase('confirm')
     def findTransaction(self) -> TransactionResult:
         """
         Do a search for any transaction with the current tx hash.
@@ -348,6 +358,9 @@ class TransactionCore():
             # We will be the current height - 1 just in case it rolled over just as we started the search
             block_height:int = int(self.terra.tendermint.block_info()['block']['header']['height']) - 1
 
+            # This lets the chain parameters know if we've moved into a new epoch
+            observe_height(self.terra.chain_id, block_height)
+
             # Build the transaction search object:
             result:dict = self.terra.tx.search([
                 ("message.sender", self.current_wallet.key.acc_address),
@@ -475,6 +488,9 @@ class TransactionCore():
                         if self.silent_mode == False:
                             print ('\n ⭐ Found the hash!')
 
+                        # Remember how much gas this actually used for next time
+                        self.learnGas(info.gas_wanted, info.gas_used)
+
                         time.sleep(1)
                         transaction_result.transaction_confirmed = True
                         break
@@ -486,6 +502,13 @@ class TransactionCore():
                             break
                     else:
                         #result['txs'][0].code == 5:
+                        if result['txs'][0].code == 11:
+                            # Out of gas - go back to simulating this kind of transaction, or ask for more gas next time
+                            if self.gas_cached == True:
+                                self.forgetGas()
+                            else:
+                                self.learnOutOfGas(info.gas_wanted)
+
                         transaction_result.code     = result['txs'][0].code
                         transaction_result.log      = info.rawlog
                         transaction_result.is_error = True
@@ -506,9 +529,26 @@ class TransactionCore():
         # Return the completed transaction result
         return transaction_result
 
+    def forgetGas(self) -> bool:
+        """
+        Remove the gas estimate for this kind of transaction, so the next one is simulated again.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        if self.gas_key is not None:
+            estimates:GasEstimates = GasEstimates().create()
+            estimates.forget(*self.gas_key)
+            estimates.close()
+
+        return True
+
     def gasList(self) -> json:
         """
-        Make a JSON request for the gas prices, and store it against this LCD client instance.
+        Get the gas prices from the shared chain parameters, and store it against this LCD client instance.
         This returns a full list of gas tokens, in JSON format:
         {'uluna': '28.325', 'usdr': '0.52469', 'uusd': '0.75', 'ukrw': '850.0', 'umnt': '2142.855', 'ueur': '0.625', 'ucny': '4.9', 'ujpy': '81.85', 'ugbp': '0.55', 'uinr': '54.4', 'ucad': '0.95', 'uchf': '0.7', 'uaud': '0.95', 'usgd': '1.0', 'uthb': '23.1', 'usek': '6.25', 'unok': '6.25', 'udkk': '4.5', 'uidr': '10900.0', 'uphp': '38.0', 'uhkd': '5.85', 'umyr': '3.0', 'utwd': '20.0'}
 
@@ -537,7 +577,7 @@ class TransactionCore():
         #         print (' 🛑 Error getting gas prices')
         #         print (requests.get(self.gas_price_url).content)
 
-        self.gas_list = {'uluna': '28.325', 'usdr': '0.52469', 'uusd': '0.75', 'ukrw': '850.0', 'umnt': '2142.855', 'ueur': '0.625', 'ucny': '4.9', 'ujpy': '81.85', 'ugbp': '0.55', 'uinr': '54.4', 'ucad': '0.95', 'uchf': '0.7', 'uaud': '0.95', 'usgd': '1.0', 'uthb': '23.1', 'usek': '6.25', 'unok': '6.25', 'udkk': '4.5', 'uidr': '10900.0', 'uphp': '38.0', 'uhkd': '5.85', 'umyr': '3.0', 'utwd': '20.0'}
+        self.gas_list = chain_params(self.terra).gasPrices()
         
         return self.gas_list
     
@@ -578,20 +618,13 @@ class TransactionCore():
         @return: bool (true if sequence number was set, false if not)
         """
 
-        retry_count: int = 0
-        result: bool  = False
-
-        while retry_count < BUSY_RETRY_COUNT:
-            try:
-                self.sequence = self.current_wallet.sequence()
-                result = True
-                break
-            except Exception as err:
-                retry_count += 1
-                print (f'    {err}')
-                print (f'    The LCD is busy - trying again {retry_count}/{BUSY_RETRY_COUNT}')
+        try:
+            self.sequence = call_with_retries(lcd_host(self.terra), self.current_wallet.sequence, silent = False)
+        except Exception as err:
+            print (f'    {err}')
+            return False
 
-        return result
+        return True
         
     def IBCfromDenom(self, channel_id:str, denom:str) -> str:
         """
@@ -610,6 +643,54 @@ class TransactionCore():
 
         return ibc_result
 
+    def learnGas(self, gas_wanted:int, gas_used:int) -> bool:
+        """
+        Update the gas estimate for this kind of transaction with what a confirmed transaction actually used.
+        If the gas limit was simulated, then it is also kept as a sample for learning the gas adjustment.
+        Nothing is learned if cachedGasLimit() wasn't called for this transaction.
+
+        @params:
+            - gas_wanted: the gas limit that the transaction was signed with
+            - gas_used: the gas used by the transaction
+
+        @return: True
+        """
+
+        if self.gas_key is not None and gas_used is not None:
+            estimates:GasEstimates = GasEstimates().create()
+
+            if USE_GAS_ESTIMATES == True:
+                estimates.learn(*self.gas_key, gas_used)
+
+            if self.gas_cached == False and self.gas_adjustment is not None and gas_wanted is not None:
+                estimates.recordSample(self.gas_key[0], self.gas_key[1], gas_wanted, gas_used, self.gas_adjustment)
+
+            estimates.close()
+
+        return True
+
+    def learnOutOfGas(self, gas_wanted:int) -> bool:
+        """
+        Learn from a simulated transaction that ran out of gas.
+        The gas used is about the same as the gas wanted, so it doesn't tell us how much was really needed.
+        Instead, a sample is recorded as if it needed GAS_OUT_OF_GAS_INCREASE more, which raises the gas adjustment for this message type.
+        The gas estimate is left alone.
+
+        @params:
+            - gas_wanted: the gas limit that the transaction was signed with
+
+        @return: True if a sample was recorded
+        """
+
+        if self.gas_key is None or self.gas_cached == True or self.gas_adjustment is None or gas_wanted is None:
+            return False
+
+        estimates:GasEstimates = GasEstimates().create()
+        estimates.recordSample(self.gas_key[0], self.gas_key[1], gas_wanted, int(math.ceil(int(gas_wanted) * (1 + GAS_OUT_OF_GAS_INCREASE))), self.gas_adjustment)
+        estimates.close()
+
+        return True
+
     def readableFee(self) -> str:
         """
         Return a description of the fee for the current transaction.
@@ -661,8 +742,7 @@ class TransactionCore():
             first:bool     = True
             for fee_coin in fee_coins.to_list():
 
-                amount:float   = divide_raw_balance(fee_coin.amount, fee_coin.denom)
-                amount_str:str = ("%.6f" % (amount)).rstrip('0').rstrip('.')
+                amount_str:str = format_raw_amount(fee_coin.amount, fee_coin.denom)
 
                 # Get the readable denom if this is an IBC token
                 denom:str = self.denomTrace(fee_coin.denom)
@@ -681,8 +761,8 @@ class TransactionCore():
     
     def taxRate(self) -> float:
         """
-        Query the terra treasury object for the current tax rate.
-        We are not caching it so that tax changes will be automatically picked up.
+        Get the current tax rate from the shared chain parameters.
+        These are reloaded after a short time, or when the chain moves into a new epoch, so tax changes are still picked up.
 
         If this is not a columbus-5 (Luna Classic) chain, then assume the tax rate is zero.
 
@@ -692,10 +772,7 @@ class TransactionCore():
         @return: the tax rate as a float number
         """
 
-        if self.terra.chain_id == CHAIN_DATA[ULUNA]['chain_id']:
-            self.tax_rate = float(self.terra.treasury.tax_rate())
-        else:
-            self.tax_rate = 0
+        self.tax_rate = chain_params(self.terra).taxRate(self.terra)
 
         return self.tax_rate
 class TransactionResult(TransactionCore):
@@ -734,11 +811,7 @@ class TransactionResult(TransactionCore):
 
         denom:str = self.denomTrace(coin.denom)
         if denom in FULL_COIN_LOOKUP or denom in COIN_ALIASES :
-            precision:int = get_precision(denom)
-            lunc:float    = round(float(divide_raw_balance(coin.amount, denom)), precision)
-
-            target:str = '%.' + str(precision) + 'f'
-            lunc:str   = (target % (lunc)).rstrip('0').rstrip('.')
+            lunc:str = format_raw_amount(coin.amount, denom)
 
             if add_suffix:
                 if denom in FULL_COIN_LOOKUP:
@@ -7,6 +7,7 @@ from constants.constants import (
     USER_ACTION_QUIT
 )
 
+from classes.records import Validator as ValidatorRecord
 from classes.wallet import UserWallet
 from classes.terra_instance import TerraInstance
 
@@ -21,12 +22,13 @@ class Validators():
 
     def __iter_result__(self, validator:Validator) -> dict:
         """
-        An internal function which returns a dict object with validator details.
+        An internal function which stores a record of the validator details.
+        Only the details we use are kept, so the full list of validators stays small.
 
         @params:
             - validator: the validator we are interested in
 
-        @return: a dict of details about this validator
+        @return: None - the internal self.validators var is updated
         """
 
         # Get the basic details about validator
@@ -42,7 +44,7 @@ class Validators():
         
         commision_rate   = int(commission.commission_rates.rate * 100)
 
-        self.validators[moniker] = {'commission': commision_rate, 'details': details, 'identity': identity, 'is_jailed': is_jailed, 'moniker': moniker, 'operator_address': operator_address, 'status': status, 'token_count': token_count, 'unbonding_time': unbonding_time, 'voting_power': 0}
+        self.validators[moniker] = ValidatorRecord(commission = commision_rate, details = details, identity = identity, is_jailed = is_jailed, moniker = moniker, operator_address = operator_address, status = status, token_count = token_count, unbonding_time = unbonding_time)
         
     def create(self) -> dict:
         """
@@ -3,32 +3,29 @@
 
 from __future__ import annotations
 
-import cryptocode
 import json
-import requests
-import time
-import sqlite3
 import traceback
 
 
 from datetime import datetime
-from dateutil.tz import tz
+from decimal import Decimal
 from enum import Enum
-from pycoingecko import CoinGeckoAPI
-from sqlite3 import Cursor, Connection
+from sqlite3 import Cursor
 
 from classes.common import (
     coin_list,
-    divide_raw_balance,
-    get_precision,
+    format_raw_amount,
     get_user_choice,
     is_percentage,
-    multiply_raw_balance
+    multiply_raw_balance,
+    raw_integer,
+    readable_vote,
+    to_decimal,
+    to_raw_amount
 )
     
 from constants.constants import (
     CHAIN_DATA,
-    DB_FILE_NAME,
     FULL_COIN_LOOKUP,
     GRDX,
     NON_ULUNA_COINS,
@@ -37,12 +34,16 @@ from constants.constants import (
     ULUNA,
     USER_ACTION_CONTINUE,
     USER_ACTION_QUIT,
+    USE_WALLET_STATE_CACHE,
     UUSD,
     WITHDRAWAL_REMAINDER,
 )
 
-from classes.swap_transaction import SwapTransaction
+from classes.database import database_transaction, get_cursor
+from classes.http_client import RequestError, call_with_retries, get_json, lcd_host
+from classes.records import Balance, Delegation as DelegationRecord, Undelegation, intern_denom
 from classes.terra_instance import TerraInstance
+from classes.wallet_state import WalletState, latest_height
 from terra_classic_sdk.core.staking import UnbondingDelegation
 
 from terra_classic_sdk.client.lcd import LCDClient
@@ -72,6 +73,9 @@ class UserParameters:
         self.target_denom:str         = ULUNA
 
 class UserWallet:
+    # Hundreds of wallets can be loaded at once, so they don't get a __dict__
+    __slots__ = ('address', 'balances', 'cached_prices', 'cached_traces', 'delegations', 'denom', 'name', 'network_error', 'pools', 'prefix', 'seed', 'terra', 'undelegations', 'validated')
+
     def __init__(self):
         self.address:str        = ''
         self.balances:dict      = None
@@ -81,6 +85,7 @@ class UserWallet:
         self.denom:str          = ''
         self.undelegations:dict = {}
         self.name:str           = ''
+        self.network_error:bool = False # Set if a balance, delegation or undelegation request failed, so a partial result isn't cached
         self.pools:dict         = {}
         self.prefix:str         = ''
         self.seed:str           = ''
@@ -117,15 +122,15 @@ class UserWallet:
 
         # Set up the object with the details we're interested in
         if balance_amount > 0:
-            self.delegations[validator_name] = {
-                'balance_amount': balance_amount, 
-                'balance_denom':  balance_denom, 
-                'commission':     validator_commission, 
-                'delegator':      delegator_address, 
-                'rewards':        reward_coins, 
-                'validator':      validator_address, 
-                'validator_name': validator_name
-            }
+            self.delegations[validator_name] = DelegationRecord(
+                balance_amount = balance_amount, 
+                balance_denom  = balance_denom, 
+                commission     = validator_commission, 
+                delegator      = delegator_address, 
+                rewards        = reward_coins, 
+                validator      = validator_address, 
+                validator_name = validator_name
+            )
 
     def __iter_undelegation_result__(self, undelegation:UnbondingDelegation) -> dict:
         """
@@ -145,20 +150,20 @@ class UserWallet:
         for entry in undelegation.entries:
             completion_datetime = entry.completion_time.astimezone()
             offset = completion_datetime.utcoffset()
-            entries.append({'balance': entry.balance, 'completion_time': completion_datetime + offset})
+            entries.append(Balance(balance = entry.balance, denom = ULUNA, completion_time = completion_datetime + offset))
        
         # Get the total balance from all the entries
         balance_total:int = 0
         for entry in entries:
-            balance_total += entry['balance']
+            balance_total += entry.balance
 
         # Set up the object with the details we're interested in
-        self.undelegations[validator_address] = {
-            'balance_amount':    balance_total, 
-            'delegator_address': delegator_address, 
-            'validator_address': validator_address, 
-            'entries':           entries
-        }
+        self.undelegations[validator_address] = Undelegation(
+            balance_amount    = balance_total, 
+            delegator_address = delegator_address, 
+            entries           = entries,
+            validator_address = validator_address
+        )
     
     def convertPercentage(self, percentage:float, user_params:UserParameters) -> int:
         """
@@ -177,16 +182,15 @@ class UserWallet:
         uluna_amount:int = 0
         
         if user_params.target_amount is not None:
-            percentage:float = float(percentage) / 100
+            percentage:Decimal = to_decimal(percentage) / 100
             if user_params.keep_minimum == True:
-                lunc_amount:float = float((user_params.target_amount - WITHDRAWAL_REMAINDER) * percentage)
+                lunc_amount:Decimal = (to_decimal(user_params.target_amount) - to_decimal(WITHDRAWAL_REMAINDER)) * percentage
                 if lunc_amount < 0:
                     lunc_amount = 0
             else:
-                lunc_amount:float = float(user_params.target_amount) * percentage
+                lunc_amount:Decimal = to_decimal(user_params.target_amount) * percentage
                 
-            lunc_amount:float = float(str(lunc_amount))
-            uluna_amount:int  = int(multiply_raw_balance(lunc_amount, user_params.target_denom))
+            uluna_amount:int = to_raw_amount(lunc_amount, user_params.target_denom)
         
         return uluna_amount
     
@@ -208,6 +212,9 @@ class UserWallet:
         self.address:str = address
 
         if seed != '' and password != '':
+            # Imported here so scripts that only need addresses start faster
+            import cryptocode
+
             self.seed = cryptocode.decrypt(seed, password)
 
         # If a denom wasn't provided, then figure it out based on the prefix and the CHAIN_DATA dict
@@ -235,7 +242,8 @@ class UserWallet:
         @return: Coin
         """
 
-        return Coin.from_data({'amount': int(float(amount)), 'denom': denom})
+        # Large 18 decimal amounts don't fit in a float, so this is converted exactly
+        return Coin.from_data({'amount': int(to_decimal(amount)), 'denom': denom})
 
     def denomTrace(self, ibc_address:str) -> str:
         """
@@ -269,44 +277,28 @@ class UserWallet:
             insert_ibc_denom = "INSERT INTO ibc_denoms (ibc_denom, readable_denom) VALUES (?, ?);"
 
             # Get the database results
-            conn:Connection = sqlite3.connect(DB_FILE_NAME)
-            cursor:Cursor   = conn.execute(get_ibc_query, [uri])
-            row:list        = cursor.fetchone()
+            cursor:Cursor = get_cursor().execute(get_ibc_query, [uri])
+            row:list      = cursor.fetchone()
 
             if row is None:
                 # Go and get this denom trace:
+                try:
+                    trace_result:json = get_json(uri)
 
-                retry_count:int = 0
-                retry:bool      = True
-
-                while retry == True:
-                    try:
-                        trace_result:json = requests.get(uri).json()
-                    
-                        if 'denom_trace' in trace_result:
-                            # Return this result
-                            result = trace_result['denom_trace']['base_denom']
-                            
-                            # Add this IBC value and readable version into the database:
-                            cursor:Cursor = conn.execute(insert_ibc_denom, [uri, result])
-                            conn.commit()
-
-                            # Store this result for future requests
-                            self.cached_traces[uri] = result
-                            
-                            break
-                        else:
-                            break
-                    except Exception as err:
-                        retry_count += 1
-                        if retry_count == 10:
-                            print (f'Denom trace error for {uri}:')
-                            print (err)
-                            retry  = False
-                            result = ''
-                            break
-                        else:
-                            time.sleep(1)
+                    if 'denom_trace' in trace_result:
+                        # Return this result
+                        result = trace_result['denom_trace']['base_denom']
+                        
+                        # Add this IBC value and readable version into the database:
+                        with database_transaction() as cursor:
+                            cursor.execute(insert_ibc_denom, [uri, result])
+
+                        # Store this result for future requests
+                        self.cached_traces[uri] = result
+                except RequestError as err:
+                    print (f'Denom trace error for {uri}:')
+                    print (err)
+                    result = ''
             else:
                 # This IBC entry is in the database
                 result = row[0]
@@ -331,12 +323,8 @@ class UserWallet:
         @return: the string-based denomination that this resolves to
         """
 
-        denom         = self.denomTrace(denom)
-        precision:int = get_precision(denom)
-        lunc:float    = round(float(divide_raw_balance(uluna, denom)), precision)
-
-        target:str = '%.' + str(precision) + 'f'
-        lunc:str   = (target % (lunc)).rstrip('0').rstrip('.')
+        denom    = self.denomTrace(denom)
+        lunc:str = format_raw_amount(uluna, denom)
 
         if add_suffix:
             lunc = str(lunc) + ' ' + FULL_COIN_LOOKUP[denom]
@@ -377,15 +365,15 @@ class UserWallet:
                     
                     if core_coins_only == True:
                         if coin.denom in [ULUNA, UUSD]:
-                            balances[coin.denom] = coin.amount
+                            balances[intern_denom(coin.denom)] = raw_integer(coin.amount)
                         
                     else:
-                        denom_trace           = self.denomTrace(coin.denom)
-                        balances[denom_trace] = coin.amount
+                        denom_trace           = intern_denom(self.denomTrace(coin.denom))
+                        balances[denom_trace] = raw_integer(coin.amount)
                         # We only get pools if the entire coin list is requested
                         if denom_trace[0:len('gamm/pool/')] == 'gamm/pool/':
                             pool_id = denom_trace[len('gamm/pool/'):]
-                            pools[int(pool_id)] = coin.amount
+                            pools[int(pool_id)] = raw_integer(coin.amount)
                     
                 # Go through the pagination (if any)
                 while pagination['next_key'] is not None:
@@ -396,18 +384,19 @@ class UserWallet:
                     for coin in result:
                         if core_coins_only == True:
                             if coin.denom in [ULUNA, UUSD]:
-                                balances[coin.denom] = coin.amount
+                                balances[intern_denom(coin.denom)] = raw_integer(coin.amount)
                         else:
-                            denom_trace           = self.denomTrace(coin.denom)
-                            balances[denom_trace] = coin.amount
+                            denom_trace           = intern_denom(self.denomTrace(coin.denom))
+                            balances[denom_trace] = raw_integer(coin.amount)
 
                             # We only get pools if the entire coin list is requested
                             if denom_trace[0:len('gamm/pool/')] == 'gamm/pool/':
                                 pool_id = denom_trace[len('gamm/pool/'):]
-                                pools[int(pool_id)] = coin.amount
+                                pools[int(pool_id)] = raw_integer(coin.amount)
                 
             except Exception as err:
                 print (f'Pagination error for {self.name}:', err)
+                self.network_error = True
 
             if core_coins_only == False:
                 # Add the extra coins (Base, GarudaX, etc)
@@ -421,7 +410,7 @@ class UserWallet:
 
                         coin_balance = self.terra.wasm.contract_query(coin_address, {'balance':{'address':self.address}})  
                         if int(coin_balance['balance']) > 0:
-                            balances[NON_ULUNA_COINS[coin_item]] = coin_balance['balance']
+                            balances[NON_ULUNA_COINS[coin_item]] = int(coin_balance['balance'])
 
         else:
             balances:dict = {}
@@ -473,38 +462,18 @@ class UserWallet:
 
         # Now make a bulk query for anything we haven't already requested:        
         if len(cg_denoms) > 0:
-            # Create the Coingecko object
-            cg = CoinGeckoAPI()
-
             # Coingecko uses its own denom key, which we store in the chain data constant
             # We're only supporting USD at the moment
-            retry_count:int = 0
-            retry:bool      = True
-
-            while retry == True:
-                try:
-                    
-                    cg_result = cg.get_price(cg_denoms, 'usd')
-
-                    for cg_denom in cg_result:
-                        self.cached_prices[cg_denom] = cg_result[cg_denom]['usd']
-
-                    retry = False
-                    break
-
-                except Exception as err:
-                    retry_count += 1
-                    if retry_count == 10:
-                        print (' 🛑 Error getting coin prices')
-                        print (err)
+            try:
+                cg_result:dict = get_json('https://api.coingecko.com/api/v3/simple/price', {'ids': ','.join(cg_denoms), 'vs_currencies': 'usd'})
 
-                        retry = False
-                        exit()
-                    else:
-                        if retry_count == 1:
-                            print (' 🛎️   Coingecko is slow at the moment, this might take a while...')
+                for cg_denom in cg_result:
+                    self.cached_prices[cg_denom] = cg_result[cg_denom]['usd']
 
-                        time.sleep(1)
+            except RequestError as err:
+                print (' 🛑 Error getting coin prices')
+                print (err)
+                exit()
 
         result:dict = {}
         for denom in denom_list:
@@ -534,6 +503,9 @@ class UserWallet:
 
         if estimation_against is not None:
             label_widths.append(len('Estimation'))
+            # The swap classes are only needed for estimates, so they're imported on first use
+            from classes.swap_transaction import SwapTransaction
+
             swap_tx = SwapTransaction().create(self.seed, self.denom)
 
             if swap_tx == False:
@@ -728,6 +700,7 @@ class UserWallet:
                         self.__iter_delegator_result__(delegator)
             except:
                 print (' 🛎️  Network error: delegations could not be retrieved.')
+                self.network_error = True
 
         return self.delegations
     
@@ -795,23 +768,24 @@ class UserWallet:
         vote_result:dict = self.terra.gov.vote(proposal_id, self.address)
 
         # Get the vote value and convert it
-        if 'options' in vote_result:
-            vote_value = vote_result['options'][0]['option']
-            result:str = None
-            if vote_value == 'VOTE_OPTION_UNSPECIFIED':
-                result = ''
-            elif vote_value == 'VOTE_OPTION_YES':
-                result = 'Yes'
-            elif vote_value == 'VOTE_OPTION_ABSTAIN':
-                result = 'Abstain'
-            elif vote_value == 'VOTE_OPTION_NO':
-                result = 'No'
-            elif vote_value == 'VOTE_OPTION_NO_WITH_VETO':
-                result = 'No with veto'
-        else:
-            result = ''
+        return readable_vote(vote_result)
 
-        return result
+    def getSequence(self) -> int:
+        """
+        Get the account sequence for this wallet. It goes up by one every time the wallet makes a transaction.
+
+        @params:
+            - None
+
+        @return: the sequence, or None if the account couldn't be loaded (ie: it has never received anything)
+        """
+
+        try:
+            account = call_with_retries(lcd_host(self.terra), self.terra.auth.account_info, self.address)
+        except Exception:
+            return None
+
+        return int(account.get_sequence())
 
     def getSupportedPrefixes(self) -> list:
         """
@@ -841,7 +815,7 @@ class UserWallet:
         @return: a list of undelegation details
         """
 
-        result:json  = requests.get('https://raw.githubusercontent.com/lbunproject/BASEswap-api-price/main/public/unstaked_plus_hashes.json').json()
+        result:json  = get_json('https://raw.githubusercontent.com/lbunproject/BASEswap-api-price/main/public/unstaked_plus_hashes.json')
         results:list = []
         today        = datetime.now()
 
@@ -891,6 +865,7 @@ class UserWallet:
                 except Exception as err:
                     print (' 🛎️  Network error: undelegations could not be retrieved.')
                     print (err)
+                    self.network_error = True
                     
 
         # Get any BASE undelegations currently in progress
@@ -898,6 +873,8 @@ class UserWallet:
         undelegated_amount:float = 0
         entries:list             = []
         
+        from dateutil.tz import tz
+
         utc_zone = tz.gettz('UTC')
         base_zone = tz.gettz('US/Eastern')
 
@@ -917,10 +894,15 @@ class UserWallet:
             # Generate UTC time string
             utc_string = utc_time.strftime('%d/%m/%Y')
 
-            entries.append({'balance': multiply_raw_balance(base_item['luncNetReleased'], UBASE), 'completion_time': utc_string})
+            entries.append(Balance(balance = multiply_raw_balance(base_item['luncNetReleased'], UBASE), denom = UBASE, completion_time = utc_string))
         
         if len(entries) > 0:
-            self.undelegations[UBASE] = {'balance_amount': multiply_raw_balance(undelegated_amount, UBASE), 'entries': entries}
+            self.undelegations[UBASE] = Undelegation(
+                balance_amount    = multiply_raw_balance(undelegated_amount, UBASE),
+                delegator_address = self.address,
+                entries           = entries,
+                validator_address = None
+            )
 
         return self.undelegations
     
@@ -1002,7 +984,7 @@ class UserWallet:
                         answer = answer + '%'
                 else:
                     # Convert the number into a uluna amount
-                    answer = multiply_raw_balance(answer, user_params.target_denom)
+                    answer = to_raw_amount(answer, user_params.target_denom)
 
         return str(answer)
     
@@ -1082,6 +1064,78 @@ class UserWallet:
 
         return str(answer)
 
+    def loadState(self, get_balances:bool = True, get_delegations:bool = True, get_undelegations:bool = False, core_coins_only:bool = False) -> bool:
+        """
+        Load the balances, delegations and undelegations for this wallet.
+        If the wallet hasn't made a transaction since the last time they were loaded, then the saved copy is used instead.
+        This only costs one request for the account sequence (and the block height, which every wallet on the chain shares),
+        instead of loading everything again.
+
+        If you need the current balances straight after a transaction, use getBalances instead.
+
+        @params:
+            - get_balances: do we want the wallet balances?
+            - get_delegations: do we want the delegations and rewards?
+            - get_undelegations: do we want the undelegations?
+            - core_coins_only: if true, then just the ULUNA and USTC balances are needed
+
+        @return: True if everything came from the saved wallet state
+        """
+
+        if USE_WALLET_STATE_CACHE == False or self.terra is None:
+            if get_balances == True:
+                self.getBalances(core_coins_only)
+            if get_delegations == True:
+                self.getDelegations()
+            if get_undelegations == True:
+                self.getUndelegations()
+
+            return False
+
+        wallet_state:WalletState = WalletState().create()
+        sequence:int             = self.getSequence()
+        height:int               = latest_height(self.terra)
+        cached:dict              = wallet_state.load(self.address, sequence, height)
+        loaded:dict              = {}
+
+        self.network_error = False
+
+        if get_balances == True:
+            # Saved balances for every coin can be used when we just want the core coins, but not the other way around
+            if 'balances' in cached and (core_coins_only == True or cached['core_coins_only'] == False):
+                self.balances = {}
+                self.pools    = {}
+                for denom, amount in cached['balances'].items():
+                    if core_coins_only == False or denom in [ULUNA, UUSD]:
+                        self.balances[intern_denom(denom)] = amount
+
+                        # We only get pools if the entire coin list is requested
+                        if core_coins_only == False and denom[0:len('gamm/pool/')] == 'gamm/pool/':
+                            self.pools[int(denom[len('gamm/pool/'):])] = amount
+            else:
+                loaded['balances']        = self.getBalances(core_coins_only)
+                loaded['core_coins_only'] = core_coins_only
+
+        if get_delegations == True:
+            if 'delegations' in cached:
+                self.delegations = cached['delegations']
+            else:
+                loaded['delegations'] = self.getDelegations()
+
+        if get_undelegations == True:
+            if 'undelegations' in cached:
+                self.undelegations = cached['undelegations']
+            else:
+                loaded['undelegations'] = self.getUndelegations()
+
+        # Don't save anything if part of it couldn't be loaded
+        if len(loaded) > 0 and self.network_error == False:
+            wallet_state.save(self.address, sequence, height, loaded)
+
+        wallet_state.close()
+
+        return len(loaded) == 0
+
     def newWallet(self, prefix:str):
         """
         Creates a new wallet and returns the seed and address
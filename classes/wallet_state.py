@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+from sqlite3 import Connection
+
+from constants.constants import (
+    WALLET_STATE_HEIGHT_TTL,
+    WALLET_STATE_MAX_AGE
+)
+
+from classes.common import (
+    to_decimal
+)
+
+from classes.chain_params import observe_height
+from classes.database import database_transaction, get_connection
+from classes.http_client import call_with_retries, lcd_host
+from classes.records import Balance, Delegation, Undelegation
+
+from terra_classic_sdk.client.lcd import LCDClient
+
+# The latest block height on each chain, as (height, time it was requested).
+# Every wallet on a chain shares it, so it's only requested again after WALLET_STATE_HEIGHT_TTL seconds.
+latest_heights:dict = {}
+heights_lock        = threading.Lock()
+
+def latest_height(terra:LCDClient) -> int:
+    """
+    Get the latest block height for the chain this LCD client is connected to.
+    It's shared for a few seconds, so long-running processes (like the workflow daemon) keep seeing new heights.
+
+    @params:
+        - terra: the LCD client
+
+    @return: the block height, or None if it couldn't be loaded
+    """
+
+    with heights_lock:
+        if terra.chain_id in latest_heights:
+            height, requested = latest_heights[terra.chain_id]
+            if time.time() - requested < WALLET_STATE_HEIGHT_TTL:
+                return height
+
+        try:
+            block:dict = call_with_retries(lcd_host(terra), terra.tendermint.block_info)
+            height:int = int(block['block']['header']['height'])
+        except Exception:
+            height:int = None
+
+        latest_heights[terra.chain_id] = (height, time.time())
+
+    if height is not None:
+        observe_height(terra.chain_id, height)
+
+    return height
+
+class WalletState():
+    """
+    Remember the balances, delegations and undelegations of each wallet, so idle wallets don't have to be loaded again.
+
+    Every transaction a wallet makes increases its account sequence, so the cached state is reused as long as the
+    sequence hasn't changed. Incoming transfers and rewards don't change the sequence though, so each part
+    of the state is also only reused for WALLET_STATE_MAX_AGE seconds after it was loaded.
+    The block height is saved too, and the state isn't reused if the LCD is behind that height (ie: a lagging or different node).
+    Undelegations that are about to finish will change the balance, so those wallets are always loaded again.
+    """
+
+    def __init__(self):
+        self.conn:Connection = None
+
+    def create(self) -> WalletState:
+        """
+        Use the shared database connection. The table is created by the database migrations.
+
+        @params:
+            - None
+
+        @return: self
+        """
+
+        self.conn = get_connection()
+
+        return self
+
+    def close(self) -> bool:
+        """
+        Finish with the database. The connection is shared with the rest of this process, so it stays open.
+
+        @params:
+            - None
+
+        @return: True
+        """
+
+        self.conn = None
+
+        return True
+
+    def decodeUndelegation(self, item:dict) -> Undelegation:
+        """
+        Rebuild an undelegation record from the saved version.
+
+        @params:
+            - item: the dictionary made by encodeUndelegation
+
+        @return: an Undelegation record
+        """
+
+        entries:list = []
+        for balance, denom, completion_time, is_datetime in item['entries']:
+            if is_datetime == True:
+                completion_time = datetime.fromisoformat(completion_time)
+
+            entries.append(Balance(balance = balance, denom = denom, completion_time = completion_time))
+
+        return Undelegation(
+            balance_amount    = item['balance_amount'],
+            delegator_address = item['delegator_address'],
+            entries           = entries,
+            validator_address = item['validator_address']
+        )
+
+    def encodeUndelegation(self, undelegation:Undelegation) -> dict:
+        """
+        Convert an undelegation record into something that can be saved as JSON.
+        Chain undelegations finish at a datetime, but BASE undelegations only have a date string.
+
+        @params:
+            - undelegation: the Undelegation record
+
+        @return: a dictionary
+        """
+
+        entries:list = []
+        for entry in undelegation.entries:
+            if isinstance(entry.completion_time, datetime):
+                entries.append([entry.balance, entry.denom, entry.completion_time.isoformat(), True])
+            else:
+                entries.append([entry.balance, entry.denom, entry.completion_time, False])
+
+        return {
+            'balance_amount':    undelegation.balance_amount,
+            'delegator_address': undelegation.delegator_address,
+            'entries':           entries,
+            'validator_address': undelegation.validator_address
+        }
+
+    def isFinishing(self, undelegations:dict) -> bool:
+        """
+        Check if any of these undelegations finish in the next day.
+        The completion times are shifted by the local timezone, so a day either side covers every timezone.
+
+        @params:
+            - undelegations: the undelegations for one wallet
+
+        @return: True if the wallet balance is about to change
+        """
+
+        cutoff:datetime = datetime.now(timezone.utc) + timedelta(days = 1)
+
+        for validator in undelegations:
+            for entry in undelegations[validator].entries:
+                if isinstance(entry.completion_time, datetime) and entry.completion_time <= cutoff:
+                    return True
+
+        return False
+
+    def load(self, address:str, sequence:int, height:int = None) -> dict:
+        """
+        Get the cached state for this wallet, if the account hasn't made a transaction since it was saved.
+        Parts that are older than WALLET_STATE_MAX_AGE are left out.
+
+        @params:
+            - address: the wallet address
+            - sequence: the current account sequence
+            - height: the latest block height, if we know it
+
+        @return: a dictionary with any of 'balances', 'core_coins_only', 'delegations' and 'undelegations'
+        """
+
+        result:dict = {}
+
+        if sequence is None:
+            return result
+
+        row = self.conn.execute("SELECT sequence, height, state FROM wallet_state WHERE address = ?;", [address]).fetchone()
+        if row is None or row[0] != sequence:
+            return result
+
+        # If the LCD hasn't reached the height we saw last time, then it can't confirm that nothing has changed
+        if height is not None and row[1] is not None and height < row[1]:
+            return result
+
+        state:dict = json.loads(row[2])
+        oldest:int = int(time.time()) - WALLET_STATE_MAX_AGE
+
+        if 'undelegations' in state:
+            undelegations:dict = {key: self.decodeUndelegation(item) for key, item in state['undelegations']['items'].items()}
+
+            # Even if the undelegations aren't needed, the balance will change when one finishes
+            if self.isFinishing(undelegations):
+                return result
+
+            if state['undelegations']['timestamp'] >= oldest:
+                result['undelegations'] = undelegations
+
+        if 'balances' in state and state['balances']['timestamp'] >= oldest:
+            result['balances']        = state['balances']['items']
+            result['core_coins_only'] = state['balances']['core_coins_only']
+
+        if 'delegations' in state and state['delegations']['timestamp'] >= oldest:
+            delegations:dict = {}
+            for key, item in state['delegations']['items'].items():
+                item['rewards']  = {denom: to_decimal(amount) for denom, amount in item['rewards'].items()}
+                delegations[key] = Delegation(**item)
+
+            result['delegations'] = delegations
+
+        return result
+
+    def save(self, address:str, sequence:int, height:int, state:dict) -> bool:
+        """
+        Save the parts of this wallet that have just been loaded.
+        If the sequence hasn't changed, then any other parts that were saved before are kept.
+
+        @params:
+            - address: the wallet address
+            - sequence: the account sequence from before these parts were loaded
+            - height: the latest block height when these parts were loaded
+            - state: a dictionary with any of 'balances', 'core_coins_only', 'delegations' and 'undelegations'
+
+        @return: True if anything was saved
+        """
+
+        if sequence is None or len(state) == 0:
+            return False
+
+        timestamp:int = int(time.time())
+
+        with database_transaction() as cursor:
+            row = cursor.execute("SELECT sequence, state FROM wallet_state WHERE address = ?;", [address]).fetchone()
+
+            saved:dict = {}
+            if row is not None and row[0] == sequence:
+                saved = json.loads(row[1])
+
+            if 'balances' in state:
+                saved['balances'] = {'core_coins_only': state['core_coins_only'], 'items': state['balances'], 'timestamp': timestamp}
+
+            if 'delegations' in state:
+                # Rewards are SDK Dec values, so they are saved as strings
+                items:dict = {}
+                for key, delegation in state['delegations'].items():
+                    items[key]            = delegation.toDict()
+                    items[key]['rewards'] = {denom: str(amount) for denom, amount in delegation.rewards.items()}
+
+                saved['delegations'] = {'items': items, 'timestamp': timestamp}
+
+            if 'undelegations' in state:
+                saved['undelegations'] = {'items': {key: self.encodeUndelegation(item) for key, item in state['undelegations'].items()}, 'timestamp': timestamp}
+
+            cursor.execute("INSERT OR REPLACE INTO wallet_state (address, sequence, height, state, timestamp) VALUES (?, ?, ?, ?, ?);", [address, sequence, height, json.dumps(saved), timestamp])
+
+        return True
@@ -16,6 +16,7 @@ from constants.constants import (
     USER_ACTION_CLEAR,
     USER_ACTION_CONTINUE,
     USER_ACTION_QUIT,
+    USE_WALLET_STATE_CACHE,
     UUSD
 )
 
@@ -62,6 +63,27 @@ class UserWallets:
         
         await asyncio.gather(*coros)
 
+    async def __AsyncLoadStates(self, user_wallets:dict, get_balances:bool, get_delegations:bool):
+        """
+        A special function to load wallet balances, delegations and undelegations in an asynchronous mode.
+        Wallets that haven't changed since the last time they were loaded use their saved state instead.
+        
+        @params:
+            - user_wallets: a list of wallets we want to load the details for
+            - get_balances: do we want the wallet balances?
+            - get_delegations: do we want the delegations and undelegations?
+            
+        @return: None
+        """
+
+        async def async_loop(user_wallets, wallet_name):
+            wallet:UserWallet = user_wallets[wallet_name]
+            wallet.loadState(get_balances = get_balances, get_delegations = get_delegations, get_undelegations = get_delegations, core_coins_only = True)
+            
+        coros = [async_loop(user_wallets, wallet_name) for wallet_name in user_wallets]
+        
+        await asyncio.gather(*coros)
+
     def create(self, yml_file:dict, user_password:str, filter:list = None) -> dict:
         """
         Create a dictionary of wallets. Each wallet is a Wallet object.
@@ -135,6 +157,7 @@ class UserWallets:
         {
           'display': 'balances', 'votes'
           'proposal_id': proposal_id (for use when display = votes)   
+          'votes': {wallet name: vote} (optional, for use when display = votes)
         }
         
         @params:
@@ -194,8 +217,11 @@ class UserWallets:
 
             if options['display'] == 'votes':
                 
-                # Get the vote for this proposal
-                vote_result = wallet.getProposalVote(options['proposal_id'])
+                # Get the vote for this proposal, unless we already have it
+                if 'votes' in options and wallet_name in options['votes']:
+                    vote_result = options['votes'][wallet_name]
+                else:
+                    vote_result = wallet.getProposalVote(options['proposal_id'])
 
                 # Store this so we don't have to check twice
                 wallet_votes[wallet_name] = vote_result
@@ -575,6 +601,13 @@ class UserWallets:
             print (' 🛑 The user_config.yml does not exist - please run configure_user_wallets.py before running this script.')
             exit()
 
+        if USE_WALLET_STATE_CACHE == True:
+            if get_balances == True or get_delegations == True:
+                loop = asyncio.get_event_loop()
+                loop.run_until_complete(self.__AsyncLoadStates(self.wallets, get_balances, get_delegations))
+
+            return result
+
         if get_balances == True:
             loop = asyncio.get_event_loop()
             loop.run_until_complete(self.__AsyncLoadBalances(self.wallets))
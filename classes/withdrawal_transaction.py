@@ -5,6 +5,7 @@ from __future__ import annotations
 
 import traceback
 
+from classes.tracing import trace_phase, trace_transaction
 from classes.transaction_core import TransactionCore, TransactionResult
 from classes.terra_instance import TerraInstance
 from classes.wallet import UserWallet
@@ -57,6 +58,7 @@ class WithdrawalTransaction(TransactionCore):
 
         return self
     
+    @trace_phase('simulate')
     def simulate(self) -> bool:
         """
         Simulate a withdrawal so we can get the fee details.
@@ -72,8 +74,10 @@ class WithdrawalTransaction(TransactionCore):
         self.fee      = None
         if self.getSequenceNumber() == False:
             return False
-       
-                
+
+        # Skip the gas simulation if we've done enough withdrawals already
+        self.gas_limit = self.cachedGasLimit('MsgWithdrawDelegatorReward')
+
         self.withdraw()
 
         # Store the transaction
@@ -91,6 +95,7 @@ class WithdrawalTransaction(TransactionCore):
             return False
         
 
+    @trace_phase('sign')
     def withdraw(self) -> bool:
         """
         Make a withdrawal with the information we have so far.
@@ -112,7 +117,7 @@ class WithdrawalTransaction(TransactionCore):
             
             options = CreateTxOptions(
                 fee        = self.fee,
-                gas        = 'auto',
+                gas        = self.gas_limit,
                 gas_prices = self.gas_list,
                 msgs       = [msg]
             )
@@ -144,6 +149,7 @@ class WithdrawalTransaction(TransactionCore):
         except:
             return False
         
+@trace_transaction('withdraw')
 def claim_delegation_rewards(wallet:UserWallet, validator_address:str, silent_mode:bool = False) -> TransactionResult:
     """
     A wrapper function for workflows and wallet management.
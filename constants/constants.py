@@ -3,26 +3,108 @@
 
 import os
 
+from types import MappingProxyType
+
 # User settings - can be changed if required
-CHECK_FOR_UPDATES    = True  # This might slow things down a bit when the script is first run. Change it to False if it becomes a problem.
+CHECK_FOR_UPDATES    = True  # Github is checked in the background, so this never slows anything down. Change it to False to turn it off.
 WITHDRAWAL_REMAINDER = 150   # This is the amount of Lunc we want to keep after withdrawal and before delegating. You should never delegate the entire balance.
 SEARCH_RETRY_COUNT   = 50    # This is the number of times we will check for a transaction to appear in the chain before deciding it didn't work.
 HIDE_DISABLED_COINS  = True  # Some coins are not currently available. Functionality is mostly there, but swaps etc won't work
 ENABLE_TRADING_BOT   = False # An extremely experimental trading bot. Disabled for the moment.
 BUSY_RETRY_COUNT     = 10    # If the LCD is busy, how many times to we retry?
+GOVERNANCE_WORKERS   = 8     # How many wallets can vote on a proposal at the same time.
+GOVERNANCE_CACHE_TTL = 60    # How long (in seconds) the proposals, tallies and wallet votes are reused before being loaded again.
 
 # Used for the .netrc file for passwordless authentication:
 NETRC_MACHINE_NAME   = 'LUNCworkflows' 
 
+# Used when checking Github for a new version:
+VERSION_CHECK_INTERVAL = 86400 # How often (in seconds) Github is checked. The last answer is saved and reused until then.
+
+# Used when workflows.py is run in daemon mode:
+WORKFLOW_DAEMON_INTERVAL = 60  # How often (in minutes) workflows without a 'day' or 'time' trigger are run.
+WORKFLOW_DAEMON_TICK     = 30  # How often (in seconds) the daemon wakes up to check the schedule and the workflows file.
+
+# Used by send.py --batch to send to many addresses at once:
+BATCH_SEND_SIZE    = 50       # The most recipients in one transaction.
+BATCH_SEND_MAX_GAS = 3000000  # If a batch needs more gas than this, it's split in half.
+
+# Used by balances.py to keep a history of your wallets:
+RECORD_BALANCE_HISTORY  = True  # Save any changes to your balances, delegations and rewards each time balances.py is run.
+HISTORY_DOWNSAMPLE_DAYS = 30    # After this many days, only the last change on each day is kept.
+HISTORY_RETENTION_DAYS  = 730   # History older than this many days is removed.
+
+# Used to skip loading wallets that haven't changed since the last run:
+USE_WALLET_STATE_CACHE  = True  # Reuse the last balances, delegations and undelegations of a wallet if it hasn't made a transaction since.
+WALLET_STATE_MAX_AGE    = 900   # Incoming transfers and rewards don't count as a transaction, so nothing is reused for longer than this (in seconds).
+WALLET_STATE_HEIGHT_TTL = 30    # How long (in seconds) the latest block height is shared by every wallet on a chain before it's requested again.
+
+# Used by the trading bot:
+TRADING_COINS              = ['urakoff'] # The trading bot only sells trades that are holding these coins. Leave it empty to sell every open trade.
+TRADING_POLL_INTERVAL      = 60          # How often (in seconds) the open trades are checked against the current prices.
+TRADING_FAST_POLL_INTERVAL = 10          # How often (in seconds) we check when a price is close to an exit threshold, or for new trades.
+TRADING_PROXIMITY          = 0.02        # How close (as a fraction) a trade has to be to an exit threshold before we check more often.
+
+# Used to skip the gas simulation for transactions we've seen before:
+USE_GAS_ESTIMATES        = True  # Use the gas used by previous transactions instead of simulating every transaction.
+GAS_ESTIMATE_MARGIN      = 0.15  # The safety margin (as a fraction) added on top of the highest gas used.
+GAS_ESTIMATE_MIN_SAMPLES = 3     # How many confirmed transactions we need to see before we stop simulating.
+GAS_ESTIMATE_DECAY       = 0.1   # How quickly (as a fraction) the estimate comes back down when transactions use less gas.
+
+# Used to learn the gas adjustment for each kind of transaction. The GAS_ADJUSTMENT values below are used until there are enough samples.
+GAS_ADJUSTMENT_MARGIN      = 0.1   # The safety margin (as a fraction) added on top of the learned adjustment.
+GAS_ADJUSTMENT_MAX         = 5.0   # The learned adjustment will never be higher than this.
+GAS_ADJUSTMENT_MIN         = 1.1   # The learned adjustment will never be lower than this.
+GAS_ADJUSTMENT_MIN_SAMPLES = 10    # How many simulated transactions we need to see before the adjustment is learned.
+GAS_ADJUSTMENT_PERCENTILE  = 0.99  # Which percentile of the gas used/gas simulated ratios the adjustment is based on.
+GAS_SAMPLE_LIMIT           = 200   # How many recent transactions are kept for each message type.
+GAS_OUT_OF_GAS_INCREASE    = 0.5   # When a simulated transaction runs out of gas, the next adjustment is at least this fraction higher.
+
+# Used to share the tax rate, gas prices and other chain parameters between transactions:
+CHAIN_PARAMS_TTL          = 300     # How long (in seconds) the chain parameters are reused before being loaded again.
+CHAIN_PARAMS_EPOCH_BLOCKS = 100800  # Tax changes happen at the end of each epoch (one week of blocks), so the parameters are reloaded when we see a new one.
+
+# Used by every HTTP and LCD request. The number of attempts is BUSY_RETRY_COUNT.
+HTTP_CONNECT_TIMEOUT     = 5    # How long (in seconds) we wait to connect to a server.
+HTTP_READ_TIMEOUT        = 30   # How long (in seconds) we wait for a server to answer.
+HTTP_BACKOFF_BASE        = 0.5  # The longest (in seconds) we wait before the first retry. This doubles on each retry after that.
+HTTP_BACKOFF_MAX         = 30   # The longest (in seconds) we ever wait between retries.
+HTTP_RETRY_BUDGET        = 0.2  # Retries can only be this fraction of the requests to each server, so a busy server isn't flooded.
+CIRCUIT_BREAKER_FAILURES = 5    # After this many failures in a row, requests to that server fail straight away...
+CIRCUIT_BREAKER_COOLDOWN = 30   # ...until this many seconds have passed. Then one request is let through to see if it has recovered.
+
+# Used to stay under the rate limits of each server. Each server has a token bucket of (requests per second, burst size).
+# If a server sends a Retry-After header, every request to that server waits that long.
+RATE_LIMITS = {
+    'api.coingecko.com':                (0.5, 5),  # The free Coingecko API allows about 30 requests a minute
+    'lcd.osmosis.zone':                 (10, 20),
+    'raw.githubusercontent.com':        (2, 5),
+    'rest.cosmos.directory':            (5, 10),
+    'terra-classic-fcd.publicnode.com': (10, 20)
+}
+RATE_LIMIT_DEFAULT = None  # The limit for servers that aren't listed above, ie: (10, 20). None means they aren't limited.
+
+# Used to show where the time goes in workflows.py and balances.py:
+SHOW_REQUEST_TIMINGS       = True  # Show a table of every LCD and HTTP request (calls, errors, retries, time and bytes) when the script finishes.
+REQUEST_METRICS_FILE       = None  # Also save the request timings to this file in the Prometheus text format, ie: '/var/lib/node_exporter/utility_scripts.prom'
+REQUEST_TIMING_SAMPLE_SIZE = 1000  # How many request times are kept for each endpoint to work out the P95. After that, a random sample of them is kept.
+
+# Used to trace each transaction through the simulate, sign, broadcast and confirm phases:
+TRACE_FILE_NAME      = None  # Save OpenTelemetry (OTLP JSON) spans for every transaction to this file, ie: 'traces.jsonl'
+
 # System settings - these can be changed, but shouldn't be necessary
 #GAS_PRICE_URI            = 'https://terra-classic-fcd.publicnode.com/v1/txs/gas_prices'
 #GAS_PRICE_URI            = 'https://rest.cosmos.directory/terra/v1/txs/gas_prices'
 TOKEN_LIST               = 'https://assets.terrarebels.net/cw20/tokens.json'
 
+# Point every LCD client at a different server, ie: the local stand-in in benchmarks/mock_lcd.py
+LCD_URL_OVERRIDE         = os.environ.get('LCD_URL_OVERRIDE', None)
+
 # File names:
 CONFIG_FILE_NAME         = os.path.dirname(os.path.abspath(__file__)) + '/../user_config.yml'
 WORKFLOWS_FILE_NAME      = os.path.dirname(os.path.abspath(__file__)) + '/../user_workflows.yml'
-DB_FILE_NAME             = os.path.dirname(os.path.abspath(__file__)) + '/../osmosis.db'
+DB_FILE_NAME             = os.environ.get('DB_FILE_NAME_OVERRIDE', os.path.dirname(os.path.abspath(__file__)) + '/../osmosis.db') # The benchmarks use a copy so the real database isn't changed
+VERSION_CACHE_FILE_NAME  = os.path.dirname(os.path.abspath(__file__)) + '/../.version_cache.json'
 VERSION_URI              = 'https://raw.githubusercontent.com/geoffmunn/utility-scripts/main/version.json'
 
 # Gas adjustments and other values
@@ -98,6 +180,8 @@ PROPOSAL_VOTE_ABSTAIN      = 2
 PROPOSAL_VOTE_NO           = 3
 PROPOSAL_VOTE_NO_WITH_VETO = 4
 
+VOTE_UNKNOWN = 'Unknown'  # Shown instead of a vote when the LCD couldn't tell us if a wallet has voted
+
 # Liquidity pool constants
 JOIN_POOL = 'j'
 EXIT_POOL = 'e'
@@ -856,13 +940,20 @@ CHAIN_DATA = {
     }
 }
 
-OFFCHAIN_COINS = []
-for item in CHAIN_DATA[UOSMO]['ibc_channels'].keys():
-    if item != ULUNA:
-        OFFCHAIN_COINS.append(item)
+# These tables are built once here and can't be changed, so they are safe to share and quick to look up
+OFFCHAIN_COINS = frozenset(denom for denom in CHAIN_DATA[UOSMO]['ibc_channels'] if denom != ULUNA)
 
 # Remove any disabled coins
 if HIDE_DISABLED_COINS == True:
-    for item in DISABLED_COINS:
-        if item in FULL_COIN_LOOKUP:
-            del(FULL_COIN_LOOKUP[item])
+    FULL_COIN_LOOKUP = {denom: name for denom, name in FULL_COIN_LOOKUP.items() if denom not in DISABLED_COINS}
+
+# Find the denom for a display name, ie: 'LUNC' -> 'uluna'. If two coins have the same name, then the first one wins.
+COIN_DENOM_LOOKUP = {name: denom for denom, name in reversed(list(FULL_COIN_LOOKUP.items()))}
+
+# The number of decimal places for each denom, so amounts can be converted without looking through CHAIN_DATA each time
+PRECISION_LOOKUP = {denom: CHAIN_DATA[denom]['precision'] for denom in CHAIN_DATA}
+
+BASIC_COIN_LOOKUP = MappingProxyType(BASIC_COIN_LOOKUP)
+COIN_DENOM_LOOKUP = MappingProxyType(COIN_DENOM_LOOKUP)
+FULL_COIN_LOOKUP  = MappingProxyType(FULL_COIN_LOOKUP)
+PRECISION_LOOKUP  = MappingProxyType(PRECISION_LOOKUP)
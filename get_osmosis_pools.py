@@ -1,19 +1,15 @@
 
 #!/usr/bin/python
 
-import sqlite3
 import time
 
-from constants.constants import (
-    DB_FILE_NAME
-)
-
+from classes.database import close_connection, get_connection
 from classes.wallet import UserWallet
 
 from terra_classic_sdk.core.osmosis import Pool, PoolAsset
 
 def main():
-    conn = sqlite3.connect(DB_FILE_NAME)
+    conn = get_connection()
     print ("Opened database successfully")
 
     # Create a terra object and get the Osmosis pools
@@ -106,7 +102,7 @@ def main():
     conn.execute(update_summary, [])
     conn.commit()
 
-    conn.close()
+    close_connection()
 
     print ('Finished!')
 
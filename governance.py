@@ -14,8 +14,8 @@ from constants.constants import (
     PROPOSAL_VOTE_NO_WITH_VETO
 )
 
-from classes.governance import Governance, cast_governance_vote
-from classes.transaction_core import TransactionResult
+from classes.governance import Governance, cast_governance_vote, show_vote_summary
+from classes.governance_snapshot import GovernanceSnapshot
 from classes.wallet import UserWallet
 from classes.wallets import UserWallets
 
@@ -34,11 +34,13 @@ def main():
         # Create the governance object
         governance:Governance = Governance().create()
 
-        # Get any proposals that are up for voting
-        proposals:dict = governance.proposals()
+        # Get any proposals that are up for voting, with the tallies and wallet votes at the same time
+        snapshot:GovernanceSnapshot = GovernanceSnapshot().create(user_wallets)
+        proposals:list              = snapshot.proposals
 
         if len(proposals) > 0:
-            proposal, answer = governance.getUserSingleChoice(f"Select a proposal number 1 - {str(len(proposals))}, 'X' to continue, or 'Q' to quit: ")
+            snapshot.showMatrix()
+            proposal, answer = governance.getUserSingleChoice(f"Select a proposal number 1 - {str(len(proposals))}, 'X' to continue, or 'Q' to quit: ", proposals, snapshot.tallies)
         else:
             print ('\n 🛑 There are no active proposals to vote on at the moment.\n')
             exit()
@@ -51,7 +53,7 @@ def main():
         exit()
 
     # Get the wallets we'll be making votes on
-    user_wallets, answer = wallets.getUserMultiChoice(f"Select a wallet number 1 - {str(len(user_wallets))}, or 'A' to add all of them, 'C' to clear the list, 'X' to continue, or 'Q' to quit: ", {'display': 'votes', 'proposal_id': proposal['id']})
+    user_wallets, answer = wallets.getUserMultiChoice(f"Select a wallet number 1 - {str(len(user_wallets))}, or 'A' to add all of them, 'C' to clear the list, 'X' to continue, or 'Q' to quit: ", {'display': 'votes', 'proposal_id': proposal['id'], 'votes': snapshot.votes[proposal['id']]})
 
     if answer == USER_ACTION_QUIT:
         print (' 🛑 Exiting...\n')
@@ -87,22 +89,7 @@ def main():
 
     transaction_results:dict = cast_governance_vote(user_wallets, proposal['id'], vote_options[user_vote], memo)
 
-    for transaction_result in transaction_results:
-        transaction:TransactionResult = transaction_results[transaction_result]
-        print ('')
-        transaction.showResults()
-        # transaction:TransactionResult = transaction_results[transaction_result]
-        # print ('')
-        # if transaction.transaction_confirmed == True:
-        #     print (f' ✅ Vote successful on the {transaction_result} wallet!')
-        #     print (f' ✅ Tx Hash: {transaction.broadcast_result.txhash}\n')
-        # else:
-        #     print (f' 🛎️  An error occured on the {transaction_result} wallet.')
-        #     print (transaction.message)
-        #     if transaction.code is not None:
-        #         print (transaction.code)
-        #     if transaction.log is not None:
-        #         print (transaction.log)
+    show_vote_summary(transaction_results)
 
     print (' 💯 Done!\n')
 
@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 
+import argparse
+import csv
+import yaml
+
 from classes.common import (
-    check_version
+    check_version,
+    get_user_choice,
+    to_raw_amount
 )
 
 from constants.constants import (
+    COIN_DENOM_LOOKUP,
     FULL_COIN_LOOKUP,
     ULUNA,
     USER_ACTION_CONTINUE,
@@ -14,11 +21,47 @@ from constants.constants import (
 
 from classes.wallet import UserWallet, UserParameters
 from classes.wallets import UserWallets
-from classes.send_transaction import send_transaction
+from classes.send_transaction import batch_send_transaction, send_transaction
 from classes.transaction_core import TransactionResult
 
 from terra_classic_sdk.core.coin import Coin
 
+def batch_send(wallet:UserWallet, file_name:str) -> bool:
+    """
+    Send coins to every address in the batch file, and show what happened to each one.
+
+    @params:
+        - wallet: the wallet that is sending the coins
+        - file_name: the CSV or YAML file of recipients
+
+    @return: True if every recipient was sent their coins
+    """
+
+    recipients:list = load_batch_recipients(file_name, wallet)
+
+    if len(recipients) == 0:
+        print (f' 🛑 There are no recipients to send to in {file_name}.\n')
+        return False
+
+    print (f'\nThe {wallet.name} wallet will send to {len(recipients)} addresses:')
+    show_batch_recipients(wallet, recipients)
+
+    if get_user_choice(' ❓ Do you want to continue? (y/n) ', []) == False:
+        print (' 🛑 Exiting...\n')
+        return False
+
+    # NOTE: I'm pretty sure the memo size is int64, but I've capped it at 255 so python doens't panic
+    memo:str = wallet.getUserText('Provide a memo (optional): ', 255, True)
+
+    print (f'\n  ➜ Accessing the {wallet.name} wallet...')
+
+    recipients = batch_send_transaction(wallet, recipients, memo)
+
+    print ('\nResults:')
+    show_batch_recipients(wallet, recipients)
+
+    return len([recipient for recipient in recipients if recipient['status'] != 'Sent']) == 0
+
 def get_send_to_address(user_wallets:UserWallet) -> list[str, str]:
     """
     Show a simple list address from what is found in the user_config file
@@ -124,11 +167,84 @@ def get_send_to_address(user_wallets:UserWallet) -> list[str, str]:
     
     return recipient_address, answer
 
+def load_batch_recipients(file_name:str, wallet:UserWallet) -> list:
+    """
+    Read the recipients and amounts from a CSV or YAML file.
+    CSV files need an 'address' and 'amount' column, and YAML files are a list of entries with the same names.
+    The optional 'denom' value can be a coin name (LUNC) or a denom (uluna). If it's missing, then LUNC is sent.
+    Amounts are in the normal units, ie: 1.5 LUNC.
+
+    @params:
+        - file_name: the CSV or YAML file
+        - wallet: the sending wallet, so we can check the addresses
+
+    @return: a list of {'address', 'coin'} dictionaries. Invalid lines are reported and left out.
+    """
+
+    rows:list = []
+
+    try:
+        with open(file_name, 'r', newline = '') as batch_file:
+            if file_name.lower().endswith(('.yml', '.yaml')):
+                rows = yaml.safe_load(batch_file) or []
+            else:
+                rows = list(csv.DictReader(batch_file))
+    except Exception as err:
+        print (f' 🛑 The batch file {file_name} could not be read:')
+        print (err)
+        return []
+
+    recipients:list = []
+    line:int        = 0
+
+    for row in rows:
+        line += 1
+
+        if not isinstance(row, dict):
+            print (f' 🛎️  Line {line} was skipped because it is not an address and amount.')
+            continue
+
+        # Column names are not case sensitive
+        row:dict    = {str(key).strip().lower(): row[key] for key in row if key is not None}
+        address:str = str(row.get('address', '') or '').strip()
+        denom:str   = str(row.get('denom', '') or 'LUNC').strip()
+
+        if wallet.getPrefix(address) not in wallet.getSupportedPrefixes():
+            print (f" 🛎️  Line {line} was skipped because '{address}' is not a supported address.")
+            continue
+
+        if denom in COIN_DENOM_LOOKUP:
+            denom = COIN_DENOM_LOOKUP[denom]
+        elif denom.upper() in COIN_DENOM_LOOKUP:
+            denom = COIN_DENOM_LOOKUP[denom.upper()]
+
+        if denom not in FULL_COIN_LOOKUP:
+            print (f" 🛎️  Line {line} was skipped because '{denom}' is not a supported coin.")
+            continue
+
+        try:
+            amount:int = to_raw_amount(row.get('amount', ''), denom)
+        except (ArithmeticError, ValueError):
+            amount:int = 0
+
+        if amount <= 0:
+            print (f" 🛎️  Line {line} was skipped because '{row.get('amount', '')}' is not a valid amount.")
+            continue
+
+        recipients.append({'address': address, 'coin': wallet.createCoin(amount, denom)})
+
+    return recipients
+
 def main():
     
     # Check if there is a new version we should be using
     check_version()
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch', default=None, help='A CSV or YAML file of addresses and amounts to send to')
+
+    args = parser.parse_args()
+
     # Get the user wallets
     wallets           = UserWallets()
     user_wallets:dict = wallets.loadUserWallets()
@@ -148,6 +264,11 @@ def main():
         print (" 🛑 This password couldn't decrypt any wallets. Make sure it is correct, or rebuild the wallet list by running the configure_user_wallet.py script again.\n")
         exit()
 
+    if args.batch is not None:
+        batch_send(wallet, args.batch)
+        print (' 💯 Done!\n')
+        exit()
+
     denom, answer, null_value = wallet.getCoinSelection(f"Select a coin number 1 - {str(len(FULL_COIN_LOOKUP))} that you want to send, 'X' to continue, or 'Q' to quit: ", wallet.balances)
 
     if answer == USER_ACTION_QUIT:
@@ -209,6 +330,48 @@ def main():
 
     print (' 💯 Done!\n')
 
+def show_batch_recipients(wallet:UserWallet, recipients:list):
+    """
+    Show a table of the recipients, their amounts, and the result if they've been sent.
+
+    @params:
+        - wallet: the sending wallet, so we can format the amounts
+        - recipients: the list from load_batch_recipients or batch_send_transaction
+
+    @return: None
+    """
+
+    label_widths:list = [len('Address'), len('Amount'), len('Status'), len('Details')]
+    rows:list         = []
+
+    for recipient in recipients:
+        coin:Coin = recipient['coin']
+        details   = recipient.get('tx_hash', '')
+        if recipient.get('message', '') != '':
+            details = recipient['message']
+
+        row:list = [recipient['address'], f"{wallet.formatUluna(coin.amount, coin.denom)} {FULL_COIN_LOOKUP[coin.denom]}", recipient.get('status', ''), details]
+        rows.append(row)
+
+        for index in range(len(row)):
+            if len(row[index]) > label_widths[index]:
+                label_widths[index] = len(row[index])
+
+    # Generic string we use for padding purposes
+    padding_str:str   = ' ' * 200
+    header_string:str = ' ' + ' | '.join([label + padding_str[0:label_widths[index] - len(label)] for index, label in enumerate(['Address', 'Amount', 'Status', 'Details'])])
+
+    horizontal_spacer:str = '-' * len(header_string)
+
+    print ('\n' + horizontal_spacer)
+    print (header_string)
+    print (horizontal_spacer)
+
+    for row in rows:
+        print (' ' + ' | '.join([row[index] + padding_str[0:label_widths[index] - len(row[index])] for index in range(len(row))]))
+
+    print (horizontal_spacer + '\n')
+
 if __name__ == "__main__":
     """ This is executed when run from the command line """
     main()
\ No newline at end of file
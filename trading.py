@@ -1,4 +1,3 @@
-
 #!/usr/bin/python
 
 import sqlite3
@@ -6,9 +5,13 @@ import json
 import time
 
 from constants.constants import (
-    DB_FILE_NAME
+    TRADING_COINS,
+    TRADING_FAST_POLL_INTERVAL,
+    TRADING_POLL_INTERVAL,
+    TRADING_PROXIMITY
 )
 
+from classes.database import database_transaction, get_cursor
 from classes.wallet import UserWallet
 from classes.wallets import UserWallets
 
@@ -17,119 +20,306 @@ from classes.transaction_core import TransactionResult
 
 from terra_classic_sdk.core.coin import Coin
 
-def main():
-    conn = sqlite3.connect(DB_FILE_NAME)
-    conn.row_factory = sqlite3.Row
-    print ("Opened database successfully")
+class TradeWatcher():
+    """
+    Watch the open trades and close them when they hit their profit target.
+
+    Open trades are grouped by pair, so each tick only needs one price quote per pair,
+    no matter how many trades are open. The quote objects are created once and reused.
+    The exit prices are stored (and indexed) in the trades table, so only triggered trades are loaded.
+    """
+
+    def __init__(self):
+        self.cursor:sqlite3.Cursor = None
+        self.data_version:int      = None
+        self.pairs:dict            = {}
+        self.quotes:dict           = {}
+        self.user_wallets:dict     = {}
+
+    def create(self, user_wallets:dict):
+        """
+        Open the database and load the open pairs.
+
+        @params:
+            - user_wallets: the wallets that the trades can be applied to
+
+        @return: self
+        """
+
+        # The connection is shared, so the rows are only returned by name on this cursor
+        self.cursor             = get_cursor()
+        self.cursor.row_factory = sqlite3.Row
+        self.user_wallets       = user_wallets
+
+        self.loadPairs()
+
+        return self
+
+    def closeTrade(self, wallet:UserWallet, open_trade:sqlite3.Row) -> bool:
+        """
+        Swap the coins in this trade back into the original coin, and mark both trades as closed.
+
+        @params:
+            - wallet: the wallet this trade belongs to
+            - open_trade: the database row for this trade
+
+        @return: True if the swap succeeded
+        """
+
+        update_trade:str = "UPDATE trades SET linked_trade_id=?, status=? WHERE ID=?;"
+
+        log_trade_params:dict = {}
+        log_trade_params['exit_profit'] = open_trade['exit_profit']
+        log_trade_params['exit_loss']   = open_trade['exit_loss']
+
+        wallet.getBalances()
+
+        swap_coin:Coin                       = Coin(open_trade['coin_to'], open_trade['amount_to'])
+        transaction_result:TransactionResult = swap_coins(wallet, swap_coin, open_trade['coin_from'], 0, True, True, log_trade_params)
+
+        trade_id:int = transaction_result.trade_id
+
+        if transaction_result.is_error == False and trade_id > 0:
+            # Update the original trade row with this ID, and mark it as being closed
+            with database_transaction() as cursor:
+                cursor.execute(update_trade, [open_trade['ID'], 'CLOSED', trade_id])
+                cursor.execute(update_trade, [trade_id, 'CLOSED', open_trade['ID']])
+
+            # Our own changes don't show up in the data version, so force a reload on the next tick
+            self.data_version = None
+
+        transaction_result.showResults()
+
+        return not transaction_result.is_error
+
+    def hasChanged(self) -> bool:
+        """
+        Check if another process (like a swap with 'log trade') has changed the database since we last looked.
+
+        @params:
+            - None
+
+        @return: True if the trades need to be reloaded
+        """
+
+        data_version:int = self.cursor.execute('PRAGMA data_version;').fetchone()[0]
+
+        return data_version != self.data_version
+
+    def loadPairs(self) -> dict:
+        """
+        Get a summary of the open trades, grouped by pair.
+        A pair is the wallet chain, plus the coin we're holding and the coin we want back.
+        Only trades holding one of the TRADING_COINS are included, unless that list is empty.
+        We only need the lowest profit price and the highest loss price for each pair - the trades themselves are loaded when one of these is crossed.
+
+        @params:
+            - None
+
+        @return: a dictionary of pairs, with the exit prices, trade count and wallet names
+        """
+
+        # The chain comes from the wallet, so the database can only group by wallet
+        get_open_pairs:str = "SELECT wallet_name, coin_to, coin_from, MIN(exit_profit_price), MAX(exit_loss_price), COUNT(ID) FROM trades WHERE status = 'OPEN' GROUP BY wallet_name, coin_to, coin_from;"
+
+        self.data_version = self.cursor.execute('PRAGMA data_version;').fetchone()[0]
+        self.pairs        = {}
+
+        for open_pair in self.cursor.execute(get_open_pairs).fetchall():
+            if open_pair[0] not in self.user_wallets:
+                continue
+
+            if len(TRADING_COINS) > 0 and open_pair[1] not in TRADING_COINS:
+                continue
+
+            pair:tuple = (self.user_wallets[open_pair[0]].denom, open_pair[1], open_pair[2])
+
+            if pair not in self.pairs:
+                self.pairs[pair] = {'exit_profit_price': None, 'exit_loss_price': None, 'trade_count': 0, 'wallet_names': []}
+
+            summary:dict = self.pairs[pair]
+            if open_pair[3] is not None and (summary['exit_profit_price'] is None or open_pair[3] < summary['exit_profit_price']):
+                summary['exit_profit_price'] = open_pair[3]
+            if open_pair[4] is not None and (summary['exit_loss_price'] is None or open_pair[4] > summary['exit_loss_price']):
+                summary['exit_loss_price'] = open_pair[4]
+
+            summary['trade_count'] += open_pair[5]
+            summary['wallet_names'].append(open_pair[0])
+
+        return self.pairs
+
+    def triggeredTrades(self, pair:tuple, unit_price:float) -> list:
+        """
+        Get the open trades in this pair that have crossed an exit price.
+
+        @params:
+            - pair: the wallet chain, the coin we're holding, and the coin we want back
+            - unit_price: the current price of one unit of the coin we're holding
+
+        @return: a list of database rows
+        """
+
+        # Only the wallets on this chain belong to this pair
+        wallet_names:list = self.pairs[pair]['wallet_names']
+        placeholders:str  = ','.join(['?'] * len(wallet_names))
 
-    get_open_trades = "SELECT ID, date_added, wallet_name, coin_from, amount_from, price_from, coin_to, amount_to, price_to, fees, exit_profit, exit_loss FROM trades WHERE status = 'OPEN' and coin_to='urakoff';"
-    update_trade = "UPDATE trades SET linked_trade_id=?, status=? WHERE ID=?;"
+        get_profit_trades:str = f"SELECT ID, date_added, wallet_name, coin_from, amount_from, price_from, coin_to, amount_to, price_to, fees, exit_profit, exit_loss, exit_profit_price, exit_loss_price FROM trades WHERE status = 'OPEN' AND coin_to = ? AND coin_from = ? AND exit_profit_price <= ? AND wallet_name IN ({placeholders});"
+        get_loss_trades:str   = f"SELECT ID, date_added, wallet_name, coin_from, amount_from, price_from, coin_to, amount_to, price_to, fees, exit_profit, exit_loss, exit_profit_price, exit_loss_price FROM trades WHERE status = 'OPEN' AND coin_to = ? AND coin_from = ? AND exit_loss_price >= ? AND wallet_name IN ({placeholders});"
+
+        result:list = []
+        if self.pairs[pair]['exit_profit_price'] is not None and unit_price >= self.pairs[pair]['exit_profit_price']:
+            result += self.cursor.execute(get_profit_trades, [pair[1], pair[2], unit_price] + wallet_names).fetchall()
+
+        if self.pairs[pair]['exit_loss_price'] is not None and unit_price <= self.pairs[pair]['exit_loss_price']:
+            result += self.cursor.execute(get_loss_trades, [pair[1], pair[2], unit_price] + wallet_names).fetchall()
+
+        return result
+
+    def pairPrice(self, pair:tuple) -> float:
+        """
+        Get the value of one unit of the coin we're holding, in the coin we want back.
+        The swap object for each pair is created once and reused on every tick.
+
+        @params:
+            - pair: the wallet chain, the coin we're holding, and the coin we want back
+
+        @return: the unit price, or None if it couldn't be retrieved
+        """
+
+        wallet_denom, swap_denom, swap_request_denom = pair
+
+        if pair not in self.quotes:
+            # Any wallet on this chain will do, we're only asking for prices
+            wallet:UserWallet = self.user_wallets[self.pairs[pair]['wallet_names'][0]]
+
+            swap_tx:SwapTransaction = SwapTransaction().create(wallet.seed, wallet_denom)
+            if swap_tx == False:
+                return None
+
+            swap_tx.swap_amount        = 1
+            swap_tx.swap_denom         = swap_denom
+            swap_tx.swap_request_denom = swap_request_denom
+            swap_tx.wallet_denom       = wallet_denom
+            swap_tx.setContract()
+
+            self.quotes[pair] = swap_tx
+
+        return self.quotes[pair].swapRate()
+
+    def tradeValue(self, wallet:UserWallet, open_trade:sqlite3.Row) -> float:
+        """
+        Get the value of the whole trade, in the coin we want back.
+        Unlike the unit price, this includes the spread and price impact of selling the full amount.
+
+        @params:
+            - wallet: the wallet this trade belongs to
+            - open_trade: the database row for this trade
+
+        @return: the estimated value, or None if it couldn't be retrieved
+        """
+
+        swap_tx:SwapTransaction = SwapTransaction().create(wallet.seed, wallet.denom)
+        if swap_tx == False:
+            return None
+
+        swap_tx.swap_amount        = float(wallet.formatUluna(open_trade['amount_to'], open_trade['coin_to'], False))
+        swap_tx.swap_denom         = open_trade['coin_to']
+        swap_tx.swap_request_denom = open_trade['coin_from']
+        swap_tx.wallet_denom       = wallet.denom
+        swap_tx.setContract()
+
+        return swap_tx.swapRate()
+
+    def tick(self) -> bool:
+        """
+        Get one price per pair, and close the trades that have crossed an exit price.
+
+        @params:
+            - None
+
+        @return: True if any pair is close to an exit price, so we should check again sooner
+        """
+
+        is_close:bool = False
+
+        if self.hasChanged():
+            self.loadPairs()
+
+        for pair in list(self.pairs.keys()):
+            unit_price:float = self.pairPrice(pair)
+
+            if unit_price is None:
+                print (f' 🛎️  No price could be retrieved for {pair[1]} -> {pair[2]}, skipping {self.pairs[pair]["trade_count"]} trades.')
+                continue
+
+            for open_trade in self.triggeredTrades(pair, unit_price):
+                if open_trade['wallet_name'] not in self.user_wallets:
+                    continue
+
+                wallet:UserWallet = self.user_wallets[open_trade['wallet_name']]
+                amount_to:float   = float(wallet.formatUluna(open_trade['amount_to'], open_trade['coin_to']))
+
+                # Not including swap fees, this is what the trade is worth right now
+                estimated_value:float = unit_price * amount_to
+
+                if unit_price >= open_trade['exit_profit_price']:
+                    # The unit price is only a filter - check what the full amount would actually sell for
+                    estimated_value    = self.tradeValue(wallet, open_trade)
+                    target_value:float = open_trade['exit_profit_price'] * amount_to
+
+                    if estimated_value is None:
+                        print (f" 🛎️  No price could be retrieved for the full amount of database row id {open_trade['ID']}, skipping it.")
+                        continue
+
+                    if estimated_value < target_value:
+                        print (f"Wallet: {open_trade['wallet_name']} (database row id {open_trade['ID']}) has reached the profit target price, but the full amount is only worth {estimated_value} (the target is {target_value})")
+                        continue
+
+                    incoming_fees = json.loads(open_trade['fees'])['LUNC']
+
+                    print (f"Wallet: {open_trade['wallet_name']} (database row id {open_trade['ID']})\n")
+                    print (f"You purchased {wallet.formatUluna(open_trade['amount_to'], open_trade['coin_to'], True)} with {wallet.formatUluna(open_trade['amount_from'], open_trade['coin_from'], True)}")
+                    print (f'This is now worth {estimated_value}, and the profit target price of {open_trade["exit_profit_price"]} has been reached')
+                    print (f'Swap fees are expected to be {float(incoming_fees) * 2}')
+                    print ('WE NEED TO SELL FOR A PROFIT')
+
+                    self.closeTrade(wallet, open_trade)
+                else:
+                    # Selling at a loss is not enabled yet
+                    print (f"Wallet: {open_trade['wallet_name']} (database row id {open_trade['ID']}) has reached the loss target price of {open_trade['exit_loss_price']} - it is now worth {estimated_value}")
+
+            exit_profit_price:float = self.pairs[pair]['exit_profit_price']
+            exit_loss_price:float   = self.pairs[pair]['exit_loss_price']
+            if exit_profit_price is not None and unit_price >= exit_profit_price * (1 - TRADING_PROXIMITY):
+                is_close = True
+            if exit_loss_price is not None and unit_price <= exit_loss_price * (1 + TRADING_PROXIMITY):
+                is_close = True
+
+        return is_close
+
+def main():
 
     wallets = UserWallets()
-    user_wallets = wallets.loadUserWallets()
+    user_wallets = wallets.loadUserWallets(get_balances = False)
+
+    watcher:TradeWatcher = TradeWatcher().create(user_wallets)
+    print ("Opened database successfully")
 
     while True:
-        cursor = conn.cursor()
-        cursor = conn.execute(get_open_trades)
-        
-        for open_trades_row in cursor.fetchall():
-            
-            wallet:UserWallet = None
-            if open_trades_row['wallet_name'] in user_wallets:
-                wallet = user_wallets[open_trades_row['wallet_name']]
-            
-            if wallet is not None:
-
-                #print (open_trades_row['exit_profit'])
-
-                original_trade_id:int = open_trades_row['ID']
-
-                print ('*************')
-
-                #print (open_trades_row)
-                # for x in open_trades_row.keys():
-                #    print (x, open_trades_row[x])
-
-                
-                print (f"Wallet: {open_trades_row['wallet_name']} (database row id {original_trade_id})\n")
-                print (f"You purchased {wallet.formatUluna(open_trades_row['amount_to'], open_trades_row['coin_to'], True)} with {wallet.formatUluna(open_trades_row['amount_from'], open_trades_row['coin_from'], True)}")
-
-                incoming_fees = json.loads(open_trades_row['fees'])['LUNC']
-                
-                # Set up the swap details
-                swap_tx = SwapTransaction().create(wallet.seed, wallet.denom)
-
-                if swap_tx != False:
-                    swap_tx.swap_amount        = float(wallet.formatUluna(open_trades_row['amount_to'], open_trades_row['coin_to'], False))
-                    swap_tx.swap_denom         = open_trades_row['coin_to']
-                    swap_tx.swap_request_denom = open_trades_row['coin_from']
-                    swap_tx.wallet_denom       = wallet.denom
-
-                    log_trade_params:dict = {}
-                    log_trade_params['exit_profit'] = open_trades_row['exit_profit']
-                    log_trade_params['exit_loss'] = open_trades_row['exit_loss']
-
-                    # Change the contract depending on what we're doing
-                    swap_tx.setContract()
-                    
-                    estimated_value:float = swap_tx.swapRate()
-                    
-                    if estimated_value is not None:
-                        profit_target_value =  float(wallet.formatUluna(open_trades_row['amount_from'], open_trades_row['coin_from'])) + float(wallet.formatUluna(open_trades_row['amount_from'] * open_trades_row['exit_profit'], open_trades_row['coin_from']))
-                        loss_target_value = float(wallet.formatUluna(open_trades_row['amount_from'], open_trades_row['coin_from'])) + float(wallet.formatUluna(open_trades_row['amount_from'] * open_trades_row['exit_loss'], open_trades_row['coin_from']))
-
-                        print (f'Not including swap fees, this is now worth {estimated_value}')
-                        print ('---')
-                        print (f'This will be automatically sold at a profit when it is at {profit_target_value}')
-                        print (f'This will be automatically sold at a loss when it is at {loss_target_value}')
-
-                        print (f'Swap fees are expected to be {float(incoming_fees) * 2}')
-
-                        # Get the current decision:
-                        swap_coin:Coin = Coin(open_trades_row['coin_to'], open_trades_row['amount_to'])
-
-                        if estimated_value >= profit_target_value:
-                            print ('WE NEED TO SELL FOR A PROFIT')
-                            
-                            wallet.getBalances()
-
-                            #print ('swap coin:', swap_coin)
-                            #print (open_trades_row['coin_from'])
-                            transaction_result:TransactionResult = swap_coins(wallet, swap_coin, open_trades_row['coin_from'], 0, True, True, log_trade_params)
-
-                            trade_id:int = transaction_result.trade_id
-
-                            #print ('closing trade id:', trade_id)
-                            # Update the original trade row with this ID, and mark it as being closed
-                            conn.execute(update_trade, [original_trade_id, 'CLOSED', trade_id])
-                            conn.execute(update_trade, [trade_id, 'CLOSED', original_trade_id])
-                            conn.commit()
-
-                            transaction_result.showResults()
-                            
-                        elif estimated_value <= loss_target_value:
-                            print ('WE NEED TO SELL AT A LOSS')
-
-                            # transaction_result:TransactionResult = swap_coins(wallet, swap_coin, open_trades_row['coin_from'], '', False, True)
-
-                            # trade_id:int = transaction_result.trade_id
-
-                            # # Update the original trade row with this ID, and mark it as being closed
-                            # conn.execute(update_trade, [trade_id, original_trade_id])
-                            # conn.commit()
-                            
-                            # transaction_result.showResults()
-
-                        else:
-                            print ('do nothing, keep waiting')
-
-                print ('')
-        #conn.close()
-
-        print ('Finished this round!')
-
-        time.sleep(60)
-        
+        is_close:bool = watcher.tick()
+
+        print (f"Finished this round! Watching {sum(open_pair['trade_count'] for open_pair in watcher.pairs.values())} trades in {len(watcher.pairs)} pairs.")
+
+        # Check more often if a price is close to an exit threshold.
+        # Otherwise, wake up early if a new trade has been added.
+        if is_close == True:
+            time.sleep(TRADING_FAST_POLL_INTERVAL)
+        else:
+            waited:int = 0
+            while waited < TRADING_POLL_INTERVAL and watcher.hasChanged() == False:
+                time.sleep(TRADING_FAST_POLL_INTERVAL)
+                waited += TRADING_FAST_POLL_INTERVAL
+
 if __name__ == "__main__":
     """ This is executed when run from the command line """
-    main()
\ No newline at end of file
+    main()
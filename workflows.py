@@ -2,38 +2,39 @@
 # -*- coding: UTF-8 -*-
 
 import argparse
+import time
 import yaml
 
 from datetime import datetime
 from enum import Enum
-from os.path import exists
+from os.path import exists, getmtime
 
 from classes.common import (
     check_database,
     check_version,
     get_precision,
     is_percentage,
-    strtobool
+    strtobool,
+    to_decimal,
+    to_raw_amount
 )
 
 from constants.constants import (
+    COIN_DENOM_LOOKUP,
     FULL_COIN_LOOKUP,
     OUTPUT_ERROR,
     OUTPUT_USER,
     ULUNA,
     WITHDRAWAL_REMAINDER,
+    WORKFLOW_DAEMON_INTERVAL,
+    WORKFLOW_DAEMON_TICK,
     WORKFLOWS_FILE_NAME,
 )
 
-from classes.delegation_transaction import delegate_to_validator, switch_validator, undelegate_from_validator
-from classes.liquidity_transaction import LiquidityTransaction, join_liquidity_pool, exit_liquidity_pool
-from classes.send_transaction import send_transaction
-from classes.swap_transaction import swap_coins
-from classes.transaction_core import TransactionResult
-from classes.validators import Validators
+from classes.instrumentation import install_request_timings, save_request_metrics, show_request_timings
+from classes.scheduler import WorkflowScheduler, parse_clock
 from classes.wallet import UserWallet
 from classes.wallets import UserWallets
-from classes.withdrawal_transaction import claim_delegation_rewards
 
 from terra_classic_sdk.core.coin import Coin    
 
@@ -65,7 +66,7 @@ def check_amount(amount:str, balances:dict, preserve_minimum:bool = False) -> li
     # Get the denom.
     if len(amount_bits) >= 2:
         # @TODO: conjoine everything after the first list item so we can support token names with spaces
-        coin_denom:str = list(FULL_COIN_LOOKUP.keys())[list(FULL_COIN_LOOKUP.values()).index(amount_bits[1])]
+        coin_denom:str = COIN_DENOM_LOOKUP[amount_bits[1]]
     else:
         # If it's a single item list, then assume it's something like '100%' and then denom is ULUNA
         coin_denom:str = ULUNA
@@ -73,18 +74,17 @@ def check_amount(amount:str, balances:dict, preserve_minimum:bool = False) -> li
     if coin_denom in balances:
         # Adjust the available balance depending on requirements
         if preserve_minimum == True and coin_denom == ULUNA:
-            available_balance:int = int(int(balances[coin_denom]) - (WITHDRAWAL_REMAINDER * (10 ** get_precision(coin_denom))))
+            available_balance:int = int(balances[coin_denom]) - to_raw_amount(WITHDRAWAL_REMAINDER, coin_denom)
         else:
             available_balance:int = int(balances[coin_denom])
 
         if available_balance > 0:
 
             if amount_bits[0].replace('.', '').isnumeric():
-                coin_amount:int = int(float(amount_bits[0]) * (10 ** get_precision(coin_denom)))
+                coin_amount:int = to_raw_amount(amount_bits[0], coin_denom)
             
             elif is_percentage(amount_bits[0]):
-                amount:float      = float(amount_bits[0][0:-1]) / 100
-                coin_amount:int   = int(float(available_balance * amount))
+                coin_amount:int = int(available_balance * to_decimal(amount_bits[0][0:-1]) / 100)
 
             if coin_amount > available_balance:
                 amount_ok = False
@@ -97,7 +97,7 @@ def check_amount(amount:str, balances:dict, preserve_minimum:bool = False) -> li
 
     return amount_ok, coin_result
 
-def check_trigger(triggers:list, balances:dict) -> bool:
+def check_trigger(triggers:list, balances:dict, current_time:datetime = None) -> bool:
     """
     Check the 'when' clause. 
     If it's got a balance check, then compare the requirements against the wallet.
@@ -106,10 +106,14 @@ def check_trigger(triggers:list, balances:dict) -> bool:
     @params:
       - triggers: a list of triggers, which are simple equations to check with. All of them must be true to proceed
       - balances: a dictionary of coins. This can be from the wallet.balances list, or the validator withdrawals
+      - current_time: the time that day/time triggers are checked against. The daemon passes the scheduled time. Defaults to now.
 
     @return true/false, this step can proceed
     """
 
+    if current_time is None:
+        current_time = datetime.now()
+
     # Check the trigger
     is_triggered:bool = True
 
@@ -125,8 +129,8 @@ def check_trigger(triggers:list, balances:dict) -> bool:
             requirement:str = str(trigger_bits[2])
 
             # Get this coin's technical name (ie, uluna)
-            if condition in FULL_COIN_LOOKUP.values():
-                coin_denom:str = list(FULL_COIN_LOOKUP.keys())[list(FULL_COIN_LOOKUP.values()).index(condition)]
+            if condition in COIN_DENOM_LOOKUP:
+                coin_denom:str = COIN_DENOM_LOOKUP[condition]
                 if coin_denom.lower() in balances:
                     coin_balance:float = int(balances[coin_denom]) / (10 ** get_precision(coin_denom))
                     eval_string:str    = f'{coin_balance}{comparison}{requirement}'
@@ -137,27 +141,19 @@ def check_trigger(triggers:list, balances:dict) -> bool:
                         is_triggered = False
             elif condition.lower() == 'day':
                 # Check for days
-                dt = datetime.now()
-                
-                current_day:str = dt.strftime('%A')
+                current_day:str = current_time.strftime('%A')
                 if requirement.lower() != current_day.lower():
                     is_triggered = False
             elif condition.lower() == 'time':
-                # Check the time requirement
-                time_bits:list = requirement.split(':')
-                if len(time_bits) == 1:
-                    # Hour only
-                    hour:str = datetime.today().strftime("%I%p").lower().lstrip('0')
-                    if hour != requirement.lower():
-                        is_triggered = False
-                    
-                elif len(time_bits) == 2:
-                    hourMinute:str = datetime.today().strftime("%I:%M%p").lower()
-                    if hourMinute != requirement.lower():
-                        is_triggered = False
-                else:
+                # Check the time requirement. If only the hour is provided, then any minute in that hour will match
+                hour, minute = parse_clock(requirement)
+                if hour is None:
                     # Not a time format we recognise
                     is_triggered = False
+                elif hour != current_time.hour:
+                    is_triggered = False
+                elif minute is not None and minute != current_time.minute:
+                    is_triggered = False
             else:
                 # denom not in balances
                 is_triggered = False
@@ -326,8 +322,117 @@ def output(msg:str, silent:bool, type:int = OUTPUT_USER) -> bool:
 
     return False
 
+def load_workflows(file_name:str) -> dict:
+    """
+    Open the workflows file and return the contents.
+
+    @params:
+        - file_name: the path to the workflows file
+
+    @return: the workflows dictionary, or None if the file is missing or invalid
+    """
+
+    if exists(file_name) == False:
+        print (f'\n 🛑 The {file_name} file does not exist - you can use the default user_workflow.yml file if necessary.\n')
+        return None
+
+    # Now open this file and get the contents
+    user_workflows:dict = None
+    try:
+        with open(file_name, 'r') as file:
+            user_workflows = yaml.safe_load(file)
+    except:
+        print (f'\n 🛑 The {file_name} file could not be opened - please check the workflow documentation and review it for syntax errors.\n')
+        return None
+
+    if user_workflows is None or 'workflows' not in user_workflows:
+        print (f'\n 🛑 The {file_name} file does not contain any workflows - please check the workflow documentation.\n')
+        return None
+
+    return user_workflows
+
+def attach_wallets(workflows:list, user_wallets:dict) -> list:
+    """
+    Go through each workflow and attach the wallets that they match.
+
+    @params:
+        - workflows: the list of workflows from the workflows file
+        - user_wallets: the wallets that were decrypted from the user config file
+
+    @return: the same list of workflows, with a 'user_wallets' list on each one
+    """
+
+    for workflow in workflows:
+        workflow['user_wallets'] = []   
+        # Take each wallet in the user config list... 
+        for wallet in user_wallets:
+            # If this wallet name or address matches what the workflow has asked for, then add it
+            for workflow_wallet in workflow['wallets']:
+                if workflow_wallet.lower() == user_wallets[wallet].name.lower() or workflow_wallet.lower() == user_wallets[wallet].address.lower():
+                    workflow['user_wallets'].append(user_wallets[wallet])
+
+    return workflows
+
+def run_daemon(file_name:str, user_workflows:dict, user_wallets:dict, logs:Log, silent_mode:bool, interval:int) -> None:
+    """
+    Keep running, and complete each workflow when the scheduler says it is due.
+    The wallets are only loaded once, and the workflows file is reloaded if it changes.
+
+    @params:
+        - file_name: the path to the workflows file
+        - user_workflows: the contents of the workflows file
+        - user_wallets: the wallets that were decrypted from the user config file
+        - logs: the log object
+        - silent_mode: if True, only errors will be shown
+        - interval: how often (in minutes) workflows without a day/time trigger are run
+
+    @return: None
+    """
+
+    last_modified:float          = getmtime(file_name)
+    scheduler:WorkflowScheduler  = WorkflowScheduler().create(user_workflows['workflows'], interval)
+
+    print (f' 🕐 Workflow daemon started - workflows without a day/time trigger will run every {interval} minutes.')
+
+    try:
+        while True:
+            # Reload the workflows if the file has been changed
+            if exists(file_name) and getmtime(file_name) != last_modified:
+                last_modified = getmtime(file_name)
+                updated_workflows:dict = load_workflows(file_name)
+                if updated_workflows is not None:
+                    print (f' 🗄  {file_name} has changed, reloading the workflows.')
+                    user_workflows = updated_workflows
+                    attach_wallets(user_workflows['workflows'], user_wallets)
+                    scheduler = WorkflowScheduler().create(user_workflows['workflows'], interval)
+                else:
+                    print (' 🛎️  Continuing with the previous version of the workflows.')
+
+            for workflow, fire_time in scheduler.dueWorkflows():
+                # One failed workflow (or an exit() inside a transaction) shouldn't stop every other scheduled workflow
+                try:
+                    run_workflows([workflow], user_wallets, logs, silent_mode, fire_time)
+                except (Exception, SystemExit) as err:
+                    logs.error(f" ❗ The '{workflow.get('name', '')}' workflow failed: {err!r}")
+
+                save_request_metrics()
+
+            # Sleep until the next scheduled run, but wake up regularly to check for changes
+            next_runs:list = [next_run for next_run in scheduler.next_runs.values() if next_run is not None]
+            sleep_time:float = WORKFLOW_DAEMON_TICK
+            if len(next_runs) > 0:
+                sleep_time = min(sleep_time, max((min(next_runs) - datetime.now()).total_seconds(), 1))
+
+            time.sleep(sleep_time)
+
+    except KeyboardInterrupt:
+        print ('\n 🛑 Workflow daemon stopped.\n')
+
 def main():
     
+    # Record every LCD and HTTP request so we can show where the time went
+    install_request_timings()
+
     # Check if there is a new version we should be using
     check_version()
     check_database()
@@ -335,29 +440,29 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--workflow', default=WORKFLOWS_FILE_NAME)
     parser.add_argument('--silent', default=False)
+    parser.add_argument('--daemon', default=False)
+    parser.add_argument('--interval', default=WORKFLOW_DAEMON_INTERVAL, type=int)
 
     args = parser.parse_args()
 
     silent_mode:bool = False
+    daemon_mode:bool = False
     
     if args.silent != False:
         if args.silent.lower() == 'true':
             print ('These workflows will be run in silent mode - only errors will be shown.')
             silent_mode = True
 
-    file_exists = exists(args.workflow)
-    if file_exists:
-        # Now open this file and get the contents
-        user_workflows:dict = {}
-        try:
-            with open(args.workflow, 'r') as file:
-                user_workflows = yaml.safe_load(file)
-
-        except:
-               print (f'\n 🛑 The {args.workflow} file could not be opened - please check the workflow documentation and review it for syntax errors.\n')
-               exit()
-    else:
-        print (f'\n 🛑 The {args.workflow} file does not exist - you can use the default user_workflow.yml file if necessary.\n')
+    if args.daemon != False:
+        if args.daemon.lower() == 'true':
+            daemon_mode = True
+
+    if args.interval < 1:
+        print ('\n 🛑 The interval must be at least 1 minute.\n')
+        exit()
+
+    user_workflows:dict = load_workflows(args.workflow)
+    if user_workflows is None:
         exit()
     
     # Get the user wallets. We'll be getting the balances futher on down.
@@ -372,17 +477,43 @@ def main():
     logs.silentMode = silent_mode
 
     # Go through each workflow and attach the wallets that they match
-    for workflow in user_workflows['workflows']:
-        workflow['user_wallets'] = []   
-        # Take each wallet in the user config list... 
-        for wallet in user_wallets:
-            # If this wallet name or address matches what the workflow has asked for, then add it
-            for workflow_wallet in workflow['wallets']:
-                if workflow_wallet.lower() == user_wallets[wallet].name.lower() or workflow_wallet.lower() == user_wallets[wallet].address.lower():
-                    workflow['user_wallets'].append(user_wallets[wallet])
-            
+    attach_wallets(user_workflows['workflows'], user_wallets)
+
+    if daemon_mode == True:
+        run_daemon(args.workflow, user_workflows, user_wallets, logs, silent_mode, args.interval)
+    else:
+        run_workflows(user_workflows['workflows'], user_wallets, logs, silent_mode)
+
+    show_request_timings()
+
+def run_workflows(workflows:list, user_wallets:dict, logs:Log, silent_mode:bool, run_time:datetime = None) -> None:
+    """
+    Go through each workflow and run the steps for every attached wallet.
+
+    @params:
+        - workflows: the list of workflows to run, with the 'user_wallets' list already attached
+        - user_wallets: the wallets that were decrypted from the user config file
+        - logs: the log object
+        - silent_mode: if True, only errors will be shown
+        - run_time: the time that day/time triggers are checked against. Defaults to now.
+
+    @return: None
+    """
+
+    # The transaction modules are only loaded when a workflow actually runs, so cron jobs and the daemon start quickly
+    from classes.delegation_transaction import delegate_to_validator, switch_validator, undelegate_from_validator
+    from classes.liquidity_transaction import LiquidityTransaction, join_liquidity_pool, exit_liquidity_pool
+    from classes.send_transaction import send_transaction
+    from classes.swap_transaction import swap_coins
+    from classes.transaction_core import TransactionResult
+    from classes.validators import Validators
+    from classes.withdrawal_transaction import claim_delegation_rewards
+
+    if run_time is None:
+        run_time = datetime.now()
+
     # Now go through each workflow and run the steps
-    for workflow in user_workflows['workflows']:
+    for workflow in workflows:
 
         # Only proceed if we have a wallet attached to this workflow:
         if 'user_wallets' in workflow:
@@ -445,7 +576,7 @@ def main():
 
                                     # Check that the 'when' clause is triggered
                                     # We will pass a dictionary of the validator LUNC rewards that we are expecting
-                                    is_triggered:bool = check_trigger(step['when'], {ULUNA: uluna_reward})
+                                    is_triggered:bool = check_trigger(step['when'], {ULUNA: uluna_reward}, run_time)
 
                                     if is_triggered == True:
                                         logs.message(f"  ➜ Withdrawing {wallet.formatUluna(uluna_reward, ULUNA, False)} rewards from {delegations[validator]['validator_name']}.")
@@ -484,7 +615,7 @@ def main():
                             delegations:dict = wallet.delegations
 
                             for validator in validator_withdrawals:
-                                is_triggered = check_trigger(step['when'], validator_withdrawals[validator]['balances'])
+                                is_triggered = check_trigger(step['when'], validator_withdrawals[validator]['balances'], run_time)
                                     
                                 if is_triggered == True:
                                     # We will redelegate an amount based on the 'amount' value, calculated from the returned rewards
@@ -525,7 +656,7 @@ def main():
                             if step_wallet is not None:
                                 step_wallet.getBalances()
 
-                                is_triggered = check_trigger(step['when'], step_wallet.balances)
+                                is_triggered = check_trigger(step['when'], step_wallet.balances, run_time)
                                         
                                 if is_triggered == True:
                                     # We will delegate a specific amount of LUNC from the wallet balance
@@ -587,7 +718,7 @@ def main():
                                 step_wallet.getBalances()
 
                                 if 'when' in step:
-                                    is_triggered = check_trigger(step['when'], step_wallet.balances)
+                                    is_triggered = check_trigger(step['when'], step_wallet.balances, run_time)
                                 else:
                                     logs.error(" ❗ No when clause included, defaulting to 'always'.")
                                     is_triggered = True
@@ -651,7 +782,7 @@ def main():
                             if step_wallet is not None:
                                 step_wallet.getBalances()
 
-                                is_triggered = check_trigger(step['when'], step_wallet.balances)
+                                is_triggered = check_trigger(step['when'], step_wallet.balances, run_time)
                                         
                                 if is_triggered == True:
 
@@ -664,7 +795,7 @@ def main():
                                     if amount_ok == True:
 
                                         if 'swap to' in step:
-                                            swap_to_denom:str = list(FULL_COIN_LOOKUP.keys())[list(FULL_COIN_LOOKUP.values()).index(step['swap to'])]
+                                            swap_to_denom:str = COIN_DENOM_LOOKUP[step['swap to']]
                                             logs.message(f'  ➜ You are swapping {wallet.formatUluna(swap_coin.amount, swap_coin.denom, True)} for {FULL_COIN_LOOKUP[swap_to_denom]}.')
 
                                             transaction_result:TransactionResult = swap_coins(step_wallet, swap_coin, swap_to_denom, '', True, log_trade)
@@ -698,7 +829,7 @@ def main():
                             if step_wallet is not None:
                                 step_wallet.getBalances()
 
-                                is_triggered = check_trigger(step['when'], step_wallet.balances)
+                                is_triggered = check_trigger(step['when'], step_wallet.balances, run_time)
 
                                 if is_triggered == True:
 
@@ -775,7 +906,7 @@ def main():
 
                                 if amount_out > 0 and amount_out <= 1:
 
-                                    is_triggered = check_trigger(step['when'], pool_assets)
+                                    is_triggered = check_trigger(step['when'], pool_assets, run_time)
 
                                     if is_triggered == True:
                                         logs.message(f' ➜  You are exiting pool {pool_id} by withdrawing {amount_out * 100}%.')
@@ -819,7 +950,7 @@ def main():
 
                                     if amount_ok == True:
                                                 
-                                        is_triggered = check_trigger(step['when'], delegations)
+                                        is_triggered = check_trigger(step['when'], delegations, run_time)
 
                                         if is_triggered == True:
                                             logs.message(f" ➜  Switching {wallet.formatUluna(amount_coin.amount, amount_coin.denom, True)} from {step['old validator']} to {step['new validator']}")
@@ -864,7 +995,7 @@ def main():
 
                                 if amount_ok == True:
                                             
-                                    is_triggered = check_trigger(step['when'], delegations)
+                                    is_triggered = check_trigger(step['when'], delegations, run_time)
 
                                     if is_triggered == True:
                                         logs.message(f" ➜   This validator has a total amount of {wallet.formatUluna(wallet.delegations[step['validator']]['balance_amount'], ULUNA, True)}.")